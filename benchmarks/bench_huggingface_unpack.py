@@ -0,0 +1,94 @@
+"""Compare the preparation of a Hugging Face snapshot with the previous version.
+
+    python benchmarks/bench_huggingface_unpack.py --num_files 2000
+
+A synthetic snapshot having "--num_files" files and "--num_yamls" yaml files
+referring to all of them is created.
+"""
+
+import argparse
+from pathlib import Path
+import shutil
+import tempfile
+import timeit
+
+from espnet2.main_funcs.pack_funcs import find_path_and_change_it_recursive
+import yaml
+
+from espnet_model_zoo.downloader import ModelDownloader
+
+
+def make_snapshot(path: Path, num_files: int, num_yamls: int):
+    names = [f"exp/data/{i // 100}/{i}.npy" for i in range(num_files)]
+    for name in names:
+        (path / name).parent.mkdir(parents=True, exist_ok=True)
+        (path / name).write_bytes(b"")
+    yaml_files = {f"config{i}": f"exp/config{i}.yaml" for i in range(num_yamls)}
+    for value in yaml_files.values():
+        (path / value).write_text(yaml.safe_dump({"files": names}))
+    meta = {"files": {"model_file": names[0]}, "yaml_files": yaml_files}
+    (path / "meta.yaml").write_text(yaml.safe_dump(meta))
+
+
+def unpack_previous(cache_dir: str):
+    # The implementation of _unpack_cache_dir_for_huggingface before the index
+    meta_yaml = Path(cache_dir) / "meta.yaml"
+    flag_file = Path(cache_dir) / ".done"
+    with meta_yaml.open("r", encoding="utf-8") as f:
+        d = yaml.safe_load(f)
+        yaml_files = d["yaml_files"]
+        files = d["files"]
+
+    if not flag_file.exists():
+        for key, value in yaml_files.items():
+            yaml_file = Path(cache_dir) / value
+            with yaml_file.open("r", encoding="utf-8") as f:
+                d = yaml.safe_load(f)
+                for name in Path(cache_dir).glob("**/*"):
+                    name = name.relative_to(Path(cache_dir))
+                    d = find_path_and_change_it_recursive(
+                        d, name, str(Path(cache_dir) / name)
+                    )
+            with yaml_file.open("w", encoding="utf-8") as f:
+                yaml.safe_dump(d, f)
+        with flag_file.open("w"):
+            pass
+
+    retval = {}
+    for key, value in list(yaml_files.items()) + list(files.items()):
+        retval[key] = str(Path(cache_dir) / value)
+    return retval
+
+
+def main(cmd=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num_files", type=int, default=2000)
+    parser.add_argument("--num_yamls", type=int, default=2)
+    parser.add_argument("--number", type=int, default=100)
+    parser.add_argument(
+        "--skip_previous_first_call",
+        action="store_true",
+        help="The first call of the previous version is O(files^2 x yamls)",
+    )
+    args = parser.parse_args(cmd)
+
+    with tempfile.TemporaryDirectory() as d:
+        make_snapshot(Path(d) / "src", args.num_files, args.num_yamls)
+        for name, func in [
+            ("previous", unpack_previous),
+            ("indexed", ModelDownloader._unpack_cache_dir_for_huggingface),
+        ]:
+            cache_dir = str(Path(d) / name)
+            shutil.copytree(Path(d) / "src", cache_dir)
+            if name == "previous" and args.skip_previous_first_call:
+                (Path(cache_dir) / ".done").touch()
+            else:
+                t = timeit.default_timer()
+                func(cache_dir)
+                print(f"{name} first call: {timeit.default_timer() - t:.4f} sec")
+            t = timeit.timeit(lambda: func(cache_dir), number=args.number)
+            print(f"{name} warm call: {t / args.number * 1e3:.3f} msec")
+
+
+if __name__ == "__main__":
+    main()
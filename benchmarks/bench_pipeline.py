@@ -0,0 +1,267 @@
+"""Measure the latency of the download/unpack/cache pipeline against a local server.
+
+    python benchmarks/bench_pipeline.py --sizes 1 16 64 --output results.json
+    python benchmarks/bench_pipeline.py --baseline results.json
+
+Synthetic archives of "--sizes" MiB are served by a local HTTP server, and
+the following operations are measured:
+
+- construct: ModelDownloader() with the table loaded in the process
+- construct_cold: ModelDownloader() loading the table from the disk
+- query: ModelDownloader.query() with conditions
+- unpack: Extracting the archive from a local file
+- cold_download: download() to an empty cache directory
+- cold_download_and_unpack: download_and_unpack() to an empty cache directory
+- warm_download: download() hitting the cache
+- warm_download_and_unpack: download_and_unpack() hitting the cache
+
+The results are written in JSON by "--output". With "--baseline",
+the medians are compared with the results of a previous run, and
+the exit status is 1 if any of them is slower than the tolerance.
+"""
+
+import argparse
+from functools import partial
+from http.server import SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import io
+import json
+import os
+from pathlib import Path
+import platform
+import shutil
+import statistics
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+import warnings
+import zipfile
+
+import yaml
+
+from espnet_model_zoo import model_table
+from espnet_model_zoo.downloader import ModelDownloader
+from espnet_model_zoo.unpack import unpack
+
+# Increment if the format of the results is changed
+RESULTS_VERSION = 1
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    # Keep the connections alive as the real servers
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _model_files(size: int) -> Dict[str, bytes]:
+    meta = {
+        "files": {"asr_model_file": "exp/model.pth"},
+        "yaml_files": {"asr_train_config": "exp/config.yaml"},
+    }
+    config = {"model": "exp/model.pth", "token_list": ["a", "b"]}
+    return {
+        "meta.yaml": yaml.safe_dump(meta).encode(),
+        "exp/config.yaml": yaml.safe_dump(config).encode(),
+        "exp/model.pth": os.urandom(size),
+    }
+
+
+def make_archive(path: Path, size: int):
+    """Create an archive in the format of espnet2.main_funcs.pack_funcs.pack"""
+    files = _model_files(size)
+    if path.name.endswith(".zip"):
+        with zipfile.ZipFile(path, "w") as z:
+            for name, data in files.items():
+                z.writestr(name, data)
+    else:
+        with tarfile.open(path, "w:gz", compresslevel=1) as t:
+            for name, data in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                t.addfile(info, io.BytesIO(data))
+
+
+def measure(
+    func: Callable[[], None],
+    repeat: int,
+    number: int = 1,
+    setup: Callable[[], None] = None,
+    teardown: Callable[[], None] = None,
+) -> List[float]:
+    """Return the seconds per call of each repetition"""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - t) / number)
+        if teardown is not None:
+            teardown()
+    return times
+
+
+def summarize(times: List[float], **params) -> dict:
+    return dict(
+        params=params,
+        unit="sec",
+        times=times,
+        min=min(times),
+        median=statistics.median(times),
+        mean=statistics.mean(times),
+        stdev=statistics.stdev(times) if len(times) > 1 else 0.0,
+    )
+
+
+def run(
+    workdir: Path, sizes: List[int], formats: List[str], repeat: int, number: int
+) -> Dict[str, dict]:
+    results = {}
+    cachedir = workdir / "cache"
+    served = workdir / "served"
+    served.mkdir()
+
+    def _clear_table_cache():
+        # Emulate a new process, which loads the table from the snapshot
+        model_table._table_cache.clear()
+
+    times = measure(lambda: ModelDownloader(cachedir), repeat, number)
+    results["construct"] = summarize(times)
+    times = measure(lambda: ModelDownloader(cachedir), repeat, setup=_clear_table_cache)
+    results["construct_cold"] = summarize(times)
+
+    d = ModelDownloader(cachedir)
+    times = measure(lambda: d.query("name", task="asr", lang="en"), repeat, number)
+    results["query"] = summarize(times)
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(_Handler, directory=str(served))
+    )
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        for size in sizes:
+            for fmt in formats:
+                name = f"model_{size}MiB.{fmt}"
+                archive = served / name
+                make_archive(archive, size << 20)
+                url = f"http://127.0.0.1:{server.server_address[1]}/{name}"
+                key = f"[{fmt}-{size}MiB]"
+                params = dict(format=fmt, size_mib=size)
+
+                outdir = workdir / "unpacked"
+                times = measure(
+                    lambda: unpack(archive, outdir),
+                    repeat,
+                    teardown=lambda: shutil.rmtree(outdir),
+                )
+                results["unpack" + key] = summarize(times, **params)
+
+                for method in ["download", "download_and_unpack"]:
+                    func = getattr(ModelDownloader(cachedir), method)
+                    times = measure(
+                        lambda: func(url, quiet=True),
+                        repeat,
+                        teardown=lambda: shutil.rmtree(cachedir),
+                    )
+                    results[f"cold_{method}{key}"] = summarize(times, **params)
+
+                    func = getattr(ModelDownloader(cachedir), method)
+                    func(url, quiet=True)
+                    times = measure(lambda: func(url, quiet=True), repeat, number)
+                    results[f"warm_{method}{key}"] = summarize(times, **params)
+                    shutil.rmtree(cachedir)
+                archive.unlink()
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float):
+    """Print the ratios of the medians and return the names of the regressions"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["median"] / baseline[name]["median"]
+        mark = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            mark = " <- regression"
+        print(
+            f"{name}: {baseline[name]['median'] * 1e3:.3f} -> "
+            f"{result['median'] * 1e3:.3f} msec ({ratio:.2f}x){mark}"
+        )
+    return regressions
+
+
+def main(cmd=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument(
+        "--formats", nargs="+", default=["zip", "tar.gz"], choices=["zip", "tar.gz"]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--number", type=int, default=100, help="The number of calls of a fast path"
+    )
+    parser.add_argument("--output", help="Write the results to the JSON file")
+    parser.add_argument("--baseline", help="Compare with the previous results")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Allowed slowdown against the baseline, e.g. 0.5 for 1.5x",
+    )
+    args = parser.parse_args(cmd)
+
+    warnings.simplefilter("ignore")
+    with tempfile.TemporaryDirectory() as d:
+        results = run(Path(d), args.sizes, args.formats, args.repeat, args.number)
+
+    for name, result in results.items():
+        print(
+            f"{name}: median={result['median'] * 1e3:.3f} msec "
+            f"min={result['min'] * 1e3:.3f} msec"
+        )
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                dict(
+                    version=RESULTS_VERSION,
+                    created_at=time.time(),
+                    machine=dict(
+                        python=platform.python_version(),
+                        platform=platform.platform(),
+                        cpu_count=os.cpu_count(),
+                    ),
+                    benchmarks=results,
+                ),
+                f,
+                indent=2,
+            )
+
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["benchmarks"]
+        regressions = compare(results, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print(f"{len(regressions)} regressions: {regressions}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Compare the query latency of pandas boolean masks and the indexed table.
+
+    python benchmarks/bench_query.py --scale 1000
+
+The rows of table.csv are repeated "--scale" times with unique names.
+"""
+
+import argparse
+from pathlib import Path
+import tempfile
+import timeit
+
+import pandas as pd
+
+from espnet_model_zoo.model_table import ModelTable
+from espnet_model_zoo.model_table import read_snapshot
+from espnet_model_zoo.model_table import write_snapshot
+
+CSV = Path(__file__).parent.parent / "espnet_model_zoo" / "table.csv"
+
+QUERIES = [
+    {"name": "test"},
+    {"task": "asr"},
+    {"task": "asr", "corpus": "librispeech"},
+    {"task": "tts", "lang": "ja", "fs": "22050"},
+]
+
+
+def make_table(scale: int, path: Path):
+    df = pd.read_csv(CSV, dtype=str)
+    dfs = []
+    for i in range(scale):
+        d = df.copy()
+        if i > 0:
+            d["name"] = d["name"] + f"_{i}"
+        dfs.append(d)
+    pd.concat(dfs).to_csv(path, index=False)
+
+
+def pandas_query(df, key: str = "name", **kwargs):
+    # The implementation of ModelDownloader.query() based on pandas
+    conditions = None
+    for k, v in kwargs.items():
+        condition = df[k] == v
+        if conditions is None:
+            conditions = condition
+        else:
+            conditions &= condition
+    if conditions is not None:
+        df = df[conditions]
+    return list(df[key])
+
+
+def indexed_query(table: ModelTable, key: str = "name", **kwargs):
+    return table.column(key, table.select(**kwargs))
+
+
+def main(cmd=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=100)
+    args = parser.parse_args(cmd)
+
+    with tempfile.TemporaryDirectory() as d:
+        csv = Path(d) / "table.csv"
+        make_table(args.scale, csv)
+
+        t = timeit.default_timer()
+        df = pd.read_csv(csv, dtype=str)
+        print(f"pandas load: {timeit.default_timer() - t:.4f} sec")
+        t = timeit.default_timer()
+        table = ModelTable.from_csv(csv)
+        print(f"indexed load: {timeit.default_timer() - t:.4f} sec")
+        write_snapshot(csv, table)
+        t = timeit.default_timer()
+        read_snapshot(csv)
+        print(f"snapshot load: {timeit.default_timer() - t:.4f} sec")
+        print(f"rows: {len(table)}")
+
+    for q in QUERIES:
+        assert pandas_query(df, **q) == indexed_query(table, **q), q
+        t_pandas = timeit.timeit(lambda: pandas_query(df, **q), number=args.number)
+        t_indexed = timeit.timeit(lambda: indexed_query(table, **q), number=args.number)
+        print(
+            f"{q}: pandas={t_pandas / args.number * 1e3:.3f} msec "
+            f"indexed={t_indexed / args.number * 1e3:.3f} msec "
+            f"speedup={t_pandas / t_indexed:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Compare the unpacking time of espnet2 and the parallel extraction.
+
+    python benchmarks/bench_unpack.py --num_files 8 --file_size 64
+
+A zip file having "--num_files" members of "--file_size" MiB is unpacked.
+"""
+
+import argparse
+import io
+import os
+from pathlib import Path
+import tempfile
+import timeit
+import zipfile
+
+from espnet2.main_funcs.pack_funcs import unpack as espnet_unpack
+import yaml
+
+from espnet_model_zoo.unpack import unpack
+
+
+def make_zip(path: Path, num_files: int, file_size: int, compression: int):
+    meta = {
+        "files": {f"file{i}": f"exp/file{i}.pth" for i in range(num_files)},
+        "yaml_files": {"config": "exp/config.yaml"},
+    }
+    config = {f"file{i}": f"exp/file{i}.pth" for i in range(num_files)}
+    with zipfile.ZipFile(path, "w", compression=compression) as z:
+        z.writestr("meta.yaml", yaml.safe_dump(meta))
+        z.writestr("exp/config.yaml", yaml.safe_dump(config))
+        for i in range(num_files):
+            # Half random to make it compressible a bit
+            data = io.BytesIO()
+            data.write(os.urandom(file_size // 2))
+            data.write(b"\0" * (file_size - file_size // 2))
+            z.writestr(f"exp/file{i}.pth", data.getvalue())
+
+
+def main(cmd=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num_files", type=int, default=8)
+    parser.add_argument("--file_size", type=int, default=64, help="MiB")
+    parser.add_argument("--max_workers", type=int, default=None)
+    parser.add_argument("--deflated", action="store_true")
+    args = parser.parse_args(cmd)
+
+    compression = zipfile.ZIP_DEFLATED if args.deflated else zipfile.ZIP_STORED
+    with tempfile.TemporaryDirectory() as d:
+        archive = Path(d) / "model.zip"
+        make_zip(archive, args.num_files, args.file_size << 20, compression)
+
+        t = timeit.default_timer()
+        espnet_unpack(archive, Path(d) / "espnet")
+        t_espnet = timeit.default_timer() - t
+
+        t = timeit.default_timer()
+        unpack(archive, Path(d) / "parallel", max_workers=args.max_workers)
+        t_parallel = timeit.default_timer() - t
+
+    print(
+        f"espnet2={t_espnet:.3f} sec parallel={t_parallel:.3f} sec "
+        f"speedup={t_espnet / t_parallel:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -48,9 +48,15 @@ def test_model():
 
     for task in tasks:
         for corpus in list(set(d.query("corpus", task=task))):
-            for model_name in d.query(task=task, corpus=corpus):
-                if d.query("valid", name=model_name)[0] == "false":
-                    continue
+            model_names = [
+                model_name
+                for model_name in d.query(task=task, corpus=corpus)
+                if d.query("valid", name=model_name)[0] != "false"
+            ]
+            # Download and unpack the models of the corpus in parallel
+            ModelDownloader("downloads").prefetch(model_names, max_workers=4)
+
+            for model_name in model_names:
                 print(f"#### Test {model_name} ####")
 
                 if task == "asr":
@@ -63,5 +69,6 @@ def test_model():
                     raise NotImplementedError(f"task={task}")
 
             # NOTE(kan-bayashi): remove and recreate cache dir to reduce the disk usage.
+            # The snapshots of Hugging Face aren't evicted by CacheManager.
             shutil.rmtree("downloads")
             os.makedirs("downloads")
@@ -1,7 +1,7 @@
 #!/usr/bin/env bash
 
 set -euo pipefail
-modules="test espnet_model_zoo setup.py ci"
+modules="test espnet_model_zoo setup.py ci benchmarks"
 # black
 if ! black --check ${modules}; then
     printf 'Please apply:\n    $ black %s\n' "${modules}"
@@ -0,0 +1,119 @@
+"""Load the files of an unpacked model with memory mapping.
+
+torch.load(mmap=True) maps the weights of a file in the zipfile format of
+torch.save into memory instead of reading them into private buffers,
+so the processes loading the same model on a host share the pages of
+the page cache. The files in the legacy format, i.e. saved by torch<1.6 or
+with _use_new_zipfile_serialization=False, are converted once by
+convert_for_mmap().
+"""
+
+import os
+from pathlib import Path
+import threading
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import Mapping
+from typing import Union
+import warnings
+import zipfile
+
+
+WEIGHT_SUFFIXES = (".pth", ".pt")
+YAML_SUFFIXES = (".yaml", ".yml")
+
+
+def is_weight_file(path: Union[Path, str]) -> bool:
+    return str(path).endswith(WEIGHT_SUFFIXES)
+
+
+def is_mmap_compatible(path: Union[Path, str]) -> bool:
+    """Return True if the file is in the zipfile format supporting mmap"""
+    return zipfile.is_zipfile(path)
+
+
+def convert_for_mmap(path: Union[Path, str]) -> bool:
+    """Save the file in the legacy format again in the zipfile format.
+
+    Returns True if the file is converted.
+    The file is replaced atomically, so the readers see either of them.
+    """
+    import torch
+
+    path = Path(path)
+    if is_mmap_compatible(path):
+        return False
+    obj = torch.load(path, map_location="cpu", weights_only=True)
+    tmp = path.parent / f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        torch.save(obj, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+    return True
+
+
+def load_weights(path: Union[Path, str]) -> Any:
+    """Load the file saved by torch.save with memory mapping if possible.
+
+    The tensors are copy-on-write, so modifying them in place
+    doesn't change the file, but makes private copies of the pages.
+    """
+    import torch
+
+    if not is_mmap_compatible(path):
+        warnings.warn(f"Loaded without memory mapping due to the legacy format: {path}")
+        return torch.load(path, map_location="cpu", weights_only=True)
+    return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+
+
+class ModelArtifacts(Mapping[str, str]):
+    """The files of an unpacked model, which load the contents lazily.
+
+    This is a mapping same as the return value of
+    ModelDownloader.download_and_unpack(), and load() returns the contents,
+    e.g. the state dict of "asr_model_file" loaded with memory mapping.
+    The loaded contents are kept and shared by the callers.
+
+    Examples:
+        >>> artifacts = d.load_artifacts("kamo-naoyuki/mini_an4_asr")
+        >>> artifacts["asr_model_file"]
+        '<cachedir>/<hash>/exp/.../valid.acc.best.pth'
+        >>> model.load_state_dict(artifacts.load("asr_model_file"))
+    """
+
+    def __init__(self, files: Dict[str, str]):
+        self.files = dict(files)
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key: str) -> str:
+        return self.files[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.files)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.files})"
+
+    def load(self, key: str) -> Any:
+        """Load the weight file or the yaml file of the key"""
+        with self._lock:
+            if key not in self._loaded:
+                path = self.files[key]
+                if is_weight_file(path):
+                    self._loaded[key] = load_weights(path)
+                elif str(path).endswith(YAML_SUFFIXES):
+                    import yaml
+
+                    with open(path, "r", encoding="utf-8") as f:
+                        self._loaded[key] = yaml.safe_load(f)
+                else:
+                    raise ValueError(f"Cannot load the file of {key}: {path}")
+            return self._loaded[key]
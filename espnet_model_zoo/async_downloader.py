@@ -0,0 +1,407 @@
+"""asyncio interface of ModelDownloader.
+
+This module requires aiohttp: pip install espnet_model_zoo[async]
+"""
+
+import asyncio
+from concurrent.futures import Executor
+import contextlib
+import functools
+from pathlib import Path
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+import warnings
+
+import aiohttp
+
+from espnet_model_zoo.cache import write_metadata
+from espnet_model_zoo.downloader import _resume_headers
+from espnet_model_zoo.downloader import DownloadJournal
+from espnet_model_zoo.downloader import IncompleteDownloadError
+from espnet_model_zoo.downloader import is_url
+from espnet_model_zoo.downloader import ModelDownloader
+from espnet_model_zoo.downloader import MODELS_URL
+from espnet_model_zoo.downloader import str_to_hash
+from espnet_model_zoo.downloader import StreamHasher
+from espnet_model_zoo.lease import check_timeout
+from espnet_model_zoo.lease import Lease
+from espnet_model_zoo.lease import try_lease
+from espnet_model_zoo.model_table import Query
+from espnet_model_zoo.session import get_backoff_time
+from espnet_model_zoo.unpack import get_unpacked_files
+from espnet_model_zoo.unpack import unpack
+
+
+class AsyncModelDownloader:
+    """Download models concurrently in an event loop.
+
+    The downloads share a connection pool of aiohttp, and the blocking parts,
+    e.g. unpacking and hashing the data of the previous attempts,
+    run in an executor.
+    The cache directory is compatible with ModelDownloader.
+
+    Examples:
+        >>> async def main():
+        ...     async with AsyncModelDownloader() as d:
+        ...         return await asyncio.gather(
+        ...             *[d.download_and_unpack(name) for name in names]
+        ...         )
+    """
+
+    def __init__(
+        self,
+        cachedir: Union[Path, str] = None,
+        executor: Executor = None,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        retry: int = 3,
+        chunk_size: int = 64 * 1024,
+        **kwargs,
+    ):
+        self.downloader = ModelDownloader(cachedir, **kwargs)
+        self.cachedir = self.downloader.cachedir
+        self.executor = executor
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.retry = retry
+        self.chunk_size = chunk_size
+        self._session = None
+        self._locks = {}
+
+    async def __aenter__(self) -> "AsyncModelDownloader":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # The session must be created in the running loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit, limit_per_host=self.limit_per_host
+                ),
+                timeout=aiohttp.ClientTimeout(sock_connect=10.0, sock_read=30.0),
+            )
+        return self._session
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    @contextlib.asynccontextmanager
+    async def _lock(self, path: str, poll_interval: float = 0.05):
+        from filelock import FileLock
+        from filelock import Timeout
+
+        # Serialize the coroutines in this process with asyncio.Lock,
+        # and then take the file lock for the other processes by polling
+        # so that neither the loop nor the executor is blocked.
+        lock = self._locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            file_lock = FileLock(path)
+            while True:
+                try:
+                    file_lock.acquire(timeout=0)
+                    break
+                except Timeout:
+                    await asyncio.sleep(poll_interval)
+            try:
+                yield
+            finally:
+                file_lock.release()
+
+    async def _acquire_lease(
+        self,
+        target: Path,
+        is_done: Callable[[], Any],
+        poll_interval: float = 0.05,
+        max_poll_interval: float = 1.0,
+    ) -> Tuple[Optional[Lease], Any]:
+        # Same as lease.acquire_or_wait(), but waits in the event loop
+        start = time.monotonic()
+        while True:
+            lease, result = await self._run(
+                try_lease, target, is_done, ttl=self.downloader.lease_ttl
+            )
+            if lease is None or lease.acquired:
+                return lease, result
+            check_timeout(lease, start, self.downloader.lock_timeout)
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, max_poll_interval)
+
+    @contextlib.asynccontextmanager
+    async def _hold(self, lease: Lease):
+        # Lease.release() waits for the lock file and the heartbeat thread
+        try:
+            yield lease
+        finally:
+            await self._run(lease.release)
+
+    async def query(
+        self, key: Union[Sequence[str]] = "name", **kwargs
+    ) -> List[Union[str, Tuple[str]]]:
+        return self.downloader.query(key, **kwargs)
+
+    async def query_batch(
+        self, queries: Sequence[Query], key: Union[Sequence[str]] = "name"
+    ) -> List[List[Union[str, Tuple[str]]]]:
+        return self.downloader.query_batch(queries, key)
+
+    async def update_model_table(self, force: bool = False) -> bool:
+        self.downloader._check_online(MODELS_URL)
+        csv = self.downloader.csv
+        async with self._lock(str(csv) + ".lock"):
+            headers = {} if force else self.downloader._get_table_conditions()
+            session = self._get_session()
+            async with session.get(MODELS_URL, headers=headers) as response:
+                response.raise_for_status()
+                data = await response.read()
+                updated = self.downloader._write_model_table(
+                    response.status, response.headers, data
+                )
+        if updated:
+            self.downloader._reload_model_table()
+        return updated
+
+    def _is_remote_file(self, name: str, url: str) -> bool:
+        # Hugging Face models and local files are handled by ModelDownloader
+        return (
+            is_url(url)
+            and not url.startswith("https://huggingface.co")
+            and not (name is not None and name.startswith("https://huggingface.co/"))
+        )
+
+    async def download(
+        self, name: str = None, version: int = -1, quiet: bool = False, **kwargs: str
+    ) -> str:
+        url = self.downloader.get_url(name=name, version=version, **kwargs)
+        if not self._is_remote_file(name, url):
+            return await self._run(
+                self.downloader.download, name, version, quiet, **kwargs
+            )
+
+        outdir = self.cachedir / str_to_hash(url)
+        cached = self.downloader._get_cached_file(url)
+        if cached is not None:
+            self.downloader.cache.touch(outdir)
+            return cached
+
+        metadata = await self._get_remote_info(url)
+        filename = metadata["filename"]
+        outdir.mkdir(parents=True, exist_ok=True)
+        output_path = outdir / filename
+        lease, _ = await self._acquire_lease(
+            output_path, functools.partial(self.downloader._get_cached_file, url)
+        )
+        downloaded = False
+        if lease is not None:
+            async with self._hold(lease):
+                write_metadata(outdir, digests=None)
+                downloaded = not self.downloader._link_from_blob_store(url, metadata)
+                if downloaded and not await self._run(
+                    self.downloader._download_from_peers, url, metadata, quiet
+                ):
+                    self.downloader._check_online(url)
+                    digests = await self._download_from_mirrors(url, output_path)
+                    lease.check()
+                    self.downloader._check_downloaded_file(url, metadata, digests)
+        self.downloader.cache.touch(outdir)
+        if downloaded:
+            await self._run(self.downloader._evict, outdir)
+        return str(outdir / filename)
+
+    async def download_and_unpack(
+        self, name: str = None, version: int = -1, quiet: bool = False, **kwargs: str
+    ) -> Dict[str, Union[str, List[str]]]:
+        url = self.downloader.get_url(name=name, version=version, **kwargs)
+        if not self._is_remote_file(name, url):
+            return await self._run(
+                self.downloader.download_and_unpack, name, version, quiet, **kwargs
+            )
+
+        # Unpack to <cachedir>/<hash> in order to give an unique name
+        outdir = self.cachedir / str_to_hash(url)
+        meta_yaml = outdir / "meta.yaml"
+        outdir.mkdir(parents=True, exist_ok=True)
+        # Skip downloading and unpacking if the cache exists
+        lease, info = await self._acquire_lease(
+            meta_yaml, functools.partial(get_unpacked_files, outdir)
+        )
+        if lease is None:
+            self.downloader.cache.touch(outdir)
+            return info
+
+        async with self._hold(lease):
+            filename = await self.download(url, quiet=quiet)
+            info = await self._run(unpack, filename, outdir)
+            await self._run(self.downloader._dedupe_unpacked, outdir)
+        await self._run(self.downloader._evict, outdir)
+        return info
+
+    async def _get_remote_info(self, url: str) -> dict:
+        from espnet_model_zoo.cache import is_fresh
+        from espnet_model_zoo.cache import read_metadata
+
+        metadata = read_metadata(self.cachedir / str_to_hash(url))
+        if metadata.get("url") == url and (
+            is_fresh(metadata) or self.downloader.offline
+        ):
+            return metadata
+
+        self.downloader._check_online(url)
+        metadata = await self._run(self.downloader._get_remote_info_from_mirrors, url)
+        if metadata is not None:
+            return metadata
+        session = self._get_session()
+        try:
+            async with session.head(url, allow_redirects=False) as response:
+                return self.downloader._write_remote_info(
+                    url, response.headers, response.status
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Same as ModelDownloader._get_remote_info()
+            metadata = await self._run(self.downloader._get_remote_info_from_peers, url)
+            if metadata is None:
+                raise
+            return metadata
+
+    async def _download_from_mirrors(
+        self, url: str, output_path: Path
+    ) -> Dict[str, str]:
+        # Same as ModelDownloader._download_from_mirrors()
+        stats = self.downloader.host_stats
+        urls = self.downloader._get_mirror_order(url)
+        for i, candidate in enumerate(urls):
+            start = time.perf_counter()
+            try:
+                digests = await self._download(candidate, output_path)
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                IncompleteDownloadError,
+            ) as e:
+                stats.record_failure(candidate)
+                if i == len(urls) - 1:
+                    raise
+                warnings.warn(f"Failed to download {url} from {candidate}: {e}")
+                continue
+            stats.record_transfer(
+                candidate, output_path.stat().st_size, time.perf_counter() - start
+            )
+            return digests
+
+    async def _download(self, url: str, output_path: Path) -> Dict[str, str]:
+        # Same as downloader.download(), but the transfer runs in the event loop
+        journal = DownloadJournal(output_path)
+        journal.load(url)
+        hasher = StreamHasher()
+
+        for trial in range(self.retry + 1):
+            if journal.is_complete():
+                # Requesting the rest of the complete data fails with 416
+                break
+            try:
+                await self._download_stream(url, journal, hasher)
+                break
+            except (
+                aiohttp.ClientPayloadError,
+                aiohttp.ClientConnectionError,
+                asyncio.TimeoutError,
+                IncompleteDownloadError,
+            ) as e:
+                if trial == self.retry:
+                    raise
+                warnings.warn(f"Download is interrupted and will be resumed: {e}")
+                # Same backoff as downloader.download()
+                session = self.downloader.session
+                await asyncio.sleep(get_backoff_time(session, url, trial))
+
+        digests = await self._run(hasher.hexdigests, journal.part)
+        journal.finalize(output_path)
+        return digests
+
+    async def _download_stream(
+        self,
+        url: str,
+        journal: DownloadJournal,
+        hasher: StreamHasher,
+        checkpoint_size: int = 16 * 1024 * 1024,
+    ):
+        offset, headers = _resume_headers(journal)
+        session = self._get_session()
+        async with session.get(url, headers=headers) as response:
+            if response.status == 416 and offset > 0:
+                # The partial data is longer than the remote object, e.g. replaced
+                modified = True
+            elif response.status == 206:
+                # e.g. Content-Range: bytes 100-999/1000
+                file_size = int(response.headers["Content-Range"].split("/")[-1])
+                modified = not journal.is_valid_for(response.headers, file_size)
+                if not modified:
+                    # Hash the data downloaded in the previous attempts
+                    if hasher.offset > offset:
+                        hasher.reset()
+                    await self._run(hasher.catch_up, journal.part, offset)
+            else:
+                response.raise_for_status()
+                modified = False
+                offset = 0
+                file_size = response.content_length
+                journal.reset(url, response.headers, file_size)
+                hasher.reset()
+
+            if not modified:
+                await self._write(
+                    response, journal, hasher, offset, file_size, checkpoint_size
+                )
+                return
+
+        # The remote file was modified, so start again from the beginning
+        journal.reset(url, {})
+        await self._download_stream(url, journal, hasher, checkpoint_size)
+
+    async def _write(
+        self,
+        response: aiohttp.ClientResponse,
+        journal: DownloadJournal,
+        hasher: StreamHasher,
+        offset: int,
+        file_size: int,
+        checkpoint_size: int,
+    ):
+        with journal.part.open("r+b") as f:
+            f.seek(offset)
+            saved = offset
+            try:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    hasher.update(f.tell(), chunk)
+                    f.write(chunk)
+                    # Checkpoint the progress periodically
+                    if f.tell() - saved >= checkpoint_size:
+                        f.flush()
+                        journal.add_range(0, f.tell())
+                        saved = f.tell()
+            finally:
+                f.flush()
+                journal.add_range(0, f.tell())
+            if file_size is not None and f.tell() != file_size:
+                raise IncompleteDownloadError(
+                    f"Expected {file_size} bytes, but got {f.tell()} bytes: "
+                    f"{response.url}"
+                )
+            f.truncate()
@@ -0,0 +1,147 @@
+import os
+from pathlib import Path
+import stat
+import threading
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+from typing import Union
+
+from espnet_model_zoo.cache import hash_file
+
+
+class BlobStore:
+    """Content-addressed storage sharing identical files between cache entries.
+
+    A file is stored once as <root>/sha256/<xx>/<digest>, and the files in
+    the cache entries are hard links to it. A blob is unreferenced if its
+    link count drops to one, e.g. after the entries are removed,
+    and it's deleted by gc().
+    The other digests of the blobs, e.g. md5 given by Content-MD5,
+    are recorded as aliases to look up a blob before downloading.
+
+    The files must not be modified in place because they are shared.
+    If hard links aren't supported, e.g. by the file system,
+    the files are simply left as they are.
+
+    Examples:
+        >>> store = BlobStore("cache/blobs")
+        >>> digest = store.ingest("cache/<hash>/model.zip")
+        >>> store.link(digest, "cache/<other hash>/model.zip")
+    """
+
+    def __init__(self, root: Union[Path, str]):
+        self.root = Path(root)
+
+    def path(self, digest: str, algorithm: str = "sha256") -> Path:
+        return self.root / algorithm / digest[:2] / digest
+
+    def lookup(self, algorithm: str, digest: str) -> Optional[str]:
+        """Return the sha256 digest of an existing blob having the digest"""
+        digest = digest.lower()
+        if algorithm != "sha256":
+            try:
+                digest = self.path(digest, algorithm).read_text().strip()
+            except FileNotFoundError:
+                return None
+        if self.path(digest).exists():
+            return digest
+        return None
+
+    def add_alias(self, algorithm: str, digest: str, sha256: str):
+        path = self.path(digest.lower(), algorithm)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.parent / f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp.write_text(sha256)
+        os.replace(tmp, path)
+
+    def link(self, digest: str, dst: Union[Path, str]) -> bool:
+        """Replace "dst" with a hard link to the blob.
+
+        Returns False if the blob doesn't exist, e.g. removed by gc(),
+        or it can't be linked, e.g. exceeding the maximum number of links.
+        """
+        dst = Path(dst)
+        tmp = dst.parent / f"{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.link(self.path(digest), tmp)
+        except OSError:
+            return False
+        os.replace(tmp, dst)
+        return True
+
+    def ingest(self, path: Union[Path, str], digest: str = None) -> Optional[str]:
+        """Store the file and replace it with a hard link to the blob.
+
+        Returns the sha256 digest, or None if hard links aren't supported.
+        """
+        path = Path(path)
+        if digest is None:
+            digest = hash_file(path, ["sha256"])["sha256"]
+        blob = self.path(digest)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        for _ in range(3):
+            try:
+                if os.path.samefile(blob, path) or self.link(digest, path):
+                    return digest
+            except FileNotFoundError:
+                pass
+            try:
+                os.link(path, blob)
+                return digest
+            except FileExistsError:
+                # Stored by another process in the meantime
+                continue
+            except OSError:
+                # e.g. EPERM if the file system doesn't support hard links
+                return None
+        return None
+
+    def ingest_tree(
+        self, directory: Union[Path, str], exclude: Iterable[str] = ()
+    ) -> Dict[str, str]:
+        """Store the regular files under the directory except for "exclude".
+
+        The files already linked, i.e. having multiple links, are skipped.
+        """
+        exclude = set(exclude)
+        digests = {}
+        for dirpath, dirnames, filenames in os.walk(directory):
+            for name in filenames:
+                p = Path(dirpath) / name
+                if name in exclude or p.suffix in exclude:
+                    continue
+                st = p.lstat()
+                if not stat.S_ISREG(st.st_mode) or st.st_nlink > 1:
+                    continue
+                digest = self.ingest(p)
+                if digest is None:
+                    return digests
+                digests[str(p)] = digest
+        return digests
+
+    def gc(self) -> Dict[str, int]:
+        """Remove the unreferenced blobs and the aliases to them"""
+        removed = 0
+        freed = 0
+        for p in sorted(self.root.glob("sha256/*/*")):
+            if p.name.endswith(".tmp"):
+                continue
+            try:
+                st = p.stat()
+                if st.st_nlink == 1:
+                    p.unlink()
+                    removed += 1
+                    freed += st.st_size
+            except FileNotFoundError:
+                pass
+
+        for p in self.root.glob("*/*/*"):
+            if p.parent.parent.name == "sha256" or p.name.endswith(".tmp"):
+                continue
+            try:
+                if not self.path(p.read_text().strip()).exists():
+                    p.unlink()
+            except FileNotFoundError:
+                pass
+        return dict(removed=removed, freed=freed)
@@ -0,0 +1,367 @@
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+import re
+import shutil
+import tempfile
+import time
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Union
+import uuid
+
+from espnet_model_zoo.lease import is_stale
+from espnet_model_zoo.lease import Lease
+from espnet_model_zoo.lease import LEASE_SUFFIX
+from espnet_model_zoo.lease import read_lease
+
+
+METADATA_FILE = "metadata.json"
+
+
+def read_metadata(outdir: Union[Path, str], name: str = METADATA_FILE) -> dict:
+    """Read the metadata of a cache entry, i.e. <cachedir>/<hash>/metadata.json
+
+    Returns an empty dict if not existing or broken.
+    """
+    path = Path(outdir) / name
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(metadata, dict):
+        return {}
+    return metadata
+
+
+def write_metadata(
+    outdir: Union[Path, str], name: str = METADATA_FILE, **kwargs
+) -> dict:
+    """Update the metadata of a cache entry with the given fields atomically"""
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    metadata = read_metadata(outdir, name)
+    metadata.update(kwargs)
+
+    fd, tmp = tempfile.mkstemp(dir=outdir, prefix=name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2, sort_keys=True)
+        os.replace(tmp, outdir / name)
+    except BaseException:
+        Path(tmp).unlink()
+        raise
+    return metadata
+
+
+def is_fresh(metadata: dict) -> bool:
+    """Whether the remote information in the metadata is within its TTL"""
+    fetched_at = metadata.get("fetched_at")
+    ttl = metadata.get("ttl")
+    if fetched_at is None or ttl is None:
+        return False
+    return time.time() < fetched_at + ttl
+
+
+def hash_file(
+    path: Union[Path, str], algorithms: Iterable[str] = ("md5", "sha256")
+) -> Dict[str, str]:
+    """Compute the digests of the file using memory mapping"""
+    hashes = {a: hashlib.new(a) for a in algorithms}
+    with Path(path).open("rb") as f:
+        if os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for h in hashes.values():
+                    h.update(m)
+    return {a: h.hexdigest() for a, h in hashes.items()}
+
+
+def read_checksum_manifest(path: Union[Path, str]) -> Dict[str, str]:
+    """Read a manifest in the format of sha256sum, i.e. "<digest>  <name>" per line.
+
+    <name> is either the url or the file name of a model.
+    """
+    manifest = {}
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            digest, name = line.split(maxsplit=1)
+            # "*" indicates the binary mode in sha256sum
+            manifest[name.lstrip("*")] = digest.lower()
+    return manifest
+
+
+ENTRY_REGEX = re.compile(r"^[0-9a-f]{32}$")
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(size: str) -> int:
+    """Parse a size in bytes with an optional binary unit, e.g. 500M, 10G"""
+    ma = re.match(r"^\s*(\d+(?:\.\d*)?)\s*([KMGT]?)i?B?\s*$", str(size), re.I)
+    if ma is None:
+        raise ValueError(f"Invalid size: {size}")
+    return int(float(ma.group(1)) * SIZE_UNITS[ma.group(2).upper()])
+
+
+def format_size(size: int) -> str:
+    for unit in ("", "K", "M", "G"):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "T"
+    return f"{size:.1f}{unit}" if unit != "" else f"{size}"
+
+
+def _get_dir_size(path: Union[Path, str]) -> int:
+    # Symbolic links, e.g. the link to a local model file, are not followed
+    size = 0
+    with os.scandir(path) as it:
+        for e in it:
+            if e.is_dir(follow_symlinks=False):
+                size += _get_dir_size(e.path)
+            else:
+                size += e.stat(follow_symlinks=False).st_size
+    return size
+
+
+class CacheManager:
+    """Bound the size of the cache directory by evicting the entries.
+
+    An entry is <cachedir>/<hash> containing a downloaded file and its unpacked
+    files. The last access time and the number of hits are recorded
+    in metadata.json, and the least recently used ("lru") or the least
+    frequently used ("lfu") entries are evicted first.
+
+    The entries are removed while holding their lock files, and not removed
+    while a thread or process fetching them holds the lease or the ones using
+    them hold them by hold(), so an entry in use is never evicted.
+    The stale leases left by the crashed processes are removed.
+    The lock files and the directory are removed last. A process which was
+    waiting for a removed lock file may overlap with one taking a new lock file,
+    and the lease taken over by the other is detected as LeaseLost.
+    The snapshots of Hugging Face are managed by huggingface_hub and ignored.
+
+    Examples:
+        >>> cache = CacheManager("~/.cache/espnet", max_size=parse_size("10G"))
+        >>> cache.prune()
+    """
+
+    def __init__(
+        self,
+        cachedir: Union[Path, str],
+        max_size: int = None,
+        policy: str = "lru",
+    ):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"policy must be 'lru' or 'lfu': {policy}")
+        self.cachedir = Path(cachedir).expanduser()
+        self.max_size = max_size
+        self.policy = policy
+
+    def touch(self, outdir: Union[Path, str]) -> dict:
+        """Record an access to the entry.
+
+        The read-modify-write isn't locked, so concurrent hits might be
+        counted as one, which is enough for the eviction.
+        """
+        metadata = read_metadata(outdir)
+        return write_metadata(
+            outdir, last_access=time.time(), hits=metadata.get("hits", 0) + 1
+        )
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """List the entries in the eviction order"""
+        entries = []
+        if not self.cachedir.is_dir():
+            return entries
+        with os.scandir(self.cachedir) as it:
+            for e in it:
+                if not ENTRY_REGEX.match(e.name) or not e.is_dir(follow_symlinks=False):
+                    continue
+                metadata = read_metadata(e.path)
+                url = metadata.get("url")
+                if url is None and os.path.exists(os.path.join(e.path, "url")):
+                    with open(os.path.join(e.path, "url"), encoding="utf-8") as f:
+                        url = f.read().strip()
+                try:
+                    last_access = metadata.get("last_access")
+                    if last_access is None:
+                        # Created before the access tracking
+                        last_access = e.stat(follow_symlinks=False).st_mtime
+                    size = _get_dir_size(e.path)
+                except FileNotFoundError:
+                    # Removed by another process
+                    continue
+                if size == 0:
+                    # Only the lock files are left after the removal
+                    continue
+                entries.append(
+                    dict(
+                        path=e.path,
+                        url=url,
+                        size=size,
+                        last_access=last_access,
+                        hits=metadata.get("hits", 0),
+                    )
+                )
+
+        if self.policy == "lfu":
+            entries.sort(key=lambda x: (x["hits"], x["last_access"]))
+        else:
+            entries.sort(key=lambda x: x["last_access"])
+        return entries
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self.entries()
+        return dict(
+            cachedir=str(self.cachedir),
+            size=sum(e["size"] for e in entries),
+            max_size=self.max_size,
+            policy=self.policy,
+            num_entries=len(entries),
+            hits=sum(e["hits"] for e in entries),
+            entries=entries,
+        )
+
+    @contextlib.contextmanager
+    def hold(self, outdir: Union[Path, str], ttl: float = 60.0) -> Iterator[Lease]:
+        """Keep the entry from being removed in the block, e.g. while loading
+        the unpacked files.
+
+        The holders take their own leases, <outdir>/in_use.<token>.lease.
+        The lease is taken with the lock of remove(), so the entry is either
+        kept or removed entirely before, and the caller fetches it in the block.
+        """
+        from filelock import FileLock
+
+        outdir = Path(outdir)
+        outdir.mkdir(parents=True, exist_ok=True)
+        lease = Lease(outdir / f"in_use.{uuid.uuid4().hex}", ttl=ttl)
+        with FileLock(str(outdir / "meta.yaml.lock")):
+            lease.try_acquire()
+        try:
+            yield lease
+        finally:
+            lease.release()
+            try:
+                os.unlink(lease.lock_file)
+            except OSError:
+                pass
+
+    def remove(
+        self, outdir: Union[Path, str], timeout: float = 0, poll_interval: float = 0.1
+    ) -> bool:
+        """Remove the entry if it's not in use within the timeout.
+
+        Returns False if the entry is in use, i.e. its lock files are held,
+        a process fetching it holds the lease or it's held by hold().
+        A negative timeout waits forever.
+        """
+        start = time.monotonic()
+        while True:
+            removed = self._remove(Path(outdir), timeout)
+            if removed is not None:
+                return removed
+            if 0 <= timeout <= time.monotonic() - start:
+                return False
+            time.sleep(poll_interval)
+
+    def _remove(self, outdir: Path, timeout: float) -> Optional[bool]:
+        # Returns None if leased
+        from filelock import FileLock
+        from filelock import Timeout
+
+        if not outdir.is_dir():
+            return True
+
+        # Take the locks in the same order as download_and_unpack()
+        lock_files = set(outdir.glob("*.lock"))
+        filename = read_metadata(outdir).get("filename")
+        if filename is not None:
+            lock_files.add(outdir / (filename + ".lock"))
+        lock_files.discard(outdir / "meta.yaml.lock")
+        lock_files = [outdir / "meta.yaml.lock"] + sorted(lock_files)
+
+        locks = []
+        try:
+            for lock_file in lock_files:
+                lock = FileLock(str(lock_file))
+                try:
+                    lock.acquire(timeout=timeout)
+                except Timeout:
+                    return False
+                locks.append(lock)
+
+            # The leases are renewed while holding the lock files
+            for p in outdir.glob("*" + LEASE_SUFFIX):
+                lease = read_lease(p)
+                if lease is not None and not is_stale(lease):
+                    return None
+
+            # Remove the files indicating the cache first
+            # so that the lock-free readers don't find a partial entry
+            names = ["meta.yaml", METADATA_FILE]
+            names += sorted(p.name for p in outdir.iterdir() if p.name not in names)
+            for name in names:
+                p = outdir / name
+                if name.endswith(".lock") or not os.path.lexists(p):
+                    continue
+                if p.is_dir() and not p.is_symlink():
+                    shutil.rmtree(p)
+                else:
+                    p.unlink()
+
+            # Unlinked while held, which fails on Windows
+            for lock_file in lock_files:
+                try:
+                    lock_file.unlink()
+                except OSError:
+                    pass
+        finally:
+            for lock in locks:
+                lock.release()
+        try:
+            outdir.rmdir()
+        except OSError:
+            # Not empty, e.g. recreated by another process
+            pass
+        return True
+
+    def prune(
+        self, max_size: int = None, keep: Sequence[Union[Path, str]] = ()
+    ) -> List[Dict[str, Any]]:
+        """Evict the entries until the total size is within max_size.
+
+        The entries in use and given by "keep" are skipped.
+        Returns the removed entries.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        if max_size is None:
+            return []
+
+        keep = set(os.path.abspath(p) for p in keep)
+        entries = self.entries()
+        total = sum(e["size"] for e in entries)
+        removed = []
+        for e in entries:
+            if total <= max_size:
+                break
+            if os.path.abspath(e["path"]) in keep:
+                continue
+            if self.remove(e["path"]):
+                total -= e["size"]
+                removed.append(e)
+        return removed
@@ -1,29 +1,68 @@
 import argparse
-from distutils.util import strtobool
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
 import hashlib
+import json
 import os
 from pathlib import Path
 import re
-import shutil
-import tempfile
+import sys
+import threading
+import time
+from typing import Any
+from typing import Callable
 from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Optional
 from typing import Sequence
 from typing import Tuple
+from typing import TYPE_CHECKING
 from typing import Union
 import warnings
 
-from filelock import FileLock
-from huggingface_hub import snapshot_download
-import pandas as pd
-import requests
-from tqdm import tqdm
-import yaml
-
-from espnet2.main_funcs.pack_funcs import find_path_and_change_it_recursive
-from espnet2.main_funcs.pack_funcs import get_dict_from_cache
-from espnet2.main_funcs.pack_funcs import unpack
-
+from espnet_model_zoo.blob_store import BlobStore
+from espnet_model_zoo.cache import CacheManager
+from espnet_model_zoo.cache import ENTRY_REGEX
+from espnet_model_zoo.cache import format_size
+from espnet_model_zoo.cache import hash_file
+from espnet_model_zoo.cache import is_fresh
+from espnet_model_zoo.cache import parse_size
+from espnet_model_zoo.cache import read_checksum_manifest
+from espnet_model_zoo.cache import read_metadata
+from espnet_model_zoo.cache import write_metadata
+from espnet_model_zoo.instrumentation import CACHE
+from espnet_model_zoo.instrumentation import Instrumentation
+from espnet_model_zoo.instrumentation import LOCK_WAIT
+from espnet_model_zoo.lease import acquire_or_wait
+from espnet_model_zoo.lease import Lease
+from espnet_model_zoo.mirror import get_mirror_urls
+from espnet_model_zoo.mirror import HostStats
+from espnet_model_zoo.mirror import race
+from espnet_model_zoo.mirror import read_mirrors_config
+from espnet_model_zoo.model_cache import estimate_memory
+from espnet_model_zoo.model_cache import import_class
+from espnet_model_zoo.model_cache import ModelCache
+from espnet_model_zoo.model_cache import TASK_CLASSES
+from espnet_model_zoo.model_table import load_model_table
+from espnet_model_zoo.model_table import parse_query
+from espnet_model_zoo.model_table import Query
+from espnet_model_zoo.peer import parse_peers
+from espnet_model_zoo.peer import PEERS_ENV
+from espnet_model_zoo.session import create_session
+from espnet_model_zoo.session import get_backoff_time
+
+# NOTE: The heavy modules, e.g. requests, espnet2 and huggingface_hub, are imported
+# in the functions using them so that the command line tools, e.g.
+# espnet_model_zoo_query, start quickly.
+if TYPE_CHECKING:
+    from espnet_model_zoo.artifacts import ModelArtifacts
+    import requests
+
+
+# Set "1" or "true" to use ModelDownloader without network access
+OFFLINE_ENV = "ESPNET_MODEL_ZOO_OFFLINE"
 
 MODELS_URL = (
     "https://raw.githubusercontent.com/espnet/espnet_model_zoo/master/"
@@ -51,49 +90,519 @@ def str_to_hash(string: Union[str, Path]) -> str:
     return hashlib.md5(str(string).encode("utf-8")).hexdigest()
 
 
+class IncompleteDownloadError(IOError):
+    pass
+
+
+class NotCachedError(FileNotFoundError):
+    """The model is required to be downloaded in the offline mode"""
+
+
+class DownloadJournal:
+    """Partial-state of a download kept next to the target file.
+
+    The data is written to "<output_path>.part" and the state, i.e. the url,
+    the validators of the remote object and the completed byte ranges,
+    is written to "<output_path>.part.json".
+    """
+
+    def __init__(self, output_path: Union[Path, str]):
+        self.part = Path(str(output_path) + ".part")
+        self.path = Path(str(output_path) + ".part.json")
+        self.url = None
+        self.etag = None
+        self.last_modified = None
+        self.size = None
+        self.ranges = []
+        self._lock = threading.Lock()
+
+    def load(self, url: str) -> bool:
+        """Load the journal if a partial download of the url exists"""
+        if not self.path.exists() or not self.part.exists():
+            return False
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                state = json.load(f)
+        except ValueError:
+            return False
+        if state.get("url") != url:
+            return False
+        self.url = url
+        self.etag = state.get("etag")
+        self.last_modified = state.get("last_modified")
+        self.size = state.get("size")
+        self.ranges = [tuple(r) for r in state.get("ranges", [])]
+        return True
+
+    def reset(self, url: str, headers, size: int = None):
+        """Start a new download from scratch"""
+        self.url = url
+        self.etag = headers.get("ETag")
+        self.last_modified = headers.get("Last-Modified")
+        self.size = size
+        self.ranges = []
+        self.part.parent.mkdir(parents=True, exist_ok=True)
+        with self.part.open("wb") as f:
+            if size is not None:
+                # Preallocate the file so that each worker can write in place
+                f.truncate(size)
+        self.save()
+
+    def is_valid_for(self, headers, size: int = None) -> bool:
+        """Check whether the remote object is unchanged since the last attempt"""
+        if self.etag is None and self.last_modified is None:
+            # Can't validate without validators, so compare only the size
+            return size is not None and size == self.size
+        if self.etag is not None and headers.get("ETag") != self.etag:
+            return False
+        if (
+            self.last_modified is not None
+            and headers.get("Last-Modified") != self.last_modified
+        ):
+            return False
+        return size is None or self.size is None or size == self.size
+
+    @property
+    def validator(self) -> Optional[str]:
+        # For "If-Range" header
+        if self.etag is not None and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+    def add_range(self, start: int, end: int):
+        if end <= start:
+            return
+        with self._lock:
+            merged = []
+            for s, e in sorted(self.ranges + [(start, end)]):
+                if len(merged) > 0 and s <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+                else:
+                    merged.append((s, e))
+            self.ranges = merged
+            self._save()
+
+    def completed_bytes(self) -> int:
+        return sum(e - s for s, e in self.ranges)
+
+    def prefix_size(self) -> int:
+        """The size of the contiguous completed bytes from the beginning"""
+        if len(self.ranges) > 0 and self.ranges[0][0] == 0:
+            return self.ranges[0][1]
+        return 0
+
+    def is_complete(self) -> bool:
+        """Whether all of the data is downloaded, e.g. the process died before
+        finalize() in the previous attempt"""
+        return (
+            self.url is not None
+            and self.size is not None
+            and self.prefix_size() >= self.size
+        )
+
+    def missing_ranges(self, size: int) -> List[Tuple[int, int]]:
+        missing = []
+        offset = 0
+        for s, e in self.ranges:
+            if offset < s:
+                missing.append((offset, min(s, size)))
+            offset = max(offset, e)
+        if offset < size:
+            missing.append((offset, size))
+        return missing
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        state = dict(
+            url=self.url,
+            etag=self.etag,
+            last_modified=self.last_modified,
+            size=self.size,
+            ranges=[list(r) for r in self.ranges],
+        )
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def finalize(self, output_path: Union[Path, str]):
+        """Move the completed data to the target and remove the journal"""
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.part, output_path)
+        self.path.unlink()
+
+
+class StreamHasher:
+    """Compute digests of the data written at arbitrary offsets of a file.
+
+    The data is hashed in the order of the offset while it's downloaded.
+    Out-of-order data, e.g. from the other workers of a ranged download,
+    is buffered up to "max_pending" bytes, and the rest which couldn't be
+    hashed on the fly is read back from the file at the end.
+    "on_data" is called with the offset and the data in the same order.
+    """
+
+    def __init__(
+        self,
+        algorithms: Sequence[str] = ("md5", "sha256"),
+        max_pending: int = 64 * 1024 * 1024,
+        on_data: Callable[[int, bytes], None] = None,
+    ):
+        self.algorithms = list(algorithms)
+        self.max_pending = max_pending
+        self.on_data = on_data
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hashes = {a: hashlib.new(a) for a in self.algorithms}
+        # The data before this offset has been hashed
+        self.offset = 0
+        self.pending = {}
+        self.pending_size = 0
+        self.overflow = False
+
+    def _update(self, data: bytes):
+        for h in self.hashes.values():
+            h.update(data)
+        if self.on_data is not None:
+            self.on_data(self.offset, data)
+        self.offset += len(data)
+
+    def update(self, offset: int, data: bytes):
+        with self._lock:
+            if offset == self.offset:
+                self._update(data)
+                # Consume the buffered data following this chunk
+                while self.offset in self.pending:
+                    data = self.pending.pop(self.offset)
+                    self.pending_size -= len(data)
+                    self._update(data)
+            elif offset > self.offset and not self.overflow:
+                if self.pending_size + len(data) > self.max_pending:
+                    # Give up buffering and read from the file later
+                    self.overflow = True
+                    self.pending.clear()
+                    self.pending_size = 0
+                else:
+                    self.pending[offset] = bytes(data)
+                    self.pending_size += len(data)
+
+    def catch_up(self, path: Union[Path, str], end: int, chunk_size: int = 1 << 20):
+        """Hash the data from the current offset to "end" by reading the file"""
+        with self._lock, Path(path).open("rb") as f:
+            f.seek(self.offset)
+            while self.offset < end:
+                chunk = f.read(min(chunk_size, end - self.offset))
+                if len(chunk) == 0:
+                    break
+                self._update(chunk)
+            self.pending.clear()
+            self.pending_size = 0
+
+    def hexdigests(self, path: Union[Path, str]) -> Dict[str, str]:
+        self.catch_up(path, Path(path).stat().st_size)
+        return {a: h.hexdigest() for a, h in self.hashes.items()}
+
+
+def _fetch_range(
+    session: "requests.Session",
+    url: str,
+    journal: DownloadJournal,
+    hasher: StreamHasher,
+    start: int,
+    end: int,
+    chunk_size: int,
+    pbar=None,
+):
+    # Download bytes [start, end) and write them in place
+    headers = {"Range": f"bytes={start}-{end - 1}"}
+    response = session.get(url=url, headers=headers, stream=True)
+    response.raise_for_status()
+    if response.status_code != 206:
+        raise RuntimeError(f"The server ignored the Range request: {url}")
+
+    with journal.part.open("r+b") as f:
+        f.seek(start)
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    chunk = chunk[: end - f.tell()]
+                    hasher.update(f.tell(), chunk)
+                    f.write(chunk)
+                    if pbar is not None:
+                        pbar.update(len(chunk))
+        finally:
+            # Record the progress even if the connection is broken
+            f.flush()
+            journal.add_range(start, f.tell())
+        if f.tell() != end:
+            raise IncompleteDownloadError(
+                f"Incomplete range: expected bytes {start}-{end - 1}, "
+                f"but got {start}-{f.tell() - 1}: {url}"
+            )
+
+
 def download(
-    url, output_path, retry: int = 3, chunk_size: int = 8192, quiet: bool = False
+    url,
+    output_path,
+    retry: int = 3,
+    chunk_size: int = 8192,
+    quiet: bool = False,
+    num_workers: int = 1,
+    segment_size: int = 16 * 1024 * 1024,
+    algorithms: Sequence[str] = ("md5", "sha256"),
+    on_data: Callable[[int, bytes], None] = None,
+    session: "requests.Session" = None,
+) -> Dict[str, str]:
+    """Download the file and return the digests of it.
+
+    The digests are computed while the data is streamed, so the file isn't
+    read again after the download. "on_data" receives the data of the file
+    from the beginning in order, e.g. to extract an archive while downloading.
+    A new session is created by create_session() if "session" isn't given.
+    """
+    import requests
+
+    if session is None:
+        session = create_session(retry=retry, pool_size=max(num_workers, 10))
+
+    # The partial data of the previous attempt is reused if existing
+    journal = DownloadJournal(output_path)
+    journal.load(url)
+    hasher = StreamHasher(algorithms, on_data=on_data)
+
+    for trial in range(retry + 1):
+        if journal.is_complete():
+            # Requesting the rest of the complete data fails with 416
+            break
+        try:
+            if num_workers > 1 and _download_ranges(
+                session,
+                url,
+                journal,
+                hasher,
+                chunk_size=chunk_size,
+                quiet=quiet,
+                num_workers=num_workers,
+                segment_size=segment_size,
+            ):
+                break
+            _download_stream(
+                session,
+                url,
+                journal,
+                hasher,
+                chunk_size=chunk_size,
+                quiet=quiet,
+                checkpoint_size=segment_size,
+            )
+            break
+        except (
+            # Errors raised in the middle of the transfer.
+            # The download is resumed from the journal instead of being restarted.
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.Timeout,
+            IncompleteDownloadError,
+        ) as e:
+            if trial == retry:
+                raise
+            warnings.warn(f"Download is interrupted and will be resumed: {e}")
+            time.sleep(get_backoff_time(session, url, trial))
+
+    digests = hasher.hexdigests(journal.part)
+    journal.finalize(output_path)
+    return digests
+
+
+def _resume_headers(journal: DownloadJournal) -> Tuple[int, Dict[str, str]]:
+    # Request the rest of the partial data if existing
+    offset = journal.prefix_size() if journal.url is not None else 0
+    headers = {}
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+        if journal.validator is not None:
+            # The server returns the whole content if the object was modified
+            headers["If-Range"] = journal.validator
+    return offset, headers
+
+
+def _download_stream(
+    session: "requests.Session",
+    url: str,
+    journal: DownloadJournal,
+    hasher: StreamHasher,
+    chunk_size: int,
+    quiet: bool,
+    checkpoint_size: int,
 ):
-    # Set retry
-    session = requests.Session()
-    session.mount("http://", requests.adapters.HTTPAdapter(max_retries=retry))
-    session.mount("https://", requests.adapters.HTTPAdapter(max_retries=retry))
+    offset, headers = _resume_headers(journal)
 
     # Timeout
-    response = session.get(url=url, stream=True, timeout=(10.0, 30.0))
-    file_size = int(response.headers["content-length"])
+    response = session.get(url=url, headers=headers, stream=True)
+
+    if response.status_code == 416 and offset > 0:
+        # The partial data is longer than the remote object, e.g. it was replaced
+        response.close()
+        journal.reset(url, {})
+        return _download_stream(
+            session, url, journal, hasher, chunk_size, quiet, checkpoint_size
+        )
 
     # Raise error when connection error
     response.raise_for_status()
 
-    # Write in temporary file
-    with tempfile.TemporaryDirectory() as d:
-        with (Path(d) / "tmp").open("wb") as f:
-            if quiet:
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        f.write(chunk)
-            else:
-                with tqdm(
-                    desc=url,
-                    total=file_size,
-                    unit="B",
-                    unit_scale=True,
-                    unit_divisor=1024,
-                ) as pbar:
-                    for chunk in response.iter_content(chunk_size=chunk_size):
-                        if chunk:
-                            f.write(chunk)
-                            pbar.update(len(chunk))
-
-        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-        shutil.move(Path(d) / "tmp", output_path)
+    if response.status_code == 206:
+        # e.g. Content-Range: bytes 100-999/1000
+        file_size = int(response.headers["Content-Range"].split("/")[-1])
+        if not journal.is_valid_for(response.headers, file_size):
+            response.close()
+            journal.reset(url, {})
+            return _download_stream(
+                session, url, journal, hasher, chunk_size, quiet, checkpoint_size
+            )
+        # Hash the data downloaded in the previous attempts
+        if hasher.offset > offset:
+            hasher.reset()
+        hasher.catch_up(journal.part, offset)
+    else:
+        offset = 0
+        file_size = response.headers.get("content-length")
+        if file_size is not None:
+            file_size = int(file_size)
+        journal.reset(url, response.headers, file_size)
+        hasher.reset()
+
+    pbar = None
+    if not quiet:
+        from tqdm import tqdm
+
+        pbar = tqdm(
+            desc=url,
+            initial=offset,
+            total=file_size,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+        )
+    with journal.part.open("r+b") as f:
+        f.seek(offset)
+        saved = offset
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    hasher.update(f.tell(), chunk)
+                    f.write(chunk)
+                    if pbar is not None:
+                        pbar.update(len(chunk))
+                    # Checkpoint the progress periodically
+                    if f.tell() - saved >= checkpoint_size:
+                        f.flush()
+                        journal.add_range(0, f.tell())
+                        saved = f.tell()
+        finally:
+            f.flush()
+            journal.add_range(0, f.tell())
+            if pbar is not None:
+                pbar.close()
+        if file_size is not None and f.tell() != file_size:
+            raise IncompleteDownloadError(
+                f"Expected {file_size} bytes, but got {f.tell()} bytes: {url}"
+            )
+        f.truncate()
+
+
+def _download_ranges(
+    session: "requests.Session",
+    url: str,
+    journal: DownloadJournal,
+    hasher: StreamHasher,
+    chunk_size: int,
+    quiet: bool,
+    num_workers: int,
+    segment_size: int,
+) -> bool:
+    # Use ranged download if the server supports it
+    response = session.head(url=url, allow_redirects=True)
+    response.raise_for_status()
+    file_size = int(response.headers.get("content-length", 0))
+    if response.headers.get("accept-ranges", "").lower() != "bytes" or file_size == 0:
+        return False
+
+    if journal.url is None or not journal.is_valid_for(response.headers, file_size):
+        journal.reset(url, response.headers, file_size)
+        hasher.reset()
+
+    # Split the missing parts into segments and fetch them concurrently
+    ranges = [
+        (start, min(start + segment_size, end))
+        for s, end in journal.missing_ranges(file_size)
+        for start in range(s, end, segment_size)
+    ]
+
+    pbar = None
+    if not quiet:
+        from tqdm import tqdm
+
+        pbar = tqdm(
+            desc=url,
+            initial=journal.completed_bytes(),
+            total=file_size,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+        )
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = [
+                executor.submit(
+                    _fetch_range,
+                    session,
+                    response.url,
+                    journal,
+                    hasher,
+                    start,
+                    end,
+                    chunk_size,
+                    pbar,
+                )
+                for start, end in ranges
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        if pbar is not None:
+            pbar.close()
+    return True
 
 
 class ModelDownloader:
     """Download model from zenodo and unpack."""
 
-    def __init__(self, cachedir: Union[Path, str] = None):
+    def __init__(
+        self,
+        cachedir: Union[Path, str] = None,
+        num_workers: int = 1,
+        metadata_ttl: float = 24 * 60 * 60,
+        checksum_manifest: Union[Path, str, Dict[str, str]] = None,
+        max_cache_size: Union[int, str] = None,
+        eviction_policy: str = "lru",
+        dedupe: bool = False,
+        offline: bool = None,
+        session: "requests.Session" = None,
+        table_ttl: float = None,
+        hooks: Sequence[Callable[[dict], None]] = (),
+        lock_timeout: float = None,
+        lease_ttl: float = 60.0,
+        peers: Sequence[str] = None,
+        trust_peer_digests: bool = False,
+        mirrors: Union[Dict[str, Sequence[str]], Path, str] = None,
+        model_cache: ModelCache = None,
+    ):
         if cachedir is None:
             # The default path is the directory of this module
             cachedir = Path(__file__).parent
@@ -104,57 +613,294 @@ class ModelDownloader:
             cachedir = Path(cachedir).expanduser().absolute()
         cachedir.mkdir(parents=True, exist_ok=True)
 
-        csv = Path(__file__).parent / "table.csv"
-        if not csv.exists():
-            download(MODELS_URL, csv)
+        if offline is None:
+            offline = str2bool(os.environ.get(OFFLINE_ENV, "false"))
+        self.offline = offline
+        # The cache directories of the other hosts tried before the origin URLs.
+        # See espnet_model_zoo.peer
+        if peers is None:
+            peers = parse_peers(os.environ.get(PEERS_ENV, ""))
+        self.peers = list(peers)
+        # Accept the files of the peers validated only against the digests
+        # recorded by the peers themselves if the catalog has none
+        self.trust_peer_digests = trust_peer_digests
+        # See espnet_model_zoo.instrumentation for the events given to the hooks
+        self.instrumentation = Instrumentation(hooks)
+        self._session = session
+        self._peer_session = None
+        self._session_lock = threading.Lock()
+        self.num_workers = num_workers
+        # A process fetching an entry holds its lease, and the others wait for
+        # the completion up to "lock_timeout" seconds. See espnet_model_zoo.lease
+        self.lock_timeout = lock_timeout
+        self.lease_ttl = lease_ttl
+
+        self.csv = Path(__file__).parent / "table.csv"
+        # Refresh the model table if older than "table_ttl" seconds
+        self.table_ttl = table_ttl
+        if not self.csv.exists():
+            self.update_model_table()
+        else:
+            self._refresh_model_table_if_expired()
 
         self.cachedir = cachedir
-        self.csv = csv
-        self.data_frame = pd.read_csv(csv, dtype=str)
+        self.metadata_ttl = metadata_ttl
+        # {URL prefix: [The prefixes of the mirrors]}. See espnet_model_zoo.mirror
+        if isinstance(mirrors, (Path, str)):
+            mirrors = read_mirrors_config(mirrors)
+        self.mirrors = {k: list(v) for k, v in (mirrors or {}).items()}
+        self.host_stats = HostStats(cachedir)
+        # The candidates ordered by the latest race: {url: [mirror url]}
+        self._mirror_order = {}
+        if isinstance(checksum_manifest, dict):
+            # {url or file name: sha256}
+            self.checksum_manifest = dict(checksum_manifest)
+        elif checksum_manifest is not None:
+            self.checksum_manifest = read_checksum_manifest(checksum_manifest)
+        else:
+            self.checksum_manifest = {}
+        if isinstance(max_cache_size, str):
+            max_cache_size = parse_size(max_cache_size)
+        self.cache = CacheManager(cachedir, max_cache_size, eviction_policy)
+        # Identical files are shared between the entries by hard links
+        self.blob_store = BlobStore(cachedir / "blobs") if dedupe else None
+        self.table = load_model_table(self.csv)
+        self._data_frame = None
+        # The objects constructed by load_model(). It can be shared by downloaders.
+        if model_cache is None:
+            model_cache = ModelCache(max_models=4)
+        self.model_cache = model_cache
+
+    @property
+    def session(self) -> "requests.Session":
+        """The session reused by all of the network operations"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = create_session(pool_size=max(self.num_workers, 10))
+        return self._session
+
+    @property
+    def peer_session(self) -> "requests.Session":
+        """The session for the peers, which isn't retried so that a peer being
+        down is skipped quickly"""
+        from espnet_model_zoo.peer import PEER_TIMEOUT
+
+        if self._peer_session is None:
+            with self._session_lock:
+                if self._peer_session is None:
+                    self._peer_session = create_session(
+                        pool_size=max(self.num_workers, 10),
+                        retry=0,
+                        timeout=PEER_TIMEOUT,
+                    )
+        return self._peer_session
+
+    @property
+    def data_frame(self):
+        return self.get_data_frame()
 
     def get_data_frame(self):
-        return self.data_frame
-
-    def update_model_table(self):
+        # pandas.DataFrame is created only if it's required
+        if self._data_frame is None:
+            import pandas as pd
+
+            self._data_frame = pd.read_csv(self.csv, dtype=str)
+        return self._data_frame
+
+    def _check_online(self, url: str):
+        if self.offline:
+            raise NotCachedError(
+                f"{url} is not cached and can't be downloaded in the offline mode. "
+                f"Download it beforehand or unset {OFFLINE_ENV}."
+            )
+
+    def update_model_table(self, force: bool = False) -> bool:
+        """Download the model table if it's modified.
+
+        The validators of the last response, i.e. ETag and Last-Modified,
+        are sent as If-None-Match and If-Modified-Since unless "force" is given.
+        Returns True if the table is updated.
+        """
+        from filelock import FileLock
+
+        self._check_online(MODELS_URL)
         lock_file = str(self.csv) + ".lock"
         Path(lock_file).parent.mkdir(parents=True, exist_ok=True)
         with FileLock(lock_file):
-            download(MODELS_URL, self.csv)
+            headers = {} if force else self._get_table_conditions()
+            r = self.session.get(MODELS_URL, headers=headers)
+            r.raise_for_status()
+            updated = self._write_model_table(r.status_code, r.headers, r.content)
+        if updated:
+            self._reload_model_table()
+        return updated
+
+    def _get_table_metadata(self) -> dict:
+        # e.g. <module_dir>/table.csv.json
+        return read_metadata(self.csv.parent, self.csv.name + ".json")
+
+    def _get_table_conditions(self) -> Dict[str, str]:
+        # The headers of the conditional request for the model table
+        headers = {}
+        if self.csv.exists():
+            metadata = self._get_table_metadata()
+            if metadata.get("etag") is not None:
+                headers["If-None-Match"] = metadata["etag"]
+            if metadata.get("last_modified") is not None:
+                headers["If-Modified-Since"] = metadata["last_modified"]
+        return headers
+
+    def _write_model_table(self, status: int, headers, data: bytes) -> bool:
+        # Store the response for the model table and the validators of it
+        name = self.csv.name + ".json"
+        if status == 304:
+            write_metadata(self.csv.parent, name, fetched_at=time.time())
+            return False
+        tmp = Path(f"{self.csv}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, self.csv)
+        write_metadata(
+            self.csv.parent,
+            name,
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+            fetched_at=time.time(),
+        )
+        return True
+
+    def _refresh_model_table_if_expired(self):
+        if self.table_ttl is None or self.offline:
+            return
+        fetched_at = self._get_table_metadata().get("fetched_at")
+        if fetched_at is None:
+            fetched_at = self.csv.stat().st_mtime
+        if time.time() < fetched_at + self.table_ttl:
+            return
+        try:
+            self.update_model_table()
+        except OSError as e:
+            # e.g. requests.exceptions.ConnectionError
+            warnings.warn(f"Failed to refresh the model table: {e}")
+
+    def _reload_model_table(self):
+        self.table = load_model_table(self.csv)
+        self._data_frame = None
 
     def clean_cache(self, name: str = None, version: int = -1, **kwargs: str):
         url = self.get_url(name=name, version=version, **kwargs)
         outdir = self.cachedir / str_to_hash(url)
-        shutil.rmtree(outdir)
-
-    def query(
-        self, key: Union[Sequence[str]] = "name", **kwargs
-    ) -> List[Union[str, Tuple[str]]]:
-        conditions = None
-        for k, v in kwargs.items():
-            if k not in self.data_frame:
-                warnings.warn(
-                    f"Invalid key: {k}: Available keys:\n"
-                    f"{list(self.data_frame.keys())}"
-                )
+        # Wait for the other processes using the entry
+        self.cache.remove(outdir, timeout=-1)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return the total size, the number of hits and the entries of the cache"""
+        return self.cache.stats()
+
+    def _acquire_lease(
+        self, target: Path, is_done: Callable[[], Any], progress: Callable = None
+    ) -> Tuple[Optional[Lease], Any]:
+        start = time.perf_counter()
+        lease, result = acquire_or_wait(
+            target,
+            is_done,
+            timeout=self.lock_timeout,
+            ttl=self.lease_ttl,
+            progress=progress,
+        )
+        self.instrumentation.emit(
+            LOCK_WAIT, path=str(target) + ".lease", duration=time.perf_counter() - start
+        )
+        return lease, result
+
+    def _evict(self, outdir: Path):
+        # Make a room after adding a new entry
+        if self.cache.max_size is not None:
+            if len(self.cache.prune(keep=[outdir])) > 0 and self.blob_store is not None:
+                self.blob_store.gc()
+
+    def _link_from_blob_store(self, url: str, metadata: dict) -> bool:
+        """Reuse the same file downloaded from another url if the digest is known"""
+        if self.blob_store is None:
+            return False
+        outdir = self.cachedir / str_to_hash(url)
+        for algorithm, digest in self._get_expected_digests(url, metadata):
+            sha256 = self.blob_store.lookup(algorithm, digest)
+            if sha256 is not None and self.blob_store.link(
+                sha256, outdir / metadata["filename"]
+            ):
+                with (outdir / "url").open("w", encoding="utf-8") as f:
+                    f.write(url)
+                write_metadata(outdir, digests={"sha256": sha256, algorithm: digest})
+                return True
+        return False
+
+    def _dedupe_unpacked(self, outdir: Path):
+        # The yaml files are excluded because they have the absolute paths
+        if self.blob_store is not None:
+            self.blob_store.ingest_tree(
+                outdir,
+                exclude=["url", ".json", ".lease", ".lock", ".part", ".tmp", ".yaml"],
+            )
+
+    def _valid_conditions(self, conditions: Dict[str, Any]) -> Dict[str, Any]:
+        valid = {}
+        for k, v in conditions.items():
+            if k not in self.table:
+                warnings.warn(f"Invalid key: {k}: Available keys:\n{self.table.keys()}")
                 continue
-            condition = self.data_frame[k] == v
-            if conditions is None:
-                conditions = condition
-            else:
-                conditions &= condition
+            valid[k] = v
+        return valid
 
-        if conditions is not None:
-            df = self.data_frame[conditions]
-        else:
-            df = self.data_frame
-
-        if len(df) == 0:
+    def _get_values(
+        self, key: Union[Sequence[str]], rows: List[int]
+    ) -> List[Union[str, Tuple[str]]]:
+        if len(rows) == 0:
             return []
         else:
             if isinstance(key, (tuple, list)):
-                return list(zip(*[df[k] for k in key]))
+                return self.table.records(key, rows)
+            else:
+                return self.table.column(key, rows)
+
+    def query(
+        self, key: Union[Sequence[str]] = "name", **kwargs
+    ) -> List[Union[str, Tuple[str]]]:
+        """Return the values of the rows matching all of the conditions.
+
+        A condition is a value, a list of the values, or a predicate of
+        espnet_model_zoo.model_table, e.g. d.query(fs=Range(low=16000)).
+        """
+        conditions = self._valid_conditions(kwargs)
+        if all(v is None or isinstance(v, str) for v in conditions.values()):
+            rows = self.table.select(**conditions)
+        else:
+            (rows,) = self.table.select_many([conditions])
+        return self._get_values(key, rows)
+
+    def query_batch(
+        self, queries: Sequence[Query], key: Union[Sequence[str]] = "name"
+    ) -> List[List[Union[str, Tuple[str]]]]:
+        """Return the values for each of the queries evaluated together.
+
+        A query is a dict of the conditions combined with AND, or a list of
+        such dicts combined with OR. See ModelTable.select_many().
+
+        Examples:
+            >>> d.query_batch(
+            ...     [
+            ...         {"task": "asr", "lang": ["en", "ja"]},
+            ...         [{"fs": Range(high=16000)}, {"name": Prefix("kan-bayashi/")}],
+            ...     ]
+            ... )
+        """
+        valid = []
+        for query in queries:
+            if isinstance(query, dict):
+                valid.append(self._valid_conditions(query))
             else:
-                return list(df[key])
+                valid.append([self._valid_conditions(q) for q in query])
+        return [self._get_values(key, rows) for rows in self.table.select_many(valid)]
 
     def get_url(self, name: str = None, version: int = -1, **kwargs: str) -> str:
         if name is None and len(kwargs) == 0:
@@ -168,15 +914,8 @@ class ModelDownloader:
             if name is not None:
                 kwargs["name"] = name
 
-            conditions = None
-            for key, value in kwargs.items():
-                condition = self.data_frame[key] == value
-                if conditions is None:
-                    conditions = condition
-                else:
-                    conditions &= condition
-
-            if len(self.data_frame[conditions]) == 0:
+            rows = self.table.select(**kwargs)
+            if len(rows) == 0:
                 # If Specifying local file path
                 if name is not None and Path(name).exists() and len(kwargs) == 1:
                     url = str(Path(name).absolute())
@@ -184,14 +923,14 @@ class ModelDownloader:
                 else:
                     return "huggingface.co"
             else:
-                urls = self.data_frame[conditions]["url"]
+                urls = self.table.column("url", rows)
                 if version < 0:
                     version = len(urls) + version
-                url = list(urls)[version]
+                url = urls[version]
         return url
 
     @staticmethod
-    def _get_file_name(url):
+    def _get_file_name(url, headers=None, session: "requests.Session" = None):
         ma = re.match(r"https://.*/([^/]*)\?download=[0-9]*$", url)
         if ma is not None:
             # URL e.g.
@@ -200,17 +939,168 @@ class ModelDownloader:
             return a
         else:
             # If not Zenodo
-            r = requests.head(url)
-            if "Content-Disposition" in r.headers:
+            if headers is None:
+                if session is None:
+                    session = create_session()
+                headers = session.head(url).headers
+            if "Content-Disposition" in headers:
                 # e.g. attachment; filename=asr_train_raw_bpe_valid.acc.best.zip
-                for v in r.headers["Content-Disposition"].split(";"):
+                for v in headers["Content-Disposition"].split(";"):
                     if "filename=" in v:
                         return v.split("filename=")[1].strip()
 
             # if not specified or some error happens
             return Path(url).name
 
+    def _get_cached_file(self, url: str) -> Optional[str]:
+        # The file name is known without network access if it's cached.
+        # The digests are recorded after the file is verified.
+        outdir = self.cachedir / str_to_hash(url)
+        metadata = read_metadata(outdir)
+        filename = metadata.get("filename")
+        if (
+            metadata.get("url") == url
+            and filename is not None
+            and metadata.get("digests") is not None
+            and (outdir / filename).exists()
+        ):
+            return str(outdir / filename)
+        return None
+
+    def _get_remote_info(self, url: str) -> dict:
+        """Return the information of the remote file, e.g. filename and checksum.
+
+        The response of HEAD request is stored in <cachedir>/<hash>/metadata.json
+        and reused without network access until its TTL expires.
+        """
+        outdir = self.cachedir / str_to_hash(url)
+        metadata = read_metadata(outdir)
+        if metadata.get("url") == url and (is_fresh(metadata) or self.offline):
+            return metadata
+
+        import requests
+
+        self._check_online(url)
+        # The origin is always asked for its checksum, which validates the
+        # files given by the peers
+        metadata = self._get_remote_info_from_mirrors(url)
+        if metadata is not None:
+            return metadata
+        try:
+            r = self.session.head(url)
+        except requests.exceptions.RequestException:
+            # The peers might have the file even if the origin is unreachable
+            metadata = self._get_remote_info_from_peers(url)
+            if metadata is None:
+                raise
+            return metadata
+        return self._write_remote_info(url, r.headers, r.status_code)
+
+    def _get_mirror_urls(self, url: str) -> List[str]:
+        # The mirrors given by the config and "mirrors" column of table.csv
+        extra = []
+        if "mirrors" in self.table:
+            for v in self.table.column("mirrors", self.table.select(url=url)):
+                if v is not None:
+                    extra += v.split()
+        return get_mirror_urls(url, self.mirrors, extra)
+
+    def _get_remote_info_from_mirrors(self, url: str) -> Optional[dict]:
+        # Race the mirrors and take the fastest response as the remote information
+        urls = self._get_mirror_urls(url)
+        if len(urls) == 1:
+            return None
+        results = race(self.session, urls, stats=self.host_stats)
+        self._mirror_order[url] = [u for u, _ in results]
+        for _, r in results:
+            if r is not None:
+                return self._write_remote_info(url, r.headers, r.status_code)
+        return None
+
+    def _get_mirror_order(self, url: str) -> List[str]:
+        """The candidates to download the file in the order of trial"""
+        urls = self._mirror_order.pop(url, None)
+        if urls is None or len(urls) == 0:
+            urls = self.host_stats.rank(self._get_mirror_urls(url))
+        return urls
+
+    def _download_from_mirrors(
+        self,
+        url: str,
+        output_path: Path,
+        quiet: bool = False,
+        on_data: Callable = None,
+    ) -> Dict[str, str]:
+        """Download the file from the fastest mirror falling back to the others"""
+        import requests
+
+        urls = self._get_mirror_order(url)
+        for i, candidate in enumerate(urls):
+            start = time.perf_counter()
+            try:
+                digests = download(
+                    candidate,
+                    output_path,
+                    quiet=quiet,
+                    num_workers=self.num_workers,
+                    on_data=on_data,
+                    session=self.session,
+                )
+            except (requests.exceptions.RequestException, IncompleteDownloadError) as e:
+                self.host_stats.record_failure(candidate)
+                if i == len(urls) - 1:
+                    raise
+                warnings.warn(f"Failed to download {url} from {candidate}: {e}")
+                continue
+            self.host_stats.record_transfer(
+                candidate, output_path.stat().st_size, time.perf_counter() - start
+            )
+            return digests
+
+    def _get_remote_info_from_peers(self, url: str) -> Optional[dict]:
+        # Used only if the origin is unreachable
+        from espnet_model_zoo.peer import fetch_peer_metadata
+
+        key = str_to_hash(url)
+        for peer in self.peers:
+            metadata = fetch_peer_metadata(self.peer_session, peer, key, url)
+            if metadata is not None:
+                # The checksum given by the peer isn't trusted as the catalog,
+                # so the one of the origin stored before is kept
+                return write_metadata(
+                    self.cachedir / key,
+                    url=url,
+                    filename=metadata["filename"],
+                    size=metadata.get("size"),
+                    etag=metadata.get("etag"),
+                    last_modified=metadata.get("last_modified"),
+                    fetched_at=time.time(),
+                    ttl=self.metadata_ttl,
+                )
+        return None
+
+    def _write_remote_info(self, url: str, headers, status: int = 200) -> dict:
+        # Store the response headers of HEAD request as the metadata
+        if status >= 400:
+            # Don't cache the error. It's raised when downloading.
+            return dict(url=url, filename=self._get_file_name(url, {}))
+        size = headers.get("Content-Length")
+        return write_metadata(
+            self.cachedir / str_to_hash(url),
+            url=url,
+            filename=self._get_file_name(url, headers),
+            size=int(size) if size is not None else None,
+            checksum=headers.get("Content-MD5"),
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+            fetched_at=time.time(),
+            ttl=self.metadata_ttl,
+        )
+
     def unpack_local_file(self, name: str = None) -> Dict[str, Union[str, List[str]]]:
+        from espnet_model_zoo.unpack import get_unpacked_files
+        from espnet_model_zoo.unpack import unpack
+
         if not Path(name).exists():
             raise FileNotFoundError(f"No such file or directory: {name}")
 
@@ -232,20 +1122,31 @@ class ModelDownloader:
 
         # Skip unpacking if the cache exists
         meta_yaml = outdir / "meta.yaml"
-        outdir.mkdir(parents=True, exist_ok=True)
-        lock_file = str(meta_yaml) + ".lock"
-        with FileLock(lock_file):
-            if meta_yaml.exists():
-                info = get_dict_from_cache(meta_yaml)
-                if info is not None:
-                    return info
+        info = get_unpacked_files(outdir)
+        if info is None:
+            # Another process might be unpacking the same model
+            lease, info = self._acquire_lease(
+                meta_yaml, lambda: get_unpacked_files(outdir)
+            )
+        else:
+            lease = None
+        if lease is None:
+            self.cache.touch(outdir)
+            return info
 
+        with lease:
             # Extract files from archived file
-            return unpack(filename, outdir)
+            info = unpack(filename, outdir)
+            self._dedupe_unpacked(outdir)
+            self.cache.touch(outdir)
+        self._evict(outdir)
+        return info
 
     def huggingface_download(
         self, name: str = None, version: int = -1, quiet: bool = False, **kwargs: str
     ) -> str:
+        from huggingface_hub import snapshot_download
+
         # Get huggingface_id from table.csv
         if name is None:
             names = self.query(key="name", **kwargs)
@@ -264,18 +1165,40 @@ class ModelDownloader:
             huggingface_id = name
             revision = None
 
-        return snapshot_download(
-            huggingface_id,
-            revision=revision,
-            library_name="espnet",
-            cache_dir=self.cachedir,
-        )
+        try:
+            with self.instrumentation.phase("huggingface_download", name=name):
+                return snapshot_download(
+                    huggingface_id,
+                    revision=revision,
+                    library_name="espnet",
+                    cache_dir=self.cachedir,
+                    # Resolve the snapshot from the cache without access to the hub
+                    local_files_only=self.offline,
+                )
+        except FileNotFoundError as e:
+            if self.offline:
+                self._check_online(name)
+            raise e
 
     @staticmethod
     def _unpack_cache_dir_for_huggingface(cache_dir: str):
+        from filelock import FileLock
+        import yaml
+
+        from espnet_model_zoo.unpack import get_path_index
+        from espnet_model_zoo.unpack import rewrite_paths
+
         meta_yaml = Path(cache_dir) / "meta.yaml"
         lock_file = Path(cache_dir) / ".lock"
         flag_file = Path(cache_dir) / ".done"
+        # The return value is stored at the first call
+        retval_file = Path(cache_dir) / ".done.json"
+
+        try:
+            with retval_file.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
 
         with meta_yaml.open("r", encoding="utf-8") as f:
             d = yaml.safe_load(f)
@@ -286,19 +1209,20 @@ class ModelDownloader:
             assert isinstance(yaml_files, dict), type(yaml_files)
             assert isinstance(files, dict), type(files)
 
+        retval = {}
+        for key, value in list(yaml_files.items()) + list(files.items()):
+            retval[key] = str(Path(cache_dir) / value)
+
         # Rewrite yaml_files for first case
         with FileLock(lock_file):
             if not flag_file.exists():
+                index = get_path_index(cache_dir)
                 for key, value in yaml_files.items():
                     yaml_file = Path(cache_dir) / value
                     with yaml_file.open("r", encoding="utf-8") as f:
                         d = yaml.safe_load(f)
                         assert isinstance(d, dict), type(d)
-                        for name in Path(cache_dir).glob("**/*"):
-                            name = name.relative_to(Path(cache_dir))
-                            d = find_path_and_change_it_recursive(
-                                d, name, str(Path(cache_dir) / name)
-                            )
+                    d = rewrite_paths(d, index)
 
                     with yaml_file.open("w", encoding="utf-8") as f:
                         yaml.safe_dump(d, f)
@@ -306,15 +1230,17 @@ class ModelDownloader:
                 with flag_file.open("w"):
                     pass
 
-        retval = {}
-        for key, value in list(yaml_files.items()) + list(files.items()):
-            retval[key] = str(Path(cache_dir) / value)
+            tmp = retval_file.with_suffix(f".{os.getpid()}.tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(retval, f)
+            os.replace(tmp, retval_file)
         return retval
 
     def download(
         self, name: str = None, version: int = -1, quiet: bool = False, **kwargs: str
     ) -> str:
-        url = self.get_url(name=name, version=version, **kwargs)
+        with self.instrumentation.phase("get_url", name=name):
+            url = self.get_url(name=name, version=version, **kwargs)
 
         # Support direct huggingface url specification
         if name is not None and name.startswith("https://huggingface.co/"):
@@ -335,44 +1261,220 @@ class ModelDownloader:
         if not is_url(url) and Path(url).exists():
             return url
 
+        return self._download_file(url, quiet=quiet)
+
+    def _download_file(
+        self, url: str, quiet: bool = False, on_data: Callable = None
+    ) -> str:
+        instrumentation = self.instrumentation
         outdir = self.cachedir / str_to_hash(url)
-        filename = self._get_file_name(url)
+        cached = self._get_cached_file(url)
+        instrumentation.emit(CACHE, kind="file", hit=cached is not None, url=url)
+        if cached is not None:
+            self.cache.touch(outdir)
+            return cached
+
+        with instrumentation.phase("remote_info", url=url):
+            metadata = self._get_remote_info(url)
+        filename = metadata["filename"]
         # Download the model file if not existing
         outdir.mkdir(parents=True, exist_ok=True)
-        lock_file = str(outdir / filename) + ".lock"
-        with FileLock(lock_file):
-            if not (outdir / filename).exists():
-                download(url, outdir / filename, quiet=quiet)
+        output_path = outdir / filename
+        journal = DownloadJournal(output_path)
+
+        def _is_done():
+            # Not until the file is verified by the holder of the lease
+            return self._get_cached_file(url)
+
+        def _progress():
+            # Shown to the waiting processes
+            if journal.load(url):
+                return dict(bytes=journal.completed_bytes(), size=journal.size)
+            return None
+
+        lease, _ = self._acquire_lease(output_path, _is_done, _progress)
+        downloaded = False
+        if lease is not None:
+            with lease:
+                # The digests of the previous file must not mark the new one
+                # as verified
+                write_metadata(outdir, digests=None)
+                downloaded = not self._link_from_blob_store(url, metadata)
+                if downloaded and not self._download_from_peers(url, metadata, quiet):
+                    self._check_online(url)
+                    # The digests are computed while downloading
+                    with instrumentation.phase("transfer", url=url) as phase:
+                        digests = self._download_from_mirrors(
+                            url, output_path, quiet=quiet, on_data=on_data
+                        )
+                        phase["bytes"] = output_path.stat().st_size
+                    # Another process might be writing the same file
+                    lease.check()
+                    with instrumentation.phase("verify", url=url):
+                        self._check_downloaded_file(url, metadata, digests)
+        self.cache.touch(outdir)
+        if downloaded:
+            with instrumentation.phase("evict", url=url):
+                self._evict(outdir)
+        return str(outdir / filename)
 
-                # Write the url for debugging
-                with (outdir / "url").open("w", encoding="utf-8") as f:
-                    f.write(url)
+    def _download_from_peers(
+        self, url: str, metadata: dict, quiet: bool = False
+    ) -> bool:
+        """Download the file from the first peer having it.
+
+        The file is validated against the digests in the catalog, i.e. table.csv,
+        the checksum manifest and Content-MD5 of the origin, which is always
+        asked by _get_remote_info() unless it's unreachable. If the catalog has
+        no digests of it, the peers are skipped unless "trust_peer_digests",
+        which validates it against the ones recorded by the peer.
+        """
+        import requests
+
+        from espnet_model_zoo.peer import fetch_peer_metadata
+        from espnet_model_zoo.peer import get_peer_url
+
+        if self.offline:
+            return False
+        instrumentation = self.instrumentation
+        key = str_to_hash(url)
+        filename = metadata["filename"]
+        output_path = self.cachedir / key / filename
+        catalog = self._get_expected_digests(url, metadata)
+        if len(catalog) == 0 and not self.trust_peer_digests:
+            if len(self.peers) > 0:
+                warnings.warn(
+                    f"Not downloading {url} from the peers without the digests in "
+                    "the catalog. Give trust_peer_digests=True to accept the ones "
+                    "recorded by the peers"
+                )
+            return False
+        for peer in self.peers:
+            peer_metadata = fetch_peer_metadata(self.peer_session, peer, key, url)
+            if peer_metadata is None or peer_metadata["filename"] != filename:
+                continue
+            expected = catalog or list(peer_metadata.get("digests", {}).items())
+            try:
+                with instrumentation.phase("transfer", url=url, peer=peer) as phase:
+                    digests = download(
+                        get_peer_url(peer, key, filename),
+                        output_path,
+                        retry=1,
+                        quiet=quiet,
+                        num_workers=self.num_workers,
+                        session=self.peer_session,
+                    )
+                    phase["bytes"] = output_path.stat().st_size
+            except (requests.exceptions.RequestException, IncompleteDownloadError) as e:
+                warnings.warn(f"Failed to download {url} from {peer}: {e}")
+                continue
+            if any(digests.get(a) != v for a, v in expected):
+                output_path.unlink()
+                warnings.warn(f"Checksum mismatch of {url} downloaded from {peer}")
+                continue
+            with instrumentation.phase("verify", url=url):
+                self._check_downloaded_file(url, metadata, digests)
+            return True
+        return False
 
-                r = requests.head(url)
-                if "Content-MD5" in r.headers:
-                    checksum = r.headers["Content-MD5"]
-
-                    # MD5 checksum
-                    sig = hashlib.md5()
-                    chunk_size = 8192
-                    with open(outdir / filename, "rb") as f:
-                        while True:
-                            chunk = f.read(chunk_size)
-                            if len(chunk) == 0:
-                                break
-                            sig.update(chunk)
-
-                    if sig.hexdigest() != checksum:
-                        Path(outdir / filename).unlink()
-                        raise RuntimeError(f"Failed to download file: {url}")
-                else:
-                    warnings.warn("Not validating checksum")
-        return str(outdir / filename)
+    def _check_downloaded_file(self, url: str, metadata: dict, digests: dict):
+        outdir = self.cachedir / str_to_hash(url)
+        filename = metadata["filename"]
+
+        # Write the url for debugging
+        with (outdir / "url").open("w", encoding="utf-8") as f:
+            f.write(url)
+
+        expected = self._get_expected_digests(url, metadata)
+        if len(expected) > 0:
+            if any(digests[a] != v for a, v in expected):
+                Path(outdir / filename).unlink()
+                # The remote file might be changed, so fetch it again
+                write_metadata(outdir, fetched_at=None)
+                raise RuntimeError(f"Failed to download file: {url}")
+        else:
+            warnings.warn("Not validating checksum")
+
+        # Keep the digests to verify the cached file later
+        write_metadata(outdir, digests=digests)
+
+        if self.blob_store is not None:
+            sha256 = self.blob_store.ingest(outdir / filename, digests.get("sha256"))
+            if sha256 is not None and "md5" in digests:
+                self.blob_store.add_alias("md5", digests["md5"], sha256)
+
+    def _get_expected_digests(self, url: str, metadata: dict) -> List[Tuple[str, str]]:
+        """Collect the declared digests of the file as (algorithm, hexdigest)"""
+        expected = []
+        # Content-MD5 given by the server
+        if metadata.get("checksum") is not None:
+            expected.append(("md5", metadata["checksum"]))
+
+        # "md5" or "sha256" column in table.csv
+        rows = self.table.select(url=url)
+        for algorithm in ("md5", "sha256"):
+            if algorithm in self.table:
+                for v in self.table.column(algorithm, rows):
+                    if v is not None:
+                        expected.append((algorithm, v.lower()))
+
+        # Sidecar manifest
+        for key in (url, metadata.get("filename")):
+            if key in self.checksum_manifest:
+                expected.append(("sha256", self.checksum_manifest[key]))
+        return expected
+
+    def verify(self, name: str = None, version: int = -1, **kwargs: str) -> bool:
+        """Verify the cached file by hashing it with memory mapping.
+
+        The digests recorded at the download and the ones declared in table.csv
+        or the checksum manifest are compared.
+        """
+        url = self.get_url(name=name, version=version, **kwargs)
+        outdir = self.cachedir / str_to_hash(url)
+        metadata = read_metadata(outdir)
+        filename = metadata.get("filename")
+        if filename is None or not (outdir / filename).exists():
+            raise FileNotFoundError(f"The file is not cached: {url}")
+
+        expected = list(metadata.get("digests", {}).items())
+        expected += self._get_expected_digests(url, metadata)
+        if len(expected) == 0:
+            raise RuntimeError(f"No digest is known for the file: {url}")
+
+        digests = hash_file(outdir / filename, set(a for a, _ in expected))
+        return all(digests[a] == v for a, v in expected)
+
+    @contextlib.contextmanager
+    def hold(
+        self, name: str = None, version: int = -1, **kwargs: str
+    ) -> Iterator[None]:
+        """Keep the cache entry of the model from being evicted in the block.
+
+        Call download_and_unpack() in the block, because the entry might have
+        been evicted before. The snapshots of Hugging Face aren't evicted.
+
+        Examples:
+            >>> with d.hold("kamo-naoyuki/mini_an4_asr_train_raw_bpe_valid"):
+            ...     info = d.download_and_unpack(
+            ...         "kamo-naoyuki/mini_an4_asr_train_raw_bpe_valid"
+            ...     )
+            ...     speech2text = Speech2Text(**info)
+        """
+        url = self.get_url(name=name, version=version, **kwargs)
+        if url in ["https://huggingface.co", "huggingface.co"] or (
+            name is not None and name.startswith("https://huggingface.co/")
+        ):
+            yield
+            return
+        with self.cache.hold(self.cachedir / str_to_hash(url), ttl=self.lease_ttl):
+            yield
 
     def download_and_unpack(
         self, name: str = None, version: int = -1, quiet: bool = False, **kwargs: str
     ) -> Dict[str, Union[str, List[str]]]:
-        url = self.get_url(name=name, version=version, **kwargs)
+        with self.instrumentation.phase("get_url", name=name):
+            url = self.get_url(name=name, version=version, **kwargs)
         if not is_url(url) and Path(url).exists():
             return self.unpack_local_file(url)
 
@@ -392,28 +1494,302 @@ class ModelDownloader:
             cache_dir = self.huggingface_download(name=name, version=version, **kwargs)
             return self._unpack_cache_dir_for_huggingface(cache_dir)
 
+        from espnet_model_zoo.unpack import get_unpacked_files
+        from espnet_model_zoo.unpack import is_tar
+        from espnet_model_zoo.unpack import TarStreamExtractor
+        from espnet_model_zoo.unpack import unpack
+
+        instrumentation = self.instrumentation
         # Unpack to <cachedir>/<hash> in order to give an unique name
         outdir = self.cachedir / str_to_hash(url)
 
         # Skip downloading and unpacking if the cache exists
         meta_yaml = outdir / "meta.yaml"
-        outdir.mkdir(parents=True, exist_ok=True)
-        lock_file = str(meta_yaml) + ".lock"
-        with FileLock(lock_file):
-            if meta_yaml.exists():
-                info = get_dict_from_cache(meta_yaml)
-                if info is not None:
-                    return info
+        info = get_unpacked_files(outdir)
+        instrumentation.emit(CACHE, kind="unpacked", hit=info is not None, url=url)
+        if info is None:
+            # Another process might be unpacking the same model
+            outdir.mkdir(parents=True, exist_ok=True)
+            lease, info = self._acquire_lease(
+                meta_yaml, lambda: get_unpacked_files(outdir)
+            )
+        else:
+            lease = None
+        if lease is None:
+            self.cache.touch(outdir)
+            return info
+
+        with lease:
+            # A tar file is extracted while downloading
+            extractor = None
+            if self._get_cached_file(url) is None and is_tar(
+                self._get_remote_info(url)["filename"]
+            ):
+                extractor = TarStreamExtractor(outdir)
 
             # Download the file to an unique path
-            filename = self.download(url, quiet=quiet)
-
-            # Extract files from archived file
-            return unpack(filename, outdir)
+            try:
+                filename = self._download_file(
+                    url,
+                    quiet=quiet,
+                    on_data=extractor.feed if extractor is not None else None,
+                )
+            except BaseException:
+                if extractor is not None:
+                    extractor.abort()
+                raise
+
+            with instrumentation.phase("unpack", url=url):
+                if extractor is not None:
+                    info = extractor.close(Path(filename).stat().st_size)
+                if info is None:
+                    # Extract files from archived file
+                    info = unpack(filename, outdir)
+            if self.blob_store is not None:
+                with instrumentation.phase("dedupe", url=url):
+                    self._dedupe_unpacked(outdir)
+        with instrumentation.phase("evict", url=url):
+            self._evict(outdir)
+        return info
+
+    def load_artifacts(
+        self, name: str = None, version: int = -1, quiet: bool = False, **kwargs: str
+    ) -> "ModelArtifacts":
+        """Download and unpack the model, and return the files loading the weights
+        with memory mapping.
+
+        The weight files in the legacy format are converted once in the cache
+        directory, so the processes on a host share the weights in the page cache.
+
+        Examples:
+            >>> artifacts = d.load_artifacts("kamo-naoyuki/mini_an4_asr")
+            >>> state_dict = artifacts.load("asr_model_file")
+        """
+        from espnet_model_zoo.artifacts import convert_for_mmap
+        from espnet_model_zoo.artifacts import is_mmap_compatible
+        from espnet_model_zoo.artifacts import is_weight_file
+        from espnet_model_zoo.artifacts import ModelArtifacts
+
+        info = self.download_and_unpack(name, version, quiet, **kwargs)
+        for path in info.values():
+            if not isinstance(path, str) or not is_weight_file(path):
+                continue
+            path = Path(path)
+            try:
+                outdir = self.cachedir / path.relative_to(self.cachedir).parts[0]
+            except ValueError:
+                continue
+            if not ENTRY_REGEX.match(outdir.name):
+                # The snapshots of Hugging Face, i.e. <cachedir>/models--*, are
+                # symlinks managed by huggingface_hub and left as they are
+                continue
+            if is_mmap_compatible(path):
+                continue
+            # Another process might be converting the same file
+            lease, _ = self._acquire_lease(
+                outdir / "meta.yaml", lambda: True if is_mmap_compatible(path) else None
+            )
+            if lease is None:
+                continue
+            with lease:
+                if convert_for_mmap(path):
+                    self._dedupe_unpacked(outdir)
+        return ModelArtifacts(info)
+
+    def load_model(
+        self,
+        name: str = None,
+        version: int = -1,
+        task: str = None,
+        model_class: Union[type, str] = None,
+        model_kwargs: Dict[str, Any] = None,
+        quiet: bool = False,
+        pin: bool = False,
+        **kwargs: str,
+    ) -> Any:
+        """Construct the inference object of espnet2, e.g. Speech2Text, keeping it
+        in the model cache.
+
+        The class is chosen by "task" in table.csv unless "task" or "model_class"
+        is given. "model_kwargs" is given to the class with the unpacked files.
+        The object is never evicted from the model cache if "pin".
+
+        Examples:
+            >>> speech2text = d.load_model(
+            ...     "kamo-naoyuki/mini_an4_asr_train_raw_bpe_valid.acc.best",
+            ...     model_kwargs=dict(device="cuda", beam_size=10),
+            ... )
+        """
+        from espnet_model_zoo.artifacts import is_weight_file
+
+        if name is None and task is not None:
+            # Select the model of the task, e.g. a corpus has both asr and tts
+            kwargs = dict(kwargs, task=task)
+        if model_class is None:
+            if task is None:
+                conditions = dict(kwargs) if name is None else dict(kwargs, name=name)
+                tasks = set(self.query("task", **conditions)) - {None, ""}
+                if len(tasks) != 1:
+                    raise RuntimeError(
+                        f"The task of the model is unknown. Give task or model_class: "
+                        f"{name}"
+                    )
+                (task,) = tasks
+            if task not in TASK_CLASSES:
+                raise ValueError(f"task must be one of {list(TASK_CLASSES)}: {task}")
+            model_class = TASK_CLASSES[task]
+        if isinstance(model_class, str):
+            model_class = import_class(model_class)
+        if model_kwargs is None:
+            model_kwargs = {}
+
+        # The objects are keyed by the URL resolved from table.csv without
+        # network access, so a cached object is returned without downloading
+        # or unpacking anything
+        url = self.get_url(name=name, version=version, **kwargs)
+        if url == "huggingface.co":
+            # Resolved by huggingface_download() from the arguments
+            request = (name, version, tuple(sorted(kwargs.items())))
+        else:
+            request = (url,)
+        key = (
+            f"{model_class.__module__}.{model_class.__qualname__}",
+            str(self.cachedir),
+            request,
+            json.dumps(model_kwargs, sort_keys=True, default=repr),
+        )
+        info = {}
+
+        def _load() -> Any:
+            # Not evicted by the other threads or processes while loading
+            with self.hold(name, version, **kwargs):
+                info.update(self.download_and_unpack(name, version, quiet, **kwargs))
+                return model_class(**info, **model_kwargs)
+
+        def _size_of(obj) -> int:
+            # The size of the weight files if no torch modules are found
+            size = estimate_memory(obj)
+            if size == 0:
+                size = sum(
+                    os.path.getsize(v)
+                    for v in info.values()
+                    if isinstance(v, str) and is_weight_file(v)
+                )
+            return size
+
+        return self.model_cache.get_or_load(key, _load, _size_of, pin=pin)
+
+    def prefetch(
+        self,
+        names_or_conditions: Sequence[Union[str, Dict[str, str]]],
+        max_workers: int = 4,
+        unpack_workers: int = None,
+        unpack: bool = True,
+        quiet: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """Download and unpack many models concurrently to warm the cache.
+
+        Each item is either a model name (or URL) or a dict of query conditions,
+        which selects all of the matching models. Models sharing the same URL
+        are downloaded only once. The downloads run with "max_workers" threads
+        and the unpacking with "unpack_workers" threads.
+
+        Returns a report for each model, containing "name", "url", "path",
+        "bytes", "cached", "download_time", "unpack_time" and "error".
+        """
+        # Resolve the models
+        reports = []
+        for item in names_or_conditions:
+            if isinstance(item, dict):
+                for name, url in self.query(["name", "url"], **item):
+                    reports.append(dict(name=name, url=url))
+            else:
+                url = self.get_url(item)
+                reports.append(dict(name=item, url=url))
+
+        # Dedupe the models sharing the same file.
+        # The rows of table.csv are fetched by the URL, not to take the latest
+        # version of the name.
+        groups = {}
+        for report in reports:
+            url = report["url"]
+            if not is_url(url) or url.startswith("https://huggingface.co"):
+                # Hugging Face models are identified by the names
+                key = report["name"]
+            else:
+                key = url
+            groups.setdefault(key, []).append(report)
+
+        # The entries are held from the downloading until the unpacking,
+        # so they aren't evicted by the other threads in between
+        holds = {key: contextlib.ExitStack() for key in groups}
+
+        def _download(key: str) -> dict:
+            url = self.get_url(key)
+            holds[key].enter_context(self.hold(key))
+            start = time.perf_counter()
+            cached = is_url(url) and self._get_cached_file(url) is not None
+            path = self.download(key, quiet=quiet)
+            size = 0
+            for p in [Path(path)] + list(Path(path).glob("**/*")):
+                if p.is_file():
+                    size += p.stat().st_size
+            return dict(
+                path=path,
+                bytes=size,
+                cached=cached,
+                download_time=time.perf_counter() - start,
+            )
+
+        def _unpack(key: str) -> dict:
+            with holds[key]:
+                start = time.perf_counter()
+                info = self.download_and_unpack(key, quiet=quiet)
+            return dict(info=info, unpack_time=time.perf_counter() - start)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as download_pool:
+            with ThreadPoolExecutor(max_workers=unpack_workers) as unpack_pool:
+                futures = {
+                    download_pool.submit(_download, key): (key, group)
+                    for key, group in groups.items()
+                }
+                unpack_futures = {}
+                for future in as_completed(futures):
+                    key, group = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = dict(error=f"{type(e).__name__}: {e}")
+                    for report in group:
+                        report.update(result)
+                    if unpack and "error" not in result:
+                        f = unpack_pool.submit(_unpack, key)
+                        unpack_futures[f] = group
+                    else:
+                        holds[key].close()
+
+                for future in as_completed(unpack_futures):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = dict(error=f"{type(e).__name__}: {e}")
+                    for report in unpack_futures[future]:
+                        report.update(result)
+
+        for report in reports:
+            report.setdefault("error", None)
+        return reports
 
 
 def str2bool(v) -> bool:
-    return bool(strtobool(v))
+    # Same as distutils.util.strtobool, which is slow to import and deprecated
+    v = v.lower()
+    if v in ("y", "yes", "t", "true", "on", "1"):
+        return True
+    elif v in ("n", "no", "f", "false", "off", "0"):
+        return False
+    else:
+        raise ValueError(f"invalid truth value {v}")
 
 
 def cmd_download(cmd=None):
@@ -435,9 +1811,16 @@ def cmd_download(cmd=None):
         default=False,
         help="Unpack the archived file after downloading.",
     )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="The number of connections to download a file in parallel. "
+        "Ranged requests are used if the server supports them.",
+    )
     args = parser.parse_args(cmd)
 
-    d = ModelDownloader(args.cachedir)
+    d = ModelDownloader(args.cachedir, num_workers=args.num_workers)
     if args.unpack:
         print(d.download_and_unpack(args.name))
     else:
@@ -454,7 +1837,10 @@ def cmd_query(cmd=None):
         nargs="*",
         default=[],
         help="Given desired condition in form of <key>=<value>. "
-        "e.g. fs=16000. "
+        "e.g. fs=16000, lang=en,ja (one of them), fs>=16000, "
+        "name^=kan-bayashi/ (prefix), name~=conformer (regular expression). "
+        'The conditions are combined with AND, and the groups separated by "or" '
+        "are combined with OR. "
         "If no condition is given, you can view all available models",
     )
     parser.add_argument(
@@ -462,13 +1848,255 @@ def cmd_query(cmd=None):
         default="name",
         help="The key name you want",
     )
+    parser.add_argument(
+        "--batch",
+        help="A file of the queries in the same form, one query per line, "
+        'or "-" for stdin. The results of each query follow "# <query>".',
+    )
+    parser.add_argument(
+        "--cachedir",
+        help="Specify cache dir. By default, download to module root.",
+    )
+    args = parser.parse_args(cmd)
+
+    try:
+        queries = [parse_query(args.condition)]
+        if args.batch is not None:
+            import shlex
+
+            if args.batch == "-":
+                lines = sys.stdin.readlines()
+            else:
+                with open(args.batch, "r", encoding="utf-8") as f:
+                    lines = f.readlines()
+            lines = [line.strip() for line in lines]
+            lines = [line for line in lines if line != "" and line[0] != "#"]
+            queries = [parse_query(shlex.split(line)) for line in lines]
+    except ValueError as e:
+        parser.error(str(e))
+
+    d = ModelDownloader(args.cachedir)
+    results = d.query_batch(queries, args.key)
+    if args.batch is None:
+        for v in results[0]:
+            print(v)
+    else:
+        for line, values in zip(lines, results):
+            print(f"# {line}")
+            for v in values:
+                print(v)
+
+
+def cmd_prefetch(cmd=None):
+    # espnet_model_zoo_prefetch
+
+    parser = argparse.ArgumentParser("Download and unpack many models concurrently")
+    parser.add_argument(
+        "name",
+        nargs="*",
+        default=[],
+        help="URL or model name in the form of <username>/<model name>.",
+    )
+    parser.add_argument(
+        "--condition",
+        nargs="+",
+        action="append",
+        default=[],
+        help="Select all models matching the conditions "
+        "in form of <key>=<value>. e.g. --condition task=asr lang=en",
+    )
+    parser.add_argument(
+        "--manifest",
+        help="A file listing a model name or conditions in form of "
+        "<key>=<value> separated by spaces per line",
+    )
+    parser.add_argument(
+        "--cachedir",
+        help="Specify cache dir. By default, download to module root.",
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=4,
+        help="The number of models downloaded in parallel",
+    )
+    parser.add_argument(
+        "--unpack_workers",
+        type=int,
+        default=None,
+        help="The number of models unpacked in parallel. "
+        "By default, decided by the number of CPUs",
+    )
+    parser.add_argument(
+        "--unpack",
+        type=str2bool,
+        default=True,
+        help="Unpack the archived files after downloading.",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="The number of connections to download a file in parallel.",
+    )
+    args = parser.parse_args(cmd)
+
+    items = list(args.name)
+    items += [dict(s.split("=", 1) for s in c) for c in args.condition]
+    if args.manifest is not None:
+        with open(args.manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line == "" or line.startswith("#"):
+                    continue
+                if is_url(line) or "=" not in line:
+                    items.append(line)
+                else:
+                    items.append(dict(s.split("=", 1) for s in line.split()))
+    if len(items) == 0:
+        parser.error("No models are given")
+
+    d = ModelDownloader(args.cachedir, num_workers=args.num_workers)
+    reports = d.prefetch(
+        items,
+        max_workers=args.max_workers,
+        unpack_workers=args.unpack_workers,
+        unpack=args.unpack,
+    )
+
+    failed = False
+    for r in reports:
+        if r["error"] is not None:
+            print(f"{r['name']}: FAILED: {r['error']}")
+            failed = True
+        else:
+            print(
+                f"{r['name']}: {'cached' if r['cached'] else 'downloaded'} "
+                f"{r['bytes']} bytes, download={r['download_time']:.2f}s"
+                + (f", unpack={r['unpack_time']:.2f}s" if "unpack_time" in r else "")
+            )
+    if failed:
+        sys.exit(1)
+
+
+def cmd_verify(cmd=None):
+    # espnet_model_zoo_verify
+
+    parser = argparse.ArgumentParser("Verify the checksum of cached files")
+    parser.add_argument(
+        "name",
+        nargs="+",
+        help="URL or model name in the form of <username>/<model name>.",
+    )
+    parser.add_argument(
+        "--cachedir",
+        help="Specify cache dir. By default, download to module root.",
+    )
+    parser.add_argument(
+        "--checksum_manifest",
+        help="A manifest in the format of sha256sum, "
+        "containing the digests of the urls or the file names",
+    )
+    args = parser.parse_args(cmd)
+
+    d = ModelDownloader(args.cachedir, checksum_manifest=args.checksum_manifest)
+    failed = False
+    for name in args.name:
+        if d.verify(name):
+            print(f"{name}: OK")
+        else:
+            print(f"{name}: FAILED")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+def cmd_cache(cmd=None):
+    # espnet_model_zoo_cache
+
+    parser = argparse.ArgumentParser("List and prune the cached models")
     parser.add_argument(
         "--cachedir",
         help="Specify cache dir. By default, download to module root.",
     )
+    parser.add_argument(
+        "--policy",
+        choices=["lru", "lfu"],
+        default="lru",
+        help="The order of eviction: least recently used or least frequently used",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    subparsers.add_parser("list", help="List the entries in the eviction order")
+    subparsers.add_parser(
+        "gc", help="Remove the deduplicated files not used by any entries"
+    )
+    prune_parser = subparsers.add_parser(
+        "prune", help="Remove the entries until the total size is within max_size"
+    )
+    prune_parser.add_argument(
+        "--max_size",
+        type=parse_size,
+        required=True,
+        help="The maximum size of the cache in bytes, e.g. 500M, 10G",
+    )
     args = parser.parse_args(cmd)
 
-    conditions = dict(s.split("=") for s in args.condition)
+    d = ModelDownloader(args.cachedir, eviction_policy=args.policy, dedupe=True)
+    if args.command == "list":
+        stats = d.cache_stats()
+        for e in stats["entries"]:
+            last_access = time.strftime(
+                "%Y-%m-%d %H:%M:%S", time.localtime(e["last_access"])
+            )
+            print(
+                f"{format_size(e['size'])}\t{e['hits']}\t{last_access}\t"
+                f"{Path(e['path']).name}\t{e['url']}"
+            )
+        print(
+            f"Total: {format_size(stats['size'])} "
+            f"in {stats['num_entries']} entries, {stats['hits']} hits"
+        )
+    elif args.command == "prune":
+        for e in d.cache.prune(args.max_size):
+            print(
+                f"Removed {Path(e['path']).name} ({format_size(e['size'])}): {e['url']}"
+            )
+        d.blob_store.gc()
+    else:
+        result = d.blob_store.gc()
+        print(f"Removed {result['removed']} files ({format_size(result['freed'])})")
+
+
+def cmd_serve_cache(cmd=None):
+    # espnet_model_zoo_serve_cache
+
+    parser = argparse.ArgumentParser(
+        "Serve the cache directory to the other hosts. "
+        f"Give the URL to ModelDownloader(peers=...) or {PEERS_ENV} of them."
+    )
+    parser.add_argument(
+        "--cachedir",
+        help="Specify cache dir. By default, download to module root.",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="The address to bind. Give 0.0.0.0 to serve the other hosts",
+    )
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(cmd)
+
+    from espnet_model_zoo.peer import serve_cache
+
     d = ModelDownloader(args.cachedir)
-    for v in d.query(args.key, **conditions):
-        print(v)
+    server = serve_cache(d.cachedir, args.port, args.host)
+    host, port = server.server_address[:2]
+    print(f"Serving {d.cachedir} at http://{host}:{port}/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,230 @@
+"""Events of ModelDownloader to find where the time goes.
+
+A hook is a callable receiving each event as a dict, which must not be modified.
+All events have "event" and "timestamp", and the other fields depend on the event:
+
+- phase_start: "phase" and the fields identifying the target, e.g. "url"
+- phase_end: Same as phase_start, and "duration" in seconds,
+  "bytes" and "throughput" in bytes per second if transferred,
+  and "error" if an exception is raised
+- cache: "kind", i.e. "file" or "unpacked", "hit" and "url"
+- lock_wait: "path" of the lease file and "duration" to acquire the lease
+  or to wait for another process fetching the target
+
+The phases are get_url, remote_info, transfer, verify, unpack, dedupe, evict
+and huggingface_download.
+
+Examples:
+    >>> exporter = PrometheusExporter()
+    >>> exporter.serve(9100)
+    >>> d = ModelDownloader(hooks=[JsonLinesRecorder("events.jsonl"), exporter])
+"""
+
+import contextlib
+import json
+from pathlib import Path
+import threading
+import time
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import Sequence
+from typing import TextIO
+from typing import Tuple
+from typing import TYPE_CHECKING
+from typing import Union
+import warnings
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+
+PHASE_START = "phase_start"
+PHASE_END = "phase_end"
+CACHE = "cache"
+LOCK_WAIT = "lock_wait"
+
+
+class Instrumentation:
+    """Emit the events to the hooks.
+
+    Nothing is measured if no hooks are registered.
+    """
+
+    def __init__(self, hooks: Sequence[Callable[[dict], None]] = ()):
+        self.hooks = list(hooks)
+
+    def emit(self, event: str, **fields):
+        if len(self.hooks) == 0:
+            return
+        record = dict(event=event, timestamp=time.time(), **fields)
+        for hook in list(self.hooks):
+            try:
+                hook(record)
+            except Exception as e:
+                # The instrumentation must not break the downloads
+                warnings.warn(f"Instrumentation hook failed: {e!r}")
+
+    @contextlib.contextmanager
+    def phase(self, phase: str, **fields) -> Iterator[dict]:
+        """Emit phase_start and phase_end around the block.
+
+        The fields set to the yielded dict, e.g. "bytes", are added to phase_end.
+        """
+        extra = {}
+        if len(self.hooks) == 0:
+            yield extra
+            return
+
+        self.emit(PHASE_START, phase=phase, **fields)
+        start = time.perf_counter()
+        try:
+            yield extra
+        except BaseException as e:
+            extra["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            if extra.get("bytes") is not None and duration > 0:
+                extra["throughput"] = extra["bytes"] / duration
+            self.emit(
+                PHASE_END, phase=phase, duration=duration, **dict(fields, **extra)
+            )
+
+
+class JsonLinesRecorder:
+    """Write each event as a line of JSON.
+
+    Examples:
+        >>> with JsonLinesRecorder("events.jsonl") as recorder:
+        ...     d = ModelDownloader(hooks=[recorder])
+    """
+
+    def __init__(self, file: Union[Path, str, TextIO]):
+        if isinstance(file, (Path, str)):
+            self.file = open(file, "a", encoding="utf-8")
+            self._owned = True
+        else:
+            self.file = file
+            self._owned = False
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict):
+        line = json.dumps(event, default=str) + "\n"
+        with self._lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        if self._owned:
+            self.file.close()
+
+    def __enter__(self) -> "JsonLinesRecorder":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# name: (type, help)
+METRICS = {
+    "phase_seconds_total": ("counter", "Seconds spent in each phase"),
+    "phase_total": ("counter", "Number of the completed phases"),
+    "phase_errors_total": ("counter", "Number of the phases raising an exception"),
+    "bytes_total": ("counter", "Bytes transferred in each phase"),
+    "cache_requests_total": ("counter", "Number of the cache lookups"),
+    "lock_wait_seconds_total": ("counter", "Seconds waiting for the leases"),
+    "lock_acquisitions_total": ("counter", "Number of the leases waited for"),
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusExporter:
+    """Accumulate the events as counters exposed in the text format of Prometheus.
+
+    Examples:
+        >>> exporter = PrometheusExporter()
+        >>> d = ModelDownloader(hooks=[exporter])
+        >>> print(exporter.render())
+        # HELP espnet_model_zoo_phase_seconds_total Seconds spent in each phase
+        # TYPE espnet_model_zoo_phase_seconds_total counter
+        espnet_model_zoo_phase_seconds_total{phase="transfer"} 1.5
+        ...
+    """
+
+    def __init__(self, prefix: str = "espnet_model_zoo"):
+        self.prefix = prefix
+        # {name: {labels: value}}
+        self._counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+        self._lock = threading.Lock()
+
+    def _inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + value
+
+    def __call__(self, event: dict):
+        if event["event"] == PHASE_END:
+            phase = event["phase"]
+            self._inc("phase_seconds_total", event["duration"], phase=phase)
+            self._inc("phase_total", phase=phase)
+            if "error" in event:
+                self._inc("phase_errors_total", phase=phase)
+            if event.get("bytes") is not None:
+                self._inc("bytes_total", event["bytes"], phase=phase)
+        elif event["event"] == CACHE:
+            result = "hit" if event["hit"] else "miss"
+            self._inc("cache_requests_total", kind=event["kind"], result=result)
+        elif event["event"] == LOCK_WAIT:
+            self._inc("lock_wait_seconds_total", event["duration"])
+            self._inc("lock_acquisitions_total")
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, counter in self._counters.items():
+                metric_type, description = METRICS[name]
+                full_name = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {full_name} {description}")
+                lines.append(f"# TYPE {full_name} {metric_type}")
+                for labels, value in sorted(counter.items()):
+                    if len(labels) > 0:
+                        s = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                        lines.append(f"{full_name}{{{s}}} {value}")
+                    else:
+                        lines.append(f"{full_name} {value}")
+        return "".join(line + "\n" for line in lines)
+
+    def serve(self, port: int = 0, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+        """Serve the counters at http://<host>:<port>/metrics in a thread.
+
+        Call shutdown() of the returned server to stop it.
+        """
+        from http.server import BaseHTTPRequestHandler
+        from http.server import ThreadingHTTPServer
+
+        exporter = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,254 @@
+"""Coordinate the processes fetching the same cache entry with leases.
+
+A process fetching a file takes the lease of it, i.e. <target>.lease holding
+its PID, host name and expiry, instead of holding a file lock during the fetch.
+The holder renews the lease in a thread, and the other processes poll for
+the completion of the target with a timeout instead of blocking.
+If the holder crashed, i.e. the PID doesn't exist on the same host
+or the lease isn't renewed until its expiry, the lease is taken over and
+the fetch is done again, e.g. resumed from the partial download.
+
+<target>.lock, which is also taken by CacheManager.remove(), is held only
+while reading and writing the lease file.
+The hosts sharing a cache directory must have synchronized clocks.
+"""
+
+import json
+import os
+from pathlib import Path
+import socket
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Optional
+from typing import Tuple
+from typing import Union
+import uuid
+
+
+LEASE_SUFFIX = ".lease"
+
+
+class LeaseTimeout(TimeoutError):
+    def __init__(self, message: str, holder: Optional[dict] = None):
+        super().__init__(message)
+        # The content of the lease file, e.g. "pid", "host" and "progress"
+        self.holder = holder
+
+
+class LeaseLost(RuntimeError):
+    pass
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Owned by another user
+        return True
+    return True
+
+
+def read_lease(path: Union[Path, str]) -> Optional[dict]:
+    """Read the lease file. Returns None if not existing or broken."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lease = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(lease, dict):
+        return None
+    return lease
+
+
+def is_stale(lease: dict, now: float = None) -> bool:
+    """Whether the lease is expired or its holder doesn't exist"""
+    if now is None:
+        now = time.time()
+    if now >= lease.get("expires_at", 0):
+        return True
+    if lease.get("host") == socket.gethostname() and not _is_alive(lease["pid"]):
+        return True
+    return False
+
+
+class Lease:
+    """The lease of a target file, e.g. <cachedir>/<hash>/meta.yaml.
+
+    Examples:
+        >>> lease = Lease("cache/<hash>/model.zip", ttl=60)
+        >>> if lease.try_acquire():
+        ...     with lease:
+        ...         download(url, "cache/<hash>/model.zip")
+    """
+
+    def __init__(
+        self,
+        target: Union[Path, str],
+        ttl: float = 60.0,
+        progress: Callable[[], Any] = None,
+    ):
+        self.target = Path(target)
+        self.path = Path(str(target) + LEASE_SUFFIX)
+        self.lock_file = str(target) + ".lock"
+        self.ttl = ttl
+        # Recorded in the lease for the waiting processes
+        self.progress = progress
+        self.token = uuid.uuid4().hex
+        self.holder = None
+        self.lost = False
+        self._stop = None
+        self._thread = None
+
+    @property
+    def acquired(self) -> bool:
+        return self._thread is not None
+
+    def _write(self):
+        now = time.time()
+        lease = dict(
+            token=self.token,
+            pid=os.getpid(),
+            host=socket.gethostname(),
+            renewed_at=now,
+            expires_at=now + self.ttl,
+            progress=self.progress() if self.progress is not None else None,
+        )
+        tmp = self.path.parent / f"{self.path.name}.{self.token}.tmp"
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(lease, f)
+        os.replace(tmp, self.path)
+
+    def try_acquire(self, timeout: float = -1) -> bool:
+        """Take the lease if it's free or stale.
+
+        "timeout" is for the lock file, which is held only for a moment.
+        """
+        from filelock import FileLock
+        from filelock import Timeout
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with FileLock(self.lock_file, timeout=timeout):
+                holder = read_lease(self.path)
+                if holder is not None and not is_stale(holder):
+                    self.holder = holder
+                    return False
+                self._write()
+        except Timeout:
+            return False
+
+        self.holder = None
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self._thread.start()
+        return True
+
+    def renew(self) -> bool:
+        """Extend the expiry. Returns False if the lease was taken over."""
+        from filelock import FileLock
+        from filelock import Timeout
+
+        try:
+            with FileLock(self.lock_file, timeout=self.ttl / 3):
+                holder = read_lease(self.path)
+                if holder is None or holder.get("token") != self.token:
+                    return False
+                self._write()
+        except Timeout:
+            # Retry at the next heartbeat
+            pass
+        return True
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.ttl / 3):
+            if not self.renew():
+                self.lost = True
+                break
+
+    def check(self):
+        """Raise LeaseLost if the lease was taken over, e.g. after a long stall"""
+        if self.lost:
+            raise LeaseLost(f"The lease was taken over by another process: {self.path}")
+
+    def release(self):
+        from filelock import FileLock
+
+        if not self.acquired:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        with FileLock(self.lock_file):
+            holder = read_lease(self.path)
+            if holder is not None and holder.get("token") == self.token:
+                self.path.unlink()
+
+    def __enter__(self) -> "Lease":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def try_lease(
+    target: Union[Path, str],
+    is_done: Callable[[], Any],
+    ttl: float = 60.0,
+    progress: Callable[[], Any] = None,
+) -> Tuple[Optional[Lease], Any]:
+    """Check the completion and try to take the lease once without waiting.
+
+    "is_done" returns a value other than None if the target is ready.
+    Returns (None, the value of is_done()) if done, or (lease, None) otherwise,
+    where lease.acquired is False if it's held by another process.
+    """
+    result = is_done()
+    if result is not None:
+        return None, result
+    lease = Lease(target, ttl=ttl, progress=progress)
+    if lease.try_acquire(timeout=0):
+        # Check again because it might be done before taking the lease
+        result = is_done()
+        if result is not None:
+            lease.release()
+            return None, result
+    return lease, None
+
+
+def acquire_or_wait(
+    target: Union[Path, str],
+    is_done: Callable[[], Any],
+    timeout: float = None,
+    ttl: float = 60.0,
+    progress: Callable[[], Any] = None,
+    poll_interval: float = 0.05,
+    max_poll_interval: float = 1.0,
+) -> Tuple[Optional[Lease], Any]:
+    """Take the lease of the target unless it's done by another process.
+
+    Returns the acquired lease or the value of is_done() as try_lease().
+    LeaseTimeout is raised if neither happens within "timeout" seconds.
+    """
+    start = time.monotonic()
+    while True:
+        lease, result = try_lease(target, is_done, ttl=ttl, progress=progress)
+        if lease is None or lease.acquired:
+            return lease, result
+        check_timeout(lease, start, timeout)
+        time.sleep(poll_interval)
+        poll_interval = min(poll_interval * 2, max_poll_interval)
+
+
+def check_timeout(lease: Lease, start: float, timeout: float = None):
+    """Raise LeaseTimeout if waiting for the lease since "start" too long"""
+    if timeout is not None and time.monotonic() - start >= timeout:
+        raise LeaseTimeout(
+            f"Timed out waiting for {lease.target} fetched by another process: "
+            f"{lease.holder}",
+            lease.holder,
+        )
@@ -0,0 +1,207 @@
+"""Select the fastest of the mirrors of a model.
+
+The mirrors of a URL are given by a config mapping the URL prefixes to the ones
+of the mirrors, or by "mirrors" column of table.csv listing the URLs
+separated by spaces. The candidates are raced by HEAD requests when fetching
+the remote information, and the downloads fall back to the next candidate
+on failure. The throughput of each host is recorded in <cachedir>/hosts.json
+and used to order the candidates in the later runs.
+
+Examples:
+    >>> d = ModelDownloader(
+    ...     mirrors={"https://zenodo.org/": ["https://mirror.example.com/zenodo/"]}
+    ... )
+"""
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from pathlib import Path
+import threading
+import time
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import TYPE_CHECKING
+from typing import Union
+from urllib.parse import urlsplit
+
+from espnet_model_zoo.cache import read_metadata
+from espnet_model_zoo.cache import write_metadata
+
+if TYPE_CHECKING:
+    import requests
+
+
+HOSTS_FILE = "hosts.json"
+
+# The weight of the latest sample in the moving averages
+EWMA_ALPHA = 0.3
+
+# A host failed within this seconds is tried last
+FAILURE_PENALTY = 10 * 60
+
+
+def read_mirrors_config(path: Union[Path, str]) -> Dict[str, List[str]]:
+    """Read a YAML file mapping the URL prefixes to the ones of the mirrors
+
+    Examples:
+        https://zenodo.org/:
+          - https://mirror1.example.com/zenodo/
+          - https://mirror2.example.com/zenodo/
+    """
+    import yaml
+
+    with open(path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    if not isinstance(config, dict):
+        raise RuntimeError(f"The mirrors config must be a mapping: {path}")
+    return {k: [v] if isinstance(v, str) else list(v) for k, v in config.items()}
+
+
+def get_mirror_urls(
+    url: str, config: Dict[str, List[str]], extra: Sequence[str] = ()
+) -> List[str]:
+    """Return the URLs of the file starting with the original one"""
+    urls = [url]
+    for prefix, mirrors in config.items():
+        if url.startswith(prefix):
+            urls += [m + url[len(prefix) :] for m in mirrors]
+    urls += extra
+    # Remove the duplicates keeping the order
+    return list(dict.fromkeys(urls))
+
+
+def get_host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def _ewma(old: Optional[float], new: float) -> float:
+    if old is None:
+        return new
+    return EWMA_ALPHA * new + (1 - EWMA_ALPHA) * old
+
+
+class HostStats:
+    """The latency and the throughput of the hosts kept in <cachedir>/hosts.json.
+
+    The read-modify-write isn't locked between the processes, so concurrent
+    updates might be lost, which is enough for ordering the mirrors.
+    """
+
+    def __init__(self, cachedir: Union[Path, str]):
+        self.cachedir = Path(cachedir)
+        self._lock = threading.Lock()
+
+    def get(self, host: str) -> dict:
+        return read_metadata(self.cachedir, HOSTS_FILE).get(host, {})
+
+    def _update(self, host: str, **kwargs):
+        with self._lock:
+            stats = self.get(host)
+            stats.update(kwargs)
+            write_metadata(self.cachedir, HOSTS_FILE, **{host: stats})
+
+    def record_latency(self, url: str, latency: float):
+        host = get_host(url)
+        self._update(host, latency=_ewma(self.get(host).get("latency"), latency))
+
+    def record_transfer(self, url: str, size: int, duration: float):
+        if duration <= 0:
+            return
+        host = get_host(url)
+        stats = self.get(host)
+        self._update(
+            host,
+            throughput=_ewma(stats.get("throughput"), size / duration),
+            successes=stats.get("successes", 0) + 1,
+            last_failure=None,
+        )
+
+    def record_failure(self, url: str):
+        host = get_host(url)
+        self._update(
+            host,
+            failures=self.get(host).get("failures", 0) + 1,
+            last_failure=time.time(),
+        )
+
+    def rank(self, urls: Sequence[str]) -> List[str]:
+        """Order the URLs by the throughput of their hosts.
+
+        The unknown hosts follow the known ones in the given order,
+        and the hosts failed recently are put last.
+        """
+        hosts = read_metadata(self.cachedir, HOSTS_FILE)
+        now = time.time()
+
+        def _key(i: int) -> Tuple[int, float, int]:
+            stats = hosts.get(get_host(urls[i]), {})
+            last_failure = stats.get("last_failure")
+            if last_failure is not None and now - last_failure < FAILURE_PENALTY:
+                return (2, 0.0, i)
+            if stats.get("throughput") is not None:
+                return (0, -stats["throughput"], i)
+            return (1, 0.0, i)
+
+        return [urls[i] for i in sorted(range(len(urls)), key=_key)]
+
+
+def race(
+    session: "requests.Session",
+    urls: Sequence[str],
+    grace: float = 0.2,
+    stats: HostStats = None,
+) -> List[Tuple[str, Optional["requests.Response"]]]:
+    """Send HEAD requests to the URLs concurrently and order them by the latency.
+
+    The responses arriving within "grace" seconds after the first successful one
+    are ordered by the latency, and the others follow in the given order
+    with None instead of the response. The failed URLs are removed.
+    """
+    import requests
+
+    results = []
+    failed = set()
+    executor = ThreadPoolExecutor(max_workers=len(urls))
+    start = time.perf_counter()
+
+    def _head(url: str) -> Tuple[str, "requests.Response", float]:
+        r = session.head(url)
+        return url, r, time.perf_counter() - start
+
+    futures = {executor.submit(_head, url): url for url in urls}
+    pending = set(futures)
+    deadline = None
+    try:
+        while len(pending) > 0:
+            timeout = None if deadline is None else deadline - time.perf_counter()
+            if timeout is not None and timeout <= 0:
+                break
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    url, r, latency = future.result()
+                except requests.exceptions.RequestException:
+                    url, r = futures[future], None
+                if r is None or r.status_code >= 400:
+                    failed.add(url)
+                    if stats is not None:
+                        stats.record_failure(url)
+                    continue
+                if stats is not None:
+                    stats.record_latency(url, latency)
+                results.append((url, r))
+                if deadline is None:
+                    deadline = time.perf_counter() + grace
+    finally:
+        # Don't wait for the slow hosts
+        executor.shutdown(wait=False)
+
+    received = set(url for url, _ in results)
+    results += [
+        (url, None) for url in urls if url not in received and url not in failed
+    ]
+    return results
@@ -0,0 +1,190 @@
+"""Keep the inference objects of espnet2 in the process.
+
+ModelDownloader.load_model() constructs e.g. Speech2Text from a model name
+and keeps it in ModelCache, so the repeated requests for a model return
+the same object without loading the weights again.
+The least recently used objects are dropped if the number of the objects
+or their estimated memory exceeds the limits.
+
+Examples:
+    >>> d = ModelDownloader(model_cache=ModelCache(max_models=4, max_memory="8G"))
+    >>> speech2text = d.load_model("kamo-naoyuki/mini_an4_asr_train_raw_bpe_valid")
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future
+import importlib
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import Union
+
+from espnet_model_zoo.cache import parse_size
+
+
+# The inference class of each "task" in table.csv
+TASK_CLASSES = {
+    "asr": "espnet2.bin.asr_inference:Speech2Text",
+    "asr_stream": "espnet2.bin.asr_inference_streaming:Speech2TextStreaming",
+    "tts": "espnet2.bin.tts_inference:Text2Speech",
+    "enh": "espnet2.bin.enh_inference:SeparateSpeech",
+    "slu": "espnet2.bin.slu_inference:Speech2Understand",
+    "diar": "espnet2.bin.diar_inference:DiarizeSpeech",
+}
+
+
+def import_class(path: str) -> type:
+    """Import a class given as "<module>:<name>" """
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def estimate_memory(obj: Any) -> int:
+    """Estimate the bytes of the parameters and the buffers of the torch modules
+    referred by the object, e.g. Speech2Text.asr_model.
+
+    Returns 0 if no modules are found.
+    """
+    modules = [obj] + list(getattr(obj, "__dict__", {}).values())
+    seen = set()
+    total = 0
+    for module in modules:
+        if not callable(getattr(module, "parameters", None)) or not callable(
+            getattr(module, "buffers", None)
+        ):
+            continue
+        for tensors in (module.parameters(), module.buffers()):
+            for t in tensors:
+                # The shared weights are counted once
+                key = (t.data_ptr(), t.numel())
+                if key in seen:
+                    continue
+                seen.add(key)
+                total += t.numel() * t.element_size()
+    return total
+
+
+class ModelCache:
+    """LRU cache of the loaded objects bounded by the number and the memory.
+
+    get_or_load() is thread-safe, and the threads requesting the same key
+    wait for the single loading. The pinned objects are never evicted,
+    e.g. the ones warmed up by espnet_model_zoo.warmup.WarmupPool.
+    """
+
+    def __init__(self, max_models: int = None, max_memory: Union[int, str] = None):
+        if isinstance(max_memory, str):
+            max_memory = parse_size(max_memory)
+        self.max_models = max_models
+        self.max_memory = max_memory
+        # {key: (object, bytes)}
+        self._entries = OrderedDict()
+        self._loading: Dict[Hashable, Future] = {}
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    @property
+    def memory(self) -> int:
+        with self._lock:
+            return sum(size for _, size in self._entries.values())
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        size_of: Callable[[Any], int] = estimate_memory,
+        pin: bool = False,
+    ) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if pin:
+                    self._pinned.add(key)
+                return self._entries[key][0]
+            future = self._loading.get(key)
+            loading = future is None
+            if loading:
+                future = self._loading[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not loading:
+            obj = future.result()
+            if pin:
+                with self._lock:
+                    if key in self._entries:
+                        self._pinned.add(key)
+            return obj
+
+        try:
+            obj = loader()
+            size = size_of(obj)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            self._entries[key] = (obj, size)
+            if pin:
+                self._pinned.add(key)
+            self._evict(key)
+        future.set_result(obj)
+        return obj
+
+    def _evict(self, latest: Hashable):
+        # The latest one and the pinned ones are kept even if exceeding the limits
+        memory = sum(size for _, size in self._entries.values())
+        candidates = [k for k in self._entries if k != latest and k not in self._pinned]
+        for key in candidates:
+            num = len(self._entries)
+            if (self.max_models is None or num <= self.max_models) and (
+                self.max_memory is None or memory <= self.max_memory
+            ):
+                break
+            _, size = self._entries.pop(key)
+            memory -= size
+            self.evictions += 1
+
+    def unpin(self, key: Hashable):
+        """Allow the object to be evicted"""
+        with self._lock:
+            self._pinned.discard(key)
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            obj, _ = self._entries.pop(key)
+            self._pinned.discard(key)
+        return obj
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                num_models=len(self._entries),
+                num_pinned=len(self._pinned),
+                memory=sum(size for _, size in self._entries.values()),
+                max_models=self.max_models,
+                max_memory=self.max_memory,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+            )
@@ -0,0 +1,451 @@
+from bisect import bisect_left
+from bisect import bisect_right
+import csv
+import os
+from pathlib import Path
+import pickle
+import re
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+
+class In(NamedTuple):
+    """The value is one of the values"""
+
+    values: Tuple[Optional[str], ...]
+
+
+class Range(NamedTuple):
+    """The value is a number in the range. The others never match."""
+
+    low: Optional[float] = None
+    high: Optional[float] = None
+    low_inclusive: bool = True
+    high_inclusive: bool = True
+
+
+class Prefix(NamedTuple):
+    """The value starts with the prefix"""
+
+    prefix: str
+
+
+class Regex(NamedTuple):
+    """The value contains a match of the pattern, i.e. re.search()"""
+
+    pattern: str
+
+
+class All(NamedTuple):
+    """The value matches all of the predicates"""
+
+    predicates: Tuple[Any, ...]
+
+
+PREDICATES = (In, Range, Prefix, Regex, All)
+
+# A dict of the conditions combined with AND, or a list of them combined with OR
+Query = Union[Dict[str, Any], Sequence[Dict[str, Any]]]
+
+
+def as_predicate(value: Any) -> Any:
+    """Convert a value or a list of the values to In()"""
+    if isinstance(value, PREDICATES):
+        return value
+    if not isinstance(value, (list, tuple, set, frozenset)):
+        value = [value]
+    return In(tuple(v if v is None else str(v) for v in value))
+
+
+def to_bitmap(rows: Sequence[int]) -> int:
+    """Return the int whose bit i is set if row i is included"""
+    bitmap = 0
+    for i in rows:
+        bitmap |= 1 << i
+    return bitmap
+
+
+def from_bitmap(bitmap: int) -> List[int]:
+    return [i for i, b in enumerate(reversed(bin(bitmap)[2:])) if b == "1"]
+
+
+class ModelTable:
+    """In-memory model table with hash indexes on the columns.
+
+    An index maps each value of a column to the sorted row ids having it,
+    so a query with several conditions is an intersection of the id sets
+    instead of a full scan for each condition.
+    select_many() evaluates the other kinds of the conditions, e.g. ranges,
+    with the index stored as bitmaps.
+
+    Examples:
+        >>> table = ModelTable.from_csv("table.csv")
+        >>> rows = table.select(task="asr", lang="en")
+        >>> table.column("name", rows)
+        ['kamo-naoyuki/mini_an4_asr_train_raw_bpe_valid.acc.best', ...]
+    """
+
+    def __init__(self, columns: Sequence[str], rows: Sequence[Sequence[Optional[str]]]):
+        self.columns = list(columns)
+        self._column_ids = {k: i for i, k in enumerate(self.columns)}
+        n = len(self.columns)
+        rows = [row if len(row) == n else (list(row) + [None] * n)[:n] for row in rows]
+        # Column oriented storage
+        self._data = [list(c) for c in zip(*rows)] if len(rows) > 0 else []
+        self._data += [[] for _ in range(n - len(self._data))]
+        self._indexes = {}
+        # {(kind, column): structure derived from the index}
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, path: Union[Path, str]) -> "ModelTable":
+        """Parse the csv file. Empty fields are treated as None."""
+        with Path(path).open("r", encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            columns = next(reader)
+            rows = [[v if v != "" else None for v in row] for row in reader]
+        return cls(columns, rows)
+
+    @classmethod
+    def from_columns(
+        cls, columns: Sequence[str], data: Sequence[Sequence[Optional[str]]]
+    ) -> "ModelTable":
+        """Create the table from the values of each column"""
+        assert len(columns) == len(data), (len(columns), len(data))
+        table = cls(columns, [])
+        table._data = [list(c) for c in data]
+        return table
+
+    def __len__(self) -> int:
+        return len(self._data[0]) if len(self._data) > 0 else 0
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._column_ids
+
+    def keys(self) -> List[str]:
+        return list(self.columns)
+
+    def index(self, column: str) -> Dict[Optional[str], List[int]]:
+        """Return the index of the column, which is built at the first access"""
+        if column not in self._column_ids:
+            raise KeyError(column)
+        index = self._indexes.get(column)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(column)
+                if index is None:
+                    index = {}
+                    for i, v in enumerate(self._data[self._column_ids[column]]):
+                        index.setdefault(v, []).append(i)
+                    self._indexes[column] = index
+        return index
+
+    def select(self, **conditions) -> List[int]:
+        """Return the row ids matching all of the equality conditions"""
+        if len(conditions) == 0:
+            return list(range(len(self)))
+
+        # Start from the most selective condition
+        candidates = sorted(
+            (self.index(k).get(v, []) for k, v in conditions.items()), key=len
+        )
+        if len(candidates[0]) == 0:
+            return []
+        ids = set(candidates[0])
+        for c in candidates[1:]:
+            ids.intersection_update(c)
+            if len(ids) == 0:
+                return []
+        return sorted(ids)
+
+    def _compile(self, kind: str, column: str, build: Callable[[], Any]) -> Any:
+        compiled = self._compiled.get((kind, column))
+        if compiled is None:
+            # Built outside of the lock because index() takes it
+            compiled = build()
+            with self._lock:
+                compiled = self._compiled.setdefault((kind, column), compiled)
+        return compiled
+
+    def bitmaps(self, column: str) -> Dict[Optional[str], int]:
+        """Return the index of the column with the row ids as bitmaps"""
+        return self._compile(
+            "bitmaps",
+            column,
+            lambda: {v: to_bitmap(rows) for v, rows in self.index(column).items()},
+        )
+
+    def sorted_values(
+        self, column: str, numeric: bool = False
+    ) -> Tuple[List[Any], List[int]]:
+        """Return the distinct values of the column in ascending order
+        and their bitmaps. None, or the non-numbers if "numeric", are excluded.
+        """
+
+        def _build() -> Tuple[List[Any], List[int]]:
+            items = []
+            for v, bitmap in self.bitmaps(column).items():
+                if v is None:
+                    continue
+                if numeric:
+                    try:
+                        v = float(v)
+                    except ValueError:
+                        continue
+                items.append((v, bitmap))
+            items.sort(key=lambda x: x[0])
+            return [v for v, _ in items], [b for _, b in items]
+
+        return self._compile("numbers" if numeric else "strings", column, _build)
+
+    def mask(self, column: str, predicate: Any) -> int:
+        """Return the bitmap of the rows matching the predicate on the column"""
+        predicate = as_predicate(predicate)
+        mask = 0
+        if isinstance(predicate, In):
+            bitmaps = self.bitmaps(column)
+            for v in predicate.values:
+                mask |= bitmaps.get(v, 0)
+        elif isinstance(predicate, Range):
+            keys, bitmaps = self.sorted_values(column, numeric=True)
+            start, end = 0, len(keys)
+            if predicate.low is not None:
+                bisect = bisect_left if predicate.low_inclusive else bisect_right
+                start = bisect(keys, predicate.low)
+            if predicate.high is not None:
+                bisect = bisect_right if predicate.high_inclusive else bisect_left
+                end = bisect(keys, predicate.high)
+            for bitmap in bitmaps[start:end]:
+                mask |= bitmap
+        elif isinstance(predicate, Prefix):
+            keys, bitmaps = self.sorted_values(column)
+            i = bisect_left(keys, predicate.prefix)
+            while i < len(keys) and keys[i].startswith(predicate.prefix):
+                mask |= bitmaps[i]
+                i += 1
+        elif isinstance(predicate, Regex):
+            regex = re.compile(predicate.pattern)
+            for v, bitmap in self.bitmaps(column).items():
+                if v is not None and regex.search(v) is not None:
+                    mask |= bitmap
+        elif isinstance(predicate, All):
+            mask = (1 << len(self)) - 1
+            for p in predicate.predicates:
+                mask &= self.mask(column, p)
+        return mask
+
+    def select_many(self, queries: Sequence[Query]) -> List[List[int]]:
+        """Return the row ids matching each of the queries.
+
+        A query is a dict of the conditions combined with AND, or a list of
+        such dicts combined with OR. A condition is a value, a list of
+        the values, or a predicate, e.g. Range(low=16000).
+        The conditions are evaluated as bitmaps over all rows at once,
+        and the ones shared by the queries are evaluated once.
+
+        Examples:
+            >>> table.select_many(
+            ...     [
+            ...         {"task": ["asr", "asr_stream"], "fs": Range(high=16000)},
+            ...         [{"name": Prefix("kan-bayashi/")}, {"lang": "ja"}],
+            ...     ]
+            ... )
+        """
+        full = (1 << len(self)) - 1
+        masks = {}
+        results = []
+        for query in queries:
+            groups = [query] if isinstance(query, dict) else query
+            result = 0
+            for group in groups:
+                mask = full
+                for column, value in group.items():
+                    key = (column, as_predicate(value))
+                    if key not in masks:
+                        masks[key] = self.mask(*key)
+                    mask &= masks[key]
+                    if mask == 0:
+                        break
+                result |= mask
+            results.append(from_bitmap(result))
+        return results
+
+    def column(self, column: str, rows: Sequence[int] = None) -> List[Optional[str]]:
+        if column not in self._column_ids:
+            raise KeyError(column)
+        values = self._data[self._column_ids[column]]
+        if rows is None:
+            return list(values)
+        return [values[i] for i in rows]
+
+    def records(
+        self, keys: Sequence[str], rows: Sequence[int] = None
+    ) -> List[Tuple[Optional[str], ...]]:
+        return list(zip(*[self.column(k, rows) for k in keys]))
+
+
+# <key><operator><value>
+CONDITION_REGEX = re.compile(r"^([^=<>^~]+)(>=|<=|\^=|~=|=|>|<)(.*)$", re.DOTALL)
+
+
+def parse_condition(condition: str) -> Tuple[str, Any]:
+    """Parse a condition of the command line.
+
+    - "fs=16000": Equal. "gender=" matches the empty field.
+    - "lang=en,ja": One of the values
+    - "fs>=16000", "fs>16000", "fs<=16000", "fs<16000": Numeric range
+    - "name^=kan-bayashi/": Prefix
+    - "name~=conformer": Regular expression
+    """
+    m = CONDITION_REGEX.match(condition)
+    if m is None:
+        raise ValueError(
+            f"Invalid condition: {condition}: e.g. fs=16000, lang=en,ja, fs>=16000, "
+            "name^=kan-bayashi/, name~=conformer"
+        )
+    key, op, value = m.groups()
+    if op == "=":
+        return key, In(tuple(v if v != "" else None for v in value.split(",")))
+    if op == "^=":
+        return key, Prefix(value)
+    if op == "~=":
+        try:
+            re.compile(value)
+        except re.error as e:
+            raise ValueError(f"Invalid condition: {condition}: {e}")
+        return key, Regex(value)
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"Invalid condition: {condition}: {value} isn't a number")
+    if op[0] == ">":
+        return key, Range(low=number, low_inclusive=op == ">=")
+    else:
+        return key, Range(high=number, high_inclusive=op == "<=")
+
+
+def parse_query(tokens: Sequence[str]) -> List[Dict[str, Any]]:
+    """Parse the conditions separated into the groups by "or".
+
+    The conditions of the same key in a group are combined with All().
+
+    Examples:
+        >>> parse_query(["task=asr", "fs>=16000", "or", "name^=kan-bayashi/"])
+        [{'task': In(values=('asr',)), 'fs': Range(low=16000.0, ...)},
+         {'name': Prefix(prefix='kan-bayashi/')}]
+    """
+    groups = [{}]
+    for token in tokens:
+        if token.lower() == "or":
+            groups.append({})
+            continue
+        key, predicate = parse_condition(token)
+        group = groups[-1]
+        if key not in group:
+            group[key] = predicate
+        elif isinstance(group[key], All):
+            group[key] = All(group[key].predicates + (predicate,))
+        else:
+            group[key] = All((group[key], predicate))
+    # Ignore the empty groups, e.g. of the trailing "or"
+    return [g for g in groups if len(g) > 0] or [{}]
+
+
+# Increment if the format of the snapshot is changed
+SNAPSHOT_VERSION = 1
+
+
+def get_snapshot_path(path: Union[Path, str]) -> Path:
+    path = Path(path)
+    return path.parent / (path.name + ".pkl")
+
+
+def read_snapshot(
+    path: Union[Path, str], stat: os.stat_result = None
+) -> Optional[ModelTable]:
+    """Load the table from the snapshot if it's created from the csv file"""
+    path = Path(path)
+    try:
+        if stat is None:
+            stat = path.stat()
+        with get_snapshot_path(path).open("rb") as f:
+            snapshot = pickle.load(f)
+    except Exception:
+        # Not existing or broken
+        return None
+    if (
+        not isinstance(snapshot, dict)
+        or snapshot.get("version") != SNAPSHOT_VERSION
+        or snapshot.get("source") != (stat.st_mtime_ns, stat.st_size)
+    ):
+        return None
+    return ModelTable.from_columns(snapshot["columns"], snapshot["data"])
+
+
+def write_snapshot(
+    path: Union[Path, str], table: ModelTable, stat: os.stat_result = None
+) -> bool:
+    """Store the parsed table next to the csv file, i.e. <path>.pkl
+
+    "stat" is of the csv file before parsing it, not to associate
+    the table with a newer file replaced in the meantime.
+    Returns False if it can't be written, e.g. the directory is read-only.
+    """
+    path = Path(path)
+    snapshot_path = get_snapshot_path(path)
+    tmp = snapshot_path.parent / (
+        f"{snapshot_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    try:
+        if stat is None:
+            stat = path.stat()
+        snapshot = dict(
+            version=SNAPSHOT_VERSION,
+            source=(stat.st_mtime_ns, stat.st_size),
+            columns=table.columns,
+            data=table._data,
+        )
+        with tmp.open("wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snapshot_path)
+    except OSError:
+        if tmp.exists():
+            tmp.unlink()
+        return False
+    return True
+
+
+_table_cache = {}
+_table_cache_lock = threading.Lock()
+
+
+def load_model_table(path: Union[Path, str]) -> ModelTable:
+    """Load the table from the csv file and share it while the file is unchanged.
+
+    The parsed table is also stored as a snapshot next to the csv file,
+    so the other processes don't parse it again.
+    """
+    path = Path(path).absolute()
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _table_cache_lock:
+        table = _table_cache.get(key)
+        if table is None:
+            table = read_snapshot(path, stat)
+            if table is None:
+                table = ModelTable.from_csv(path)
+                write_snapshot(path, table, stat)
+            # Drop the old versions of the same file
+            for k in [k for k in _table_cache if k[0] == key[0]]:
+                del _table_cache[k]
+            _table_cache[key] = table
+    return table
@@ -0,0 +1,124 @@
+"""Share the cache directories between hosts over HTTP.
+
+A peer is a plain HTTP server exposing the cache directory of another host
+in the same layout, i.e. <peer>/<hash>/metadata.json and <peer>/<hash>/<file>,
+e.g. started by espnet_model_zoo_serve_cache. ModelDownloader tries the peers
+before the origin URL and validates the files against the digests
+declared in table.csv, the checksum manifest or Content-MD5 of the origin.
+
+Examples:
+    $ espnet_model_zoo_serve_cache --host 0.0.0.0 --port 8000  # On node1
+    >>> d = ModelDownloader(peers=["http://node1:8000"])  # On the other nodes
+"""
+
+from functools import partial
+from pathlib import Path
+import re
+import threading
+from typing import Optional
+from typing import TYPE_CHECKING
+from typing import Union
+from urllib.parse import quote
+from urllib.parse import unquote
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+    import requests
+
+
+# Set the peer URLs separated by commas or spaces
+PEERS_ENV = "ESPNET_MODEL_ZOO_PEERS"
+
+# (connect, read) timeouts in seconds. A peer being down must be skipped quickly.
+PEER_TIMEOUT = (3.0, 30.0)
+
+# <hash>/<file> of a cache entry
+PATH_REGEX = re.compile(r"^/[0-9a-f]{32}/[^/]+$")
+
+# The files being written or used for the coordination
+PRIVATE_SUFFIXES = (".lock", ".lease", ".part", ".part.json", ".tmp")
+
+
+def parse_peers(peers: str) -> list:
+    return [p for p in re.split(r"[\s,]+", peers) if p != ""]
+
+
+def get_peer_url(peer: str, key: str, filename: str) -> str:
+    return f"{peer.rstrip('/')}/{key}/{quote(filename)}"
+
+
+def is_valid_filename(filename) -> bool:
+    # The file name given by a peer is used as a path in the cache directory
+    return (
+        isinstance(filename, str)
+        and filename not in ("", ".", "..")
+        and "/" not in filename
+        and "\\" not in filename
+        and not filename.endswith(PRIVATE_SUFFIXES)
+    )
+
+
+def fetch_peer_metadata(
+    session: "requests.Session", peer: str, key: str, url: str
+) -> Optional[dict]:
+    """Return metadata.json of the entry cached by the peer, or None if not cached"""
+    import requests
+
+    try:
+        r = session.get(get_peer_url(peer, key, "metadata.json"))
+        if r.status_code != 200:
+            return None
+        metadata = r.json()
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+    if (
+        not isinstance(metadata, dict)
+        or metadata.get("url") != url
+        or not is_valid_filename(metadata.get("filename"))
+    ):
+        return None
+    return metadata
+
+
+def serve_cache(
+    cachedir: Union[Path, str], port: int = 0, host: str = "127.0.0.1"
+) -> "ThreadingHTTPServer":
+    """Serve the files of the cache entries read-only at http://<host>:<port>/
+    in a thread.
+
+    The directory listings, the files being written and the symlinks aren't
+    served.
+    Call shutdown() of the returned server to stop it.
+    """
+    from http.server import SimpleHTTPRequestHandler
+    from http.server import ThreadingHTTPServer
+
+    root = Path(cachedir).resolve()
+
+    class _Handler(SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_head(self):
+            path = unquote(self.path.split("?")[0].split("#")[0])
+            if PATH_REGEX.match(path) is None or path.endswith(PRIVATE_SUFFIXES):
+                self.send_error(404)
+                return None
+            # The symlinks to the local files given to unpack_local_file()
+            # aren't served
+            target = Path(self.translate_path(path))
+            if (
+                target.is_symlink()
+                or not target.is_file()
+                or root not in target.resolve().parents
+            ):
+                self.send_error(404)
+                return None
+            return super().send_head()
+
+    server = ThreadingHTTPServer(
+        (host, port), partial(_Handler, directory=str(cachedir))
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
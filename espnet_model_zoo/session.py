@@ -0,0 +1,63 @@
+from typing import Collection
+from typing import Tuple
+from typing import TYPE_CHECKING
+from typing import Union
+
+if TYPE_CHECKING:
+    import requests
+
+
+def create_session(
+    pool_size: int = 10,
+    retry: int = 3,
+    backoff_factor: float = 0.5,
+    status_forcelist: Collection[int] = (500, 502, 503, 504),
+    timeout: Union[float, Tuple[float, float]] = (10.0, 30.0),
+    keep_alive: bool = True,
+) -> "requests.Session":
+    """Create a session shared by the network operations.
+
+    The connections to each host are pooled up to "pool_size" and kept alive.
+    The connection errors and the responses with "status_forcelist" are
+    retried up to "retry" times, sleeping backoff_factor * 2 ** (n - 1)
+    seconds before the n-th retry. POST requests aren't retried because
+    they aren't idempotent. "timeout" is used for the requests without it.
+
+    Examples:
+        >>> d = ModelDownloader(session=create_session(pool_size=32, retry=5))
+    """
+    import requests
+    from urllib3.util.retry import Retry
+
+    class _Adapter(requests.adapters.HTTPAdapter):
+        def send(self, request, timeout=None, **kwargs):
+            if timeout is None:
+                timeout = self.timeout
+            return super().send(request, timeout=timeout, **kwargs)
+
+    retries = Retry(
+        total=retry,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        # Return the last response instead of raising MaxRetryError
+        raise_on_status=False,
+    )
+    adapter = _Adapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries
+    )
+    adapter.timeout = timeout
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def get_backoff_time(session: "requests.Session", url: str, trial: int) -> float:
+    """Return the time to sleep before retrying after an error in the middle of
+    a transfer, following the retry configuration of the session"""
+    retries = session.get_adapter(url).max_retries
+    backoff = retries.backoff_factor * (2**trial)
+    return min(backoff, getattr(retries, "backoff_max", 120))
@@ -0,0 +1,337 @@
+"""Extract the archives created by espnet2.main_funcs.pack_funcs.pack.
+
+The result is the same as espnet2.main_funcs.pack_funcs.unpack, but
+
+- The members of a zip file are extracted in parallel.
+- The members of a tar file can be extracted from the stream
+  while it's downloaded, using TarStreamExtractor.
+- Each file is written to a temporary file and renamed, and meta.yaml is
+  written at the end, so an existing meta.yaml means that all files are ready.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+from pathlib import Path
+from pathlib import PurePosixPath
+import queue
+import shutil
+import tarfile
+import threading
+from typing import BinaryIO
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+from typing import Union
+import zipfile
+
+
+META_YAML = "meta.yaml"
+TAR_SUFFIXES = (".tar", ".tgz", ".tbz2", ".txz", ".tar.gz", ".tar.bz2", ".tar.xz")
+
+
+def is_tar(path: Union[Path, str]) -> bool:
+    return str(path).endswith(TAR_SUFFIXES)
+
+
+def _member_path(outdir: Path, name: str) -> Path:
+    # Refuse the members escaping from outdir
+    p = PurePosixPath(name)
+    if p.is_absolute() or ".." in p.parts:
+        raise RuntimeError(f"Invalid path in the archive: {name}")
+    return outdir.joinpath(*p.parts)
+
+
+def _write_file(path: Path, fileobj: BinaryIO, chunk_size: int = 1 << 20):
+    # Write to a temporary file and rename it not to leave a broken file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.parent / f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with tmp.open("wb") as f:
+            shutil.copyfileobj(fileobj, f, chunk_size)
+        os.replace(tmp, path)
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+
+
+def get_path_index(directory: Union[Path, str]) -> Dict[str, str]:
+    """Map the relative paths of all files and directories to the absolute ones"""
+    index = {}
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for name in dirnames + filenames:
+            p = Path(dirpath) / name
+            index[str(p.relative_to(directory))] = str(p)
+    return index
+
+
+def rewrite_paths(value, index: Dict[str, str]):
+    """Replace the paths in the value, e.g. a dict loaded from yaml, in one pass.
+
+    This is equivalent to applying find_path_and_change_it_recursive of espnet2
+    for each path of the index, but doesn't traverse the value for each path.
+    """
+    if isinstance(value, dict):
+        return {k: rewrite_paths(v, index) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [rewrite_paths(v, index) for v in value]
+    elif isinstance(value, str):
+        # Compare as Path, e.g. "./exp/a" is same as "exp/a"
+        return index.get(str(Path(value)), value)
+    else:
+        return value
+
+
+def get_unpacked_files(outdir: Union[Path, str]) -> Optional[Dict[str, str]]:
+    """Return the files of the unpacked model if all of them exist"""
+    import yaml
+
+    outdir = Path(outdir)
+    try:
+        with (outdir / META_YAML).open("r", encoding="utf-8") as f:
+            d = yaml.safe_load(f)
+    except FileNotFoundError:
+        return None
+    assert isinstance(d, dict), type(d)
+
+    retval = {}
+    for key, value in list(d["yaml_files"].items()) + list(d["files"].items()):
+        if not (outdir / value).exists():
+            return None
+        retval[key] = str(outdir / value)
+    return retval
+
+
+def _publish(
+    outdir: Path, meta_name: str, meta_data: bytes, names: Iterable[str]
+) -> Dict[str, str]:
+    import yaml
+
+    d = yaml.safe_load(meta_data)
+    assert isinstance(d, dict), type(d)
+    yaml_files = d["yaml_files"]
+    files = d["files"]
+    assert isinstance(yaml_files, dict), type(yaml_files)
+    assert isinstance(files, dict), type(files)
+
+    # Rewrite the paths in the yaml files to the extracted ones
+    index = {str(Path(name)): str(outdir / name) for name in names}
+    for value in set(yaml_files.values()):
+        path = _member_path(outdir, value)
+        with path.open("r", encoding="utf-8") as f:
+            c = yaml.safe_load(f)
+        c = rewrite_paths(c, index)
+        _write_file(path, io.BytesIO(yaml.safe_dump(c).encode("utf-8")))
+
+    # meta.yaml is written at the end
+    _write_file(_member_path(outdir, meta_name), io.BytesIO(meta_data))
+
+    retval = {}
+    for key, value in list(yaml_files.items()) + list(files.items()):
+        retval[key] = str(outdir / value)
+    return retval
+
+
+def _extract_tar(
+    tar: tarfile.TarFile, outdir: Path
+) -> Tuple[Optional[str], Optional[bytes], list]:
+    # Returns the name and the content of meta.yaml and all member names
+    meta_name = meta_data = None
+    names = []
+    for info in tar:
+        names.append(info.name)
+        if info.isdir():
+            _member_path(outdir, info.name).mkdir(parents=True, exist_ok=True)
+        elif not info.isfile():
+            # Links and devices are not created by pack()
+            continue
+        elif meta_data is None and PurePosixPath(info.name).name == META_YAML:
+            meta_name = info.name
+            meta_data = tar.extractfile(info).read()
+        else:
+            _write_file(_member_path(outdir, info.name), tar.extractfile(info))
+    return meta_name, meta_data, names
+
+
+def unpack_tar(input_archive: Union[Path, str], outdir: Union[Path, str]):
+    outdir = Path(outdir)
+    # The stream mode reads the file sequentially without seeking
+    with tarfile.open(input_archive, mode="r|*") as tar:
+        meta_name, meta_data, names = _extract_tar(tar, outdir)
+    if meta_data is None:
+        raise RuntimeError("Format error: not found meta.yaml")
+    return _publish(outdir, meta_name, meta_data, names)
+
+
+def unpack_zip(
+    input_archive: Union[Path, str],
+    outdir: Union[Path, str],
+    max_workers: int = None,
+) -> Dict[str, str]:
+    outdir = Path(outdir)
+    with zipfile.ZipFile(input_archive) as z:
+        infos = z.infolist()
+        for info in infos:
+            if PurePosixPath(info.filename).name == META_YAML:
+                meta_name = info.filename
+                meta_data = z.read(info)
+                break
+        else:
+            raise RuntimeError("Format error: not found meta.yaml")
+
+    # Each thread opens the archive to read the members independently
+    local = threading.local()
+    handles = []
+
+    def _extract(info: zipfile.ZipInfo):
+        if info.is_dir():
+            _member_path(outdir, info.filename).mkdir(parents=True, exist_ok=True)
+            return
+        z = getattr(local, "zip", None)
+        if z is None:
+            z = local.zip = zipfile.ZipFile(input_archive)
+            handles.append(z)
+        with z.open(info) as f:
+            _write_file(_member_path(outdir, info.filename), f)
+
+    # The larger members first to balance the load
+    members = sorted(
+        (info for info in infos if info.filename != meta_name),
+        key=lambda x: x.file_size,
+        reverse=True,
+    )
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for _ in executor.map(_extract, members):
+                pass
+    finally:
+        for z in handles:
+            z.close()
+    return _publish(outdir, meta_name, meta_data, [info.filename for info in infos])
+
+
+def unpack(
+    input_archive: Union[Path, str],
+    outdir: Union[Path, str],
+    max_workers: int = None,
+) -> Dict[str, str]:
+    """Extract the archive and return the files listed in meta.yaml.
+
+    Examples:
+        >>> unpack("model.zip", "out")
+        {'asr_model_file': 'out/exp/model.pth', ...}
+    """
+    if is_tar(input_archive):
+        return unpack_tar(input_archive, outdir)
+    elif str(input_archive).endswith(".zip"):
+        return unpack_zip(input_archive, outdir, max_workers=max_workers)
+    else:
+        raise ValueError(f"Cannot detect archive format: type={input_archive}")
+
+
+class _QueueReader(io.RawIOBase):
+    # File-like object reading the chunks put into the queue
+    EOF = object()
+    ABORT = object()
+
+    def __init__(self, q: queue.Queue):
+        self.queue = q
+        self.buffer = b""
+        self.eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while len(self.buffer) == 0 and not self.eof:
+            chunk = self.queue.get()
+            if chunk is self.ABORT:
+                raise EOFError("Aborted")
+            elif chunk is self.EOF:
+                self.eof = True
+            else:
+                self.buffer = chunk
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+
+class TarStreamExtractor:
+    """Extract a tar archive from the data fed while it's downloaded.
+
+    feed() must receive the data in the order of the offset,
+    e.g. as "on_data" of espnet_model_zoo.downloader.download().
+    If the data isn't contiguous, e.g. the download was restarted,
+    the extraction is abandoned and close() returns None,
+    so the caller should unpack the downloaded file instead.
+
+    Examples:
+        >>> extractor = TarStreamExtractor("out")
+        >>> download(url, "model.tar.gz", on_data=extractor.feed)
+        >>> info = extractor.close(os.path.getsize("model.tar.gz"))
+    """
+
+    def __init__(self, outdir: Union[Path, str], max_chunks: int = 256):
+        self.outdir = Path(outdir)
+        self.offset = 0
+        self.failed = False
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            with tarfile.open(fileobj=_QueueReader(self._queue), mode="r|*") as tar:
+                self._result = _extract_tar(tar, self.outdir)
+        except Exception as e:
+            self._error = e
+
+    def _put(self, item):
+        # Drop the data after the extraction finishes, e.g. the padding of tar
+        while self._thread.is_alive():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def feed(self, offset: int, data: bytes):
+        if self.failed:
+            return
+        if offset != self.offset:
+            self.abort()
+            return
+        self.offset += len(data)
+        self._put(bytes(data))
+
+    def abort(self):
+        if not self.failed:
+            self.failed = True
+            self._put(_QueueReader.ABORT)
+        self._thread.join()
+
+    def close(self, size: int = None) -> Optional[Dict[str, str]]:
+        """Finish the extraction and publish meta.yaml.
+
+        "size" is the size of the downloaded file to confirm
+        that all of the data has been fed.
+        """
+        if not self.failed:
+            self._put(_QueueReader.EOF)
+        self._thread.join()
+        if (
+            self.failed
+            or self._error is not None
+            or (size is not None and self.offset != size)
+        ):
+            return None
+
+        meta_name, meta_data, names = self._result
+        if meta_data is None:
+            return None
+        return _publish(self.outdir, meta_name, meta_data, names)
@@ -0,0 +1,264 @@
+"""Load the models in the background before the first requests.
+
+WarmupPool resolves and unpacks the models in a thread or process pool,
+loads them into the model cache of ModelDownloader, optionally runs a dummy
+inference, and tracks the state of each model, so a server can accept
+the requests for a model after it's ready.
+
+Examples:
+    >>> pool = WarmupPool(ModelDownloader(), warmup=True)
+    >>> pool.submit(["kamo-naoyuki/mini_an4_asr_train_raw_bpe_valid.acc.best"])
+    >>> pool.is_ready("kamo-naoyuki/mini_an4_asr_train_raw_bpe_valid.acc.best")
+    False
+    >>> pool.wait(timeout=600)
+    True
+"""
+
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Sequence
+from typing import Union
+
+from espnet_model_zoo.downloader import ModelDownloader
+from espnet_model_zoo.model_cache import TASK_CLASSES
+
+
+PENDING = "pending"
+UNPACKING = "unpacking"
+LOADING = "loading"
+WARMING_UP = "warming_up"
+READY = "ready"
+FAILED = "failed"
+
+FINISHED_STATES = (READY, FAILED)
+
+
+def dummy_inference(obj: Any, task: str):
+    """Run the inference with zeros as ci/test_model.py"""
+    import numpy as np
+
+    if task in ("asr", "asr_stream", "slu"):
+        obj(np.zeros((10000,), dtype=np.float32))
+    elif task in ("enh", "diar"):
+        obj(np.zeros((1, 10000), dtype=np.float32))
+    elif task == "tts":
+        inputs = {"text": "foo"}
+        if obj.use_speech:
+            inputs["speech"] = np.zeros((10000,), dtype=np.float32)
+        if obj.use_spembs:
+            inputs["spembs"] = np.zeros((obj.tts.spk_embed_dim,), dtype=np.float32)
+        if obj.use_sids:
+            inputs["sids"] = np.ones((1,), dtype=np.int64)
+        if obj.use_lids:
+            inputs["lids"] = np.ones((1,), dtype=np.int64)
+        obj(**inputs)
+    else:
+        raise ValueError(f"No dummy inputs for task={task}")
+
+
+# ModelDownloader of each worker process: {arguments: downloader}
+_process_downloaders = {}
+
+
+def _unpack_in_process(cachedir: str, kwargs: dict, name: str, quiet: bool) -> dict:
+    key = (cachedir, repr(sorted(kwargs.items())))
+    if key not in _process_downloaders:
+        _process_downloaders[key] = ModelDownloader(cachedir, **kwargs)
+    return _process_downloaders[key].download_and_unpack(name, quiet=quiet)
+
+
+class WarmupPool:
+    """Load the models in the background and track their readiness.
+
+    The state of each model changes as pending -> unpacking -> loading ->
+    warming_up -> ready, or failed with the error.
+    The loaded objects are pinned in the model cache, so a ready model is
+    never evicted by the limits of the cache.
+    With "use_processes", the downloading and unpacking run in processes and
+    only the loading runs in this process. The processes use the same settings
+    except for the hooks and the session.
+    """
+
+    def __init__(
+        self,
+        downloader: ModelDownloader = None,
+        max_workers: int = 4,
+        use_processes: bool = False,
+        load: bool = True,
+        warmup: Union[bool, Callable[[Any, str], None]] = False,
+        model_class: Union[type, str] = None,
+        model_kwargs: Dict[str, Any] = None,
+        quiet: bool = True,
+    ):
+        if downloader is None:
+            downloader = ModelDownloader()
+        self.downloader = downloader
+        self.load = load
+        # A callable receiving the object and the model name, or True to run
+        # dummy_inference()
+        self.warmup = warmup
+        self.model_class = model_class
+        self.model_kwargs = model_kwargs
+        self.quiet = quiet
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._process_pool: Executor = None
+        if use_processes:
+            self._process_pool = ProcessPoolExecutor(max_workers=max_workers)
+        # {name: {"state": ..., "error": ..., "submitted_at": ..., ...}}
+        self._states = {}
+        # {name: the loaded object}
+        self._objects = {}
+        self._cond = threading.Condition()
+
+    def __enter__(self) -> "WarmupPool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait)
+
+    def submit(self, names: Sequence[str]):
+        """Start loading the models unless they are already submitted.
+
+        The failed models are submitted again.
+        """
+        for name in names:
+            with self._cond:
+                state = self._states.get(name)
+                if state is not None and state["state"] != FAILED:
+                    continue
+                self._states[name] = dict(
+                    state=PENDING, error=None, submitted_at=time.time()
+                )
+            self._pool.submit(self._run, name)
+
+    def _set_state(self, name: str, state: str, **kwargs):
+        with self._cond:
+            self._states[name].update(state=state, **kwargs)
+            self._states[name][f"{state}_at"] = time.time()
+            self._cond.notify_all()
+
+    def _unpack(self, name: str):
+        d = self.downloader
+        if self._process_pool is None:
+            d.download_and_unpack(name, quiet=self.quiet)
+            return
+        # The arguments must be picklable
+        kwargs = dict(
+            num_workers=d.num_workers,
+            metadata_ttl=d.metadata_ttl,
+            checksum_manifest=d.checksum_manifest,
+            max_cache_size=d.cache.max_size,
+            eviction_policy=d.cache.policy,
+            dedupe=d.blob_store is not None,
+            offline=d.offline,
+            peers=d.peers,
+            trust_peer_digests=d.trust_peer_digests,
+            lock_timeout=d.lock_timeout,
+            lease_ttl=d.lease_ttl,
+            mirrors=d.mirrors,
+        )
+        future = self._process_pool.submit(
+            _unpack_in_process, str(d.cachedir), kwargs, name, self.quiet
+        )
+        future.result()
+
+    def _run(self, name: str):
+        try:
+            self._set_state(name, UNPACKING)
+            # Not evicted by the other models until loaded
+            with self.downloader.hold(name):
+                self._unpack(name)
+                if self.load:
+                    self._set_state(name, LOADING)
+                    obj = self._load(name)
+                    with self._cond:
+                        self._objects[name] = obj
+                    if self.warmup:
+                        self._set_state(name, WARMING_UP)
+                        if callable(self.warmup):
+                            self.warmup(obj, name)
+                        else:
+                            dummy_inference(obj, self._get_task(name, obj))
+            self._set_state(name, READY)
+        except Exception as e:
+            self._set_state(name, FAILED, error=f"{type(e).__name__}: {e}")
+
+    def _get_task(self, name: str, obj: Any) -> str:
+        # By the class first, e.g. for a URL not in table.csv
+        path = f"{type(obj).__module__}:{type(obj).__qualname__}"
+        for task, task_class in TASK_CLASSES.items():
+            if task_class == path:
+                return task
+        tasks = set(self.downloader.query("task", name=name)) - {None, ""}
+        if len(tasks) != 1:
+            raise RuntimeError(
+                f"The task of the model is unknown. Give a callable as warmup: {name}"
+            )
+        return tasks.pop()
+
+    def _load(self, name: str) -> Any:
+        return self.downloader.load_model(
+            name,
+            model_class=self.model_class,
+            model_kwargs=self.model_kwargs,
+            quiet=self.quiet,
+            pin=True,
+        )
+
+    def get(self, name: str) -> Any:
+        """Return the loaded object of the ready model without the downloader.
+
+        It's loaded by load_model() only if the pool doesn't "load".
+        """
+        with self._cond:
+            state = self._states.get(name)
+            if state is None or state["state"] != READY:
+                raise RuntimeError(f"The model isn't ready: {name}: {state}")
+            if name in self._objects:
+                return self._objects[name]
+        return self._load(name)
+
+    def _check_submitted(self, names: Sequence[str]):
+        for name in names:
+            if name not in self._states:
+                raise ValueError(f"The model isn't submitted: {name}")
+
+    def status(self, name: str = None) -> Dict[str, Any]:
+        """Return the state of the model, or {name: state} of all models"""
+        with self._cond:
+            if name is not None:
+                self._check_submitted([name])
+                return dict(self._states[name])
+            return {k: dict(v) for k, v in self._states.items()}
+
+    def is_ready(self, name: str) -> bool:
+        with self._cond:
+            state = self._states.get(name)
+            return state is not None and state["state"] == READY
+
+    def wait(self, names: Sequence[str] = None, timeout: float = None) -> bool:
+        """Wait until the models are ready or failed.
+
+        Returns True if all of them are ready within the timeout.
+        Raises ValueError if any of them isn't submitted.
+        """
+        with self._cond:
+            if names is None:
+                names = list(self._states)
+            self._check_submitted(names)
+            self._cond.wait_for(
+                lambda: all(self._states[n]["state"] in FINISHED_STATES for n in names),
+                timeout=timeout,
+            )
+            return all(self._states[n]["state"] == READY for n in names)
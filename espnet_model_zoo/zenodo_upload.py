@@ -7,27 +7,101 @@ You need to do as follows in order to access zenodo:
 """
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from getpass import getpass
+import hashlib
 import json
 import os
 from pathlib import Path
 import requests
+import time
+from typing import Any
+from typing import BinaryIO
 from typing import Collection
+from typing import Dict
+from typing import List
+from typing import Tuple
 from typing import Union
+import warnings
 
 from espnet2.utils import config_argparse
 from espnet2.utils.types import str2bool
 
+from espnet_model_zoo.session import create_session
+from espnet_model_zoo.session import get_backoff_time
+
+
+class UploadError(RuntimeError):
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class _ProgressReader:
+    """File-like object computing md5 and reporting the progress while read.
+
+    The position can be restored by seek() to send the data again on retry.
+    """
+
+    def __init__(self, f: BinaryIO, size: int, pbar=None):
+        self.f = f
+        self.size = size
+        self.pbar = pbar
+        self.md5 = hashlib.md5()
+        # The data before "hashed" is already added to md5
+        self.hashed = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def tell(self) -> int:
+        return self.f.tell()
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        old = self.f.tell()
+        new = self.f.seek(offset, whence)
+        if self.pbar is not None:
+            self.pbar.update(new - old)
+        return new
+
+    def read(self, size: int = -1) -> bytes:
+        offset = self.f.tell()
+        data = self.f.read(size)
+        if offset + len(data) > self.hashed:
+            self.md5.update(data[self.hashed - offset :])
+            self.hashed = offset + len(data)
+        if self.pbar is not None:
+            self.pbar.update(len(data))
+        return data
+
+
+def _get_message(r: requests.models.Response) -> str:
+    try:
+        return r.json()["message"]
+    except (ValueError, KeyError, TypeError):
+        return f"{r.status_code} {r.reason}: {r.url}"
+
 
 class Zenodo:
     """Helper class to invoke Zenodo API
 
     REST API of zenodo: https://developers.zenodo.org/
 
+    The files are uploaded by "upload_session", which isn't retried by itself
+    since upload_file() sends the whole file again on failure. Its read timeout
+    is disabled by default because Zenodo may respond long after a large file
+    is sent.
     """
 
-    def __init__(self, access_token: str, use_sandbox: bool = False):
+    def __init__(
+        self,
+        access_token: str,
+        use_sandbox: bool = False,
+        session: requests.Session = None,
+        upload_session: requests.Session = None,
+        upload_timeout: Union[float, Tuple[float, float]] = (10.0, None),
+    ):
         if use_sandbox:
             self.zenodo_url = "https://sandbox.zenodo.org"
         else:
@@ -35,9 +109,13 @@ class Zenodo:
 
         self.params = {"access_token": access_token}
         self.headers = {"Content-Type": "application/json"}
+        self.session = create_session() if session is None else session
+        if upload_session is None:
+            upload_session = create_session(retry=0, timeout=upload_timeout)
+        self.upload_session = upload_session
 
     def create_deposition(self) -> requests.models.Response:
-        r = requests.post(
+        r = self.session.post(
             f"{self.zenodo_url}/api/deposit/depositions",
             params=self.params,
             json={},
@@ -52,7 +130,7 @@ class Zenodo:
             deposition_id = r.json()["id"]
         else:
             deposition_id = r
-        r = requests.get(
+        r = self.session.get(
             f"{self.zenodo_url}/api/deposit/depositions/{deposition_id}",
             params=self.params,
             json={},
@@ -70,7 +148,7 @@ class Zenodo:
         else:
             deposition_id = r
 
-        r = requests.put(
+        r = self.session.put(
             f"{self.zenodo_url}/api/deposit/depositions/{deposition_id}",
             params=self.params,
             data=json.dumps(data),
@@ -81,26 +159,112 @@ class Zenodo:
         return r
 
     def upload_file(
-        self, r: Union[requests.models.Response, int], filename: Union[Path, str]
+        self,
+        r: Union[requests.models.Response, int],
+        filename: Union[Path, str],
+        retry: int = 3,
+        quiet: bool = True,
+        position: int = None,
     ) -> requests.models.Response:
+        """Upload the file to the bucket of the deposition.
+
+        The file is streamed with a progress bar unless "quiet",
+        and uploaded again from the beginning with backoff up to "retry" times
+        if failed, e.g. by a connection error, a server error or
+        a checksum mismatch.
+        """
         if isinstance(r, int):
-            r = requests.get(
-                f"{self.zenodo_url}/api/deposit/depositions/{r}", headers=self.headers
-            )
+            r = self.get_deposition(r)
 
         bucket_url = r.json()["links"]["bucket"]
         name = Path(filename).name
+        url = f"{bucket_url}/{name}"
+        size = os.path.getsize(filename)
+
+        pbar = None
+        if not quiet:
+            from tqdm import tqdm
+
+            pbar = tqdm(
+                desc=name,
+                total=size,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+                position=position,
+            )
+        try:
+            for trial in range(retry + 1):
+                if pbar is not None and trial > 0:
+                    # Sent again from the beginning
+                    pbar.reset()
+                try:
+                    return self._put_file(url, filename, size, pbar)
+                except (
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    UploadError,
+                ) as e:
+                    if trial == retry or (
+                        isinstance(e, UploadError) and not e.retryable
+                    ):
+                        raise
+                    warnings.warn(f"Upload failed and will be retried: {e}")
+                    time.sleep(get_backoff_time(self.upload_session, url, trial))
+        finally:
+            if pbar is not None:
+                pbar.close()
+
+    def _put_file(
+        self, url: str, filename: Union[Path, str], size: int, pbar=None
+    ) -> requests.models.Response:
         with open(filename, "rb") as fp:
-            r = requests.put(
-                f"{bucket_url}/{name}",
-                data=fp,
+            reader = _ProgressReader(fp, size, pbar)
+            r = self.upload_session.put(
+                url,
+                data=reader,
                 # No headers included since it's a raw byte request
                 params=self.params,
             )
-            if r.status_code != 200:
-                raise RuntimeError(r.json()["message"])
+        if r.status_code != 200:
+            raise UploadError(_get_message(r), retryable=r.status_code >= 500)
+        # e.g. "checksum": "md5:2942bfabb3d05332b66eb128e0842cff"
+        checksum = r.json().get("checksum")
+        if checksum is not None and checksum != f"md5:{reader.md5.hexdigest()}":
+            raise UploadError(f"Checksum mismatch: {url}", retryable=True)
         return r
 
+    def upload_files(
+        self,
+        r: Union[requests.models.Response, int],
+        files: Collection[Union[Path, str]],
+        max_workers: int = 4,
+        retry: int = 3,
+        quiet: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """Upload the files concurrently with "max_workers" threads.
+
+        Returns the statistics for each file, containing "file", "bytes",
+        "upload_time" and "throughput" in bytes per second.
+        """
+        if isinstance(r, int):
+            r = self.get_deposition(r)
+
+        def _upload(position: int, filename: Union[Path, str]) -> Dict[str, Any]:
+            start = time.perf_counter()
+            self.upload_file(r, filename, retry=retry, quiet=quiet, position=position)
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(filename)
+            return dict(
+                file=str(filename),
+                bytes=size,
+                upload_time=elapsed,
+                throughput=size / elapsed if elapsed > 0 else None,
+            )
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_upload, range(len(files)), files))
+
     def publish(
         self, r: Union[requests.models.Response, int]
     ) -> requests.models.Response:
@@ -109,7 +273,7 @@ class Zenodo:
         else:
             deposition_id = r
 
-        r = requests.post(
+        r = self.session.post(
             f"{self.zenodo_url}/api/deposit/depositions/"
             f"{deposition_id}/actions/publish",
             params=self.params,
@@ -135,6 +299,8 @@ def upload(
     community_identifer: str = None,
     use_sandbox: bool = True,
     publish: bool = False,
+    max_workers: int = 4,
+    retry: int = 3,
 ):
     zenodo = Zenodo(access_token, use_sandbox=use_sandbox)
     r = zenodo.create_deposition()
@@ -168,9 +334,16 @@ def upload(
         # Check file existing
         if not Path(f).exists():
             raise FileNotFoundError(f"{f} is not found")
-    for f in files:
-        print(f"Now uploading {f}...")
-        zenodo.upload_file(r, f)
+    print(f"Now uploading {len(files)} files...")
+    stats = zenodo.upload_files(
+        r, files, max_workers=max_workers, retry=retry, quiet=False
+    )
+    for stat in stats:
+        throughput = stat["throughput"] or 0
+        print(
+            f"Uploaded {stat['file']}: {stat['bytes']} bytes "
+            f"in {stat['upload_time']:.1f} sec ({throughput / 1024 ** 2:.2f} MB/s)"
+        )
 
     if publish:
         r = zenodo.publish(r)
@@ -194,6 +367,8 @@ def upload_espnet_model(
     gnd: str = None,
     use_sandbox: bool = False,
     publish: bool = False,
+    max_workers: int = 4,
+    retry: int = 3,
 ):
     if description_file is not None:
         with open(description_file, "r", encoding="utf-8") as f:
@@ -227,6 +402,8 @@ def upload_espnet_model(
         gnd=gnd,
         use_sandbox=use_sandbox,
         publish=publish,
+        max_workers=max_workers,
+        retry=retry,
     )
 
 
@@ -266,6 +443,18 @@ def get_parser():
     parser.add_argument("--affiliation")
     parser.add_argument("--orcid")
     parser.add_argument("--gnd")
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=4,
+        help="The number of files uploaded in parallel",
+    )
+    parser.add_argument(
+        "--retry",
+        type=int,
+        default=3,
+        help="The number of retries for each file",
+    )
     return parser
 
 
@@ -15,6 +15,7 @@ requirements = {
         "filelock",
         "torchaudio",
     ],
+    "async": ["aiohttp"],
     "setup": ["pytest-runner"],
     "test": [
         "pytest>=3.3.0",
@@ -25,6 +26,7 @@ requirements = {
         "pycodestyle",
         "flake8>=3.7.8",
         "black",
+        "aiohttp",
     ],
 }
 
@@ -51,6 +53,11 @@ setup(
             "espnet_model_zoo_upload = espnet_model_zoo.zenodo_upload:main",
             "espnet_model_zoo_download = espnet_model_zoo.downloader:cmd_download",
             "espnet_model_zoo_query = espnet_model_zoo.downloader:cmd_query",
+            "espnet_model_zoo_prefetch = espnet_model_zoo.downloader:cmd_prefetch",
+            "espnet_model_zoo_verify = espnet_model_zoo.downloader:cmd_verify",
+            "espnet_model_zoo_cache = espnet_model_zoo.downloader:cmd_cache",
+            "espnet_model_zoo_serve_cache = "
+            "espnet_model_zoo.downloader:cmd_serve_cache",
         ],
     },
     install_requires=install_requires,
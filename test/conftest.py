@@ -0,0 +1,178 @@
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import hashlib
+import io
+import os
+import re
+import socket
+import tarfile
+import threading
+import time
+import zipfile
+
+import pytest
+import yaml
+
+
+class FileServer(ThreadingHTTPServer):
+    """HTTP server serving in-memory files with "Range" support"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.files = {}
+        self.accept_ranges = True
+        self.requests = []
+        # Close the connection after sending the given number of bytes
+        self.interrupt_after = []
+        # {name: checksum} to send "Content-MD5"
+        self.checksums = {}
+        # Respond with the given status codes to the next requests
+        self.fail_with = []
+        self.connections = 0
+        # Respond after the given seconds
+        self.delay = 0
+
+    def add(self, name: str, data: bytes) -> str:
+        self.files[name] = data
+        return self.url(name)
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/{name}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep the connections alive
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_head(self):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        time.sleep(self.server.delay)
+        if len(self.server.fail_with) > 0:
+            self.send_error(self.server.fail_with.pop(0))
+            return None
+        name = self.path.lstrip("/").split("?")[0]
+        if name not in self.server.files:
+            self.send_error(404)
+            return None
+        data = self.server.files[name]
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return None
+
+        start, end = 0, len(data)
+        ma = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range", etag)
+        if self.server.accept_ranges and ma is not None and if_range == etag:
+            start = int(ma.group(1))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            if ma.group(2) != "":
+                end = min(int(ma.group(2)) + 1, len(data))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+
+        if self.server.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("ETag", etag)
+        if name in self.server.checksums:
+            self.send_header("Content-MD5", self.server.checksums[name])
+        self.end_headers()
+        return data[start:end]
+
+    def do_HEAD(self):
+        self._send_head()
+
+    def do_GET(self):
+        data = self._send_head()
+        if data is not None:
+            if len(self.server.interrupt_after) > 0:
+                data = data[: self.server.interrupt_after.pop(0)]
+                self.close_connection = True
+            self.wfile.write(data)
+
+
+@pytest.fixture
+def http_server():
+    server = FileServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def no_socket(monkeypatch):
+    """Fail if a connection is opened"""
+    connections = []
+
+    def _connect(self, address, *args, **kwargs):
+        connections.append(address)
+        raise AssertionError(f"A connection is opened: {address}")
+
+    def _getaddrinfo(host, *args, **kwargs):
+        connections.append(host)
+        raise AssertionError(f"A host name is resolved: {host}")
+
+    monkeypatch.setattr(socket.socket, "connect", _connect)
+    monkeypatch.setattr(socket.socket, "connect_ex", _connect)
+    monkeypatch.setattr(socket, "getaddrinfo", _getaddrinfo)
+    yield connections
+    # Fail even if the error is caught somewhere
+    assert connections == []
+
+
+def _model_files(model_size: int, extra_files: dict = None) -> dict:
+    meta = {
+        "files": {"asr_model_file": "exp/model.pth"},
+        "yaml_files": {"asr_train_config": "exp/config.yaml"},
+    }
+    config = {"model": "exp/model.pth", "token_list": ["a", "b"]}
+    files = {
+        "meta.yaml": yaml.safe_dump(meta).encode(),
+        "exp/config.yaml": yaml.safe_dump(config).encode(),
+        "exp/model.pth": os.urandom(model_size),
+    }
+    files.update(extra_files or {})
+    return files
+
+
+def make_model_zip(model_size: int = 1000, extra_files: dict = None) -> bytes:
+    """Create a zip file in the format of espnet2.main_funcs.pack_funcs.pack"""
+    f = io.BytesIO()
+    with zipfile.ZipFile(f, "w") as z:
+        for name, data in _model_files(model_size, extra_files).items():
+            z.writestr(name, data)
+    return f.getvalue()
+
+
+def make_model_tar(
+    model_size: int = 1000, extra_files: dict = None, mode: str = "w:gz"
+) -> bytes:
+    """Create a tar file in the format of espnet2.main_funcs.pack_funcs.pack"""
+    f = io.BytesIO()
+    with tarfile.open(fileobj=f, mode=mode) as t:
+        for name, data in _model_files(model_size, extra_files).items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            t.addfile(info, io.BytesIO(data))
+    return f.getvalue()
@@ -0,0 +1,81 @@
+import io
+import zipfile
+
+from conftest import make_model_zip
+import pytest
+
+from espnet_model_zoo import artifacts as artifacts_module
+from espnet_model_zoo.artifacts import convert_for_mmap
+from espnet_model_zoo.artifacts import is_mmap_compatible
+from espnet_model_zoo.artifacts import ModelArtifacts
+from espnet_model_zoo.downloader import ModelDownloader
+
+
+def _save(obj, legacy: bool) -> bytes:
+    import torch
+
+    f = io.BytesIO()
+    torch.save(obj, f, _use_new_zipfile_serialization=not legacy)
+    return f.getvalue()
+
+
+def test_model_artifacts_mapping(tmp_path):
+    (tmp_path / "config.yaml").write_text("a: 1\n")
+    (tmp_path / "tokens.txt").write_text("a\n")
+    files = {"config": str(tmp_path / "config.yaml"), "tokens": str(tmp_path / "x")}
+    artifacts = ModelArtifacts(files)
+    assert dict(artifacts) == files
+    assert artifacts.load("config") == {"a": 1}
+    assert artifacts.load("config") is artifacts.load("config")
+    with pytest.raises(ValueError, match="tokens"):
+        artifacts.load("tokens")
+
+
+def test_is_mmap_compatible(tmp_path):
+    with zipfile.ZipFile(tmp_path / "a.pth", "w") as z:
+        z.writestr("a/data.pkl", b"")
+    (tmp_path / "b.pth").write_bytes(b"\x80\x02legacy")
+    assert is_mmap_compatible(tmp_path / "a.pth")
+    assert not is_mmap_compatible(tmp_path / "b.pth")
+
+
+def test_convert_for_mmap(tmp_path):
+    torch = pytest.importorskip("torch")
+    state = {"w": torch.arange(10.0)}
+    path = tmp_path / "model.pth"
+    path.write_bytes(_save(state, legacy=True))
+
+    assert convert_for_mmap(path)
+    assert is_mmap_compatible(path)
+    assert not convert_for_mmap(path)
+    assert [p.name for p in tmp_path.iterdir()] == ["model.pth"]
+    loaded = ModelArtifacts({"model": str(path)}).load("model")
+    assert torch.equal(loaded["w"], state["w"])
+
+
+def test_load_artifacts(tmp_path, http_server):
+    torch = pytest.importorskip("torch")
+    state = {"w": torch.ones(3)}
+    data = make_model_zip(extra_files={"exp/model.pth": _save(state, legacy=True)})
+    url = http_server.add("model.zip", data)
+
+    d = ModelDownloader(tmp_path)
+    artifacts = d.load_artifacts(url, quiet=True)
+    assert dict(artifacts) == d.download_and_unpack(url, quiet=True)
+    assert is_mmap_compatible(artifacts["asr_model_file"])
+    assert torch.equal(artifacts.load("asr_model_file")["w"], state["w"])
+    assert artifacts.load("asr_train_config")["token_list"] == ["a", "b"]
+
+
+def test_load_artifacts_skips_huggingface(tmp_path, monkeypatch):
+    # A snapshot of huggingface_hub in the cache directory
+    snapshot = tmp_path / "models--espnet--a" / "snapshots" / "0"
+    snapshot.mkdir(parents=True)
+    (snapshot / "model.pth").write_bytes(b"\x80\x02legacy")
+    info = {"asr_model_file": str(snapshot / "model.pth")}
+
+    d = ModelDownloader(tmp_path)
+    monkeypatch.setattr(d, "download_and_unpack", lambda *args, **kwargs: info)
+    monkeypatch.setattr(artifacts_module, "convert_for_mmap", None)
+    assert dict(d.load_artifacts("espnet/a")) == info
+    assert list((tmp_path / "models--espnet--a").glob("*.lock")) == []
@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+from pathlib import Path
+import threading
+
+import pytest
+import yaml
+
+from conftest import make_model_zip
+from espnet_model_zoo import async_downloader
+from espnet_model_zoo.async_downloader import AsyncModelDownloader
+from espnet_model_zoo.downloader import DownloadJournal
+from espnet_model_zoo.downloader import ModelDownloader
+from espnet_model_zoo.downloader import NotCachedError
+from espnet_model_zoo.lease import Lease
+
+
+def test_download_concurrently(tmp_path, http_server):
+    urls = [http_server.add(f"model{i}.zip", make_model_zip()) for i in range(5)]
+
+    async def main():
+        async with AsyncModelDownloader(tmp_path) as d:
+            return await asyncio.gather(*[d.download(url) for url in urls])
+
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        paths = asyncio.run(main())
+    for i, (url, path) in enumerate(zip(urls, paths)):
+        assert Path(path).read_bytes() == http_server.files[f"model{i}.zip"]
+        # Compatible with ModelDownloader
+        assert ModelDownloader(tmp_path).download(url) == path
+
+
+def test_download_and_unpack_concurrently(tmp_path, http_server):
+    url = http_server.add("model.zip", make_model_zip())
+
+    async def main():
+        async with AsyncModelDownloader(tmp_path) as d:
+            return await asyncio.gather(*[d.download_and_unpack(url) for _ in range(3)])
+
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        results = asyncio.run(main())
+    assert results[0] == results[1] == results[2]
+    with open(results[0]["asr_train_config"]) as f:
+        assert yaml.safe_load(f)["model"] == results[0]["asr_model_file"]
+    # Downloaded only once
+    assert [m for m, _, _ in http_server.requests] == ["HEAD", "GET"]
+
+
+def test_download_resume(tmp_path, http_server, monkeypatch):
+    url = http_server.add("model.zip", make_model_zip(100000))
+    http_server.interrupt_after = [30000]
+    trials = []
+
+    def _get_backoff_time(session, url, trial):
+        trials.append(trial)
+        return 0.01
+
+    monkeypatch.setattr(async_downloader, "get_backoff_time", _get_backoff_time)
+
+    async def main():
+        async with AsyncModelDownloader(tmp_path, chunk_size=1000) as d:
+            return await d.download(url)
+
+    with pytest.warns(UserWarning, match="resumed"):
+        path = asyncio.run(main())
+    assert Path(path).read_bytes() == http_server.files["model.zip"]
+    assert "Range" in http_server.requests[-1][2]
+    assert trials == [0]
+
+
+def test_lease_released_in_executor(tmp_path, http_server, monkeypatch):
+    url = http_server.add("model.zip", make_model_zip())
+    threads = []
+    release = Lease.release
+
+    def _release(self):
+        threads.append(threading.get_ident())
+        release(self)
+
+    monkeypatch.setattr(Lease, "release", _release)
+
+    async def main():
+        async with AsyncModelDownloader(tmp_path) as d:
+            return await d.download_and_unpack(url)
+
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        asyncio.run(main())
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
+
+
+@pytest.mark.parametrize("complete", [True, False])
+def test_download_resume_beyond_end(tmp_path, http_server, complete):
+    data = make_model_zip()
+    url = http_server.add("model.zip", data)
+    journal = DownloadJournal(tmp_path / "model.zip")
+    if complete:
+        # The process died before finalizing the downloaded data
+        journal.reset(url, {}, len(data))
+        journal.part.write_bytes(data)
+    else:
+        # The remote object was replaced by a smaller one
+        journal.reset(url, {})
+        journal.part.write_bytes(data * 2)
+    journal.add_range(0, journal.part.stat().st_size)
+
+    async def main():
+        async with AsyncModelDownloader(tmp_path) as d:
+            return await d._download(url, tmp_path / "model.zip")
+
+    digests = asyncio.run(main())
+    assert (tmp_path / "model.zip").read_bytes() == data
+    assert digests["md5"] == hashlib.md5(data).hexdigest()
+    assert len(http_server.requests) == (0 if complete else 2)
+
+
+def test_query(tmp_path):
+    d = AsyncModelDownloader(tmp_path)
+    assert asyncio.run(d.query("name", name="test")) == ["test"]
+
+
+def test_offline(tmp_path, http_server, request):
+    url = http_server.add("model.zip", make_model_zip())
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        info = ModelDownloader(tmp_path, metadata_ttl=0).download_and_unpack(url)
+    request.getfixturevalue("no_socket")
+
+    async def main(url):
+        async with AsyncModelDownloader(tmp_path, offline=True) as d:
+            return await d.download_and_unpack(url)
+
+    assert asyncio.run(main(url)) == info
+    with pytest.raises(NotCachedError):
+        asyncio.run(main(http_server.url("not_cached.zip")))
+
+
+def test_update_model_table(tmp_path, http_server, monkeypatch):
+    from espnet_model_zoo import async_downloader
+
+    url = http_server.add("table.csv", b"name,url\na,http://a\n")
+    monkeypatch.setattr(async_downloader, "MODELS_URL", url)
+
+    async def main():
+        async with AsyncModelDownloader(tmp_path) as d:
+            d.downloader.csv = tmp_path / "table.csv"
+            return [await d.update_model_table() for _ in range(2)], await d.query()
+
+    assert asyncio.run(main()) == ([True, False], ["a"])
+    assert "If-None-Match" in http_server.requests[-1][2]
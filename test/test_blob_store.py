@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+from espnet_model_zoo.blob_store import BlobStore
+
+
+def _write(path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_ingest(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    data = os.urandom(1000)
+    a = _write(tmp_path / "a" / "model.pth", data)
+    b = _write(tmp_path / "b" / "model.pth", data)
+    digest = store.ingest(a)
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert store.ingest(b, digest) == digest
+    # Ingesting again is no-op
+    assert store.ingest(b) == digest
+
+    assert os.path.samefile(a, b)
+    assert os.path.samefile(a, store.path(digest))
+    assert a.stat().st_nlink == 3
+    assert b.read_bytes() == data
+
+
+def test_lookup_and_link(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    data = os.urandom(1000)
+    digest = store.ingest(_write(tmp_path / "a" / "model.zip", data))
+    md5 = hashlib.md5(data).hexdigest()
+    store.add_alias("md5", md5, digest)
+
+    assert store.lookup("sha256", digest) == digest
+    assert store.lookup("md5", md5.upper()) == digest
+    assert store.lookup("md5", "0" * 32) is None
+    assert store.lookup("sha256", "0" * 64) is None
+
+    (tmp_path / "b").mkdir()
+    assert store.link(digest, tmp_path / "b" / "model.zip")
+    assert (tmp_path / "b" / "model.zip").read_bytes() == data
+    assert not store.link("0" * 64, tmp_path / "b" / "other.zip")
+    assert not (tmp_path / "b" / "other.zip").exists()
+
+
+def test_ingest_tree(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    _write(tmp_path / "a" / "exp" / "model.pth", b"model")
+    _write(tmp_path / "a" / "exp" / "config.yaml", b"config")
+    _write(tmp_path / "a" / "metadata.json", b"{}")
+    os.symlink(tmp_path / "a" / "exp" / "model.pth", tmp_path / "a" / "link.pth")
+
+    digests = store.ingest_tree(tmp_path / "a", exclude=[".yaml", "metadata.json"])
+    assert digests == {
+        str(tmp_path / "a" / "exp" / "model.pth"): hashlib.sha256(b"model").hexdigest()
+    }
+    assert store.ingest_tree(tmp_path / "a", exclude=[".yaml", "metadata.json"]) == {}
+
+
+def test_gc(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    a = _write(tmp_path / "a" / "model.pth", b"aaa")
+    b = _write(tmp_path / "b" / "model.pth", b"bb")
+    digest_a = store.ingest(a)
+    digest_b = store.ingest(b)
+    store.add_alias("md5", hashlib.md5(b"bb").hexdigest(), digest_b)
+
+    assert store.gc() == {"removed": 0, "freed": 0}
+    b.unlink()
+    assert store.gc() == {"removed": 1, "freed": 2}
+    assert store.lookup("sha256", digest_a) == digest_a
+    assert store.lookup("sha256", digest_b) is None
+    assert not store.path(hashlib.md5(b"bb").hexdigest(), "md5").exists()
+    assert a.read_bytes() == b"aaa"
+
+
+def test_gc_not_existing(tmp_path):
+    assert BlobStore(tmp_path / "blobs").gc() == {"removed": 0, "freed": 0}
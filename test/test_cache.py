@@ -0,0 +1,137 @@
+from pathlib import Path
+
+from filelock import FileLock
+import pytest
+
+from espnet_model_zoo.cache import CacheManager
+from espnet_model_zoo.cache import parse_size
+from espnet_model_zoo.cache import read_metadata
+from espnet_model_zoo.cache import write_metadata
+from espnet_model_zoo.downloader import cmd_cache
+from espnet_model_zoo.downloader import str_to_hash
+
+
+def _add_entry(cachedir: Path, name: str, size: int, last_access: float, hits: int):
+    outdir = cachedir / str_to_hash(name)
+    outdir.mkdir(parents=True)
+    (outdir / "model.zip").write_bytes(b"a" * size)
+    (outdir / "exp").mkdir()
+    (outdir / "exp" / "model.pth").write_bytes(b"b" * size)
+    write_metadata(
+        outdir, url=name, filename="model.zip", last_access=last_access, hits=hits
+    )
+    return outdir
+
+
+@pytest.fixture
+def cachedir(tmp_path):
+    _add_entry(tmp_path, "a", 1000, last_access=100.0, hits=5)
+    _add_entry(tmp_path, "b", 1000, last_access=200.0, hits=1)
+    _add_entry(tmp_path, "c", 1000, last_access=300.0, hits=3)
+    # Not an entry
+    (tmp_path / "table.csv").write_text("name,url\n")
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "size, expected",
+    [("1000", 1000), ("1.5K", 1536), ("10M", 10 << 20), ("2GiB", 2 << 30)],
+)
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        parse_size("10X")
+
+
+def test_entries(cachedir):
+    entries = CacheManager(cachedir).entries()
+    assert [e["url"] for e in entries] == ["a", "b", "c"]
+    assert all(e["size"] > 2000 for e in entries)
+    assert [e["url"] for e in CacheManager(cachedir, policy="lfu").entries()] == [
+        "b",
+        "c",
+        "a",
+    ]
+
+
+def test_stats(cachedir):
+    stats = CacheManager(cachedir, max_size=10000).stats()
+    assert stats["num_entries"] == 3
+    assert stats["hits"] == 9
+    assert stats["size"] == sum(e["size"] for e in stats["entries"])
+    assert stats["max_size"] == 10000
+
+
+def test_stats_not_existing(tmp_path):
+    assert CacheManager(tmp_path / "not_existing").stats()["num_entries"] == 0
+
+
+def test_touch(cachedir):
+    outdir = cachedir / str_to_hash("b")
+    CacheManager(cachedir).touch(outdir)
+    metadata = read_metadata(outdir)
+    assert metadata["hits"] == 2
+    assert metadata["last_access"] > 300.0
+    assert metadata["url"] == "b"
+
+
+@pytest.mark.parametrize("policy, expected", [("lru", ["a", "b"]), ("lfu", ["b", "c"])])
+def test_prune(cachedir, policy, expected):
+    cache = CacheManager(cachedir, policy=policy)
+    size = cache.stats()["size"]
+    removed = cache.prune(max_size=size // 3)
+    assert [e["url"] for e in removed] == expected
+    assert [e["url"] for e in cache.entries()] == sorted(set("abc") - set(expected))
+    # The lock files are removed with the directory
+    assert not Path(removed[0]["path"]).exists()
+
+
+def test_prune_with_max_size(cachedir):
+    cache = CacheManager(cachedir, max_size=10**9)
+    assert cache.prune() == []
+    assert len(cache.prune(max_size=0)) == 3
+    assert (cachedir / "table.csv").exists()
+
+
+def test_prune_skips_entries_in_use(cachedir):
+    cache = CacheManager(cachedir)
+    lock = FileLock(str(cachedir / str_to_hash("a") / "model.zip.lock"))
+    with lock:
+        removed = cache.prune(max_size=0, keep=[cachedir / str_to_hash("c")])
+    assert [e["url"] for e in removed] == ["b"]
+    assert [e["url"] for e in cache.entries()] == ["a", "c"]
+
+
+def test_prune_skips_held_entries(cachedir):
+    cache = CacheManager(cachedir)
+    outdir = cachedir / str_to_hash("a")
+    with cache.hold(outdir):
+        removed = cache.prune(max_size=0)
+        assert [e["url"] for e in removed] == ["b", "c"]
+        assert (outdir / "model.zip").exists()
+    assert list(outdir.glob("in_use.*")) == []
+    assert [e["url"] for e in cache.prune(max_size=0)] == ["a"]
+
+
+def test_remove_not_existing(tmp_path):
+    assert CacheManager(tmp_path).remove(tmp_path / "not_existing")
+
+
+def test_cmd_cache(cachedir, capsys):
+    cmd_cache(["--cachedir", str(cachedir), "list"])
+    out = capsys.readouterr().out
+    assert "Total: " in out and "in 3 entries, 9 hits" in out
+
+    cmd_cache(
+        ["--cachedir", str(cachedir), "--policy", "lfu", "prune", "--max_size", "0"]
+    )
+    assert capsys.readouterr().out.count("Removed") == 3
+    assert CacheManager(cachedir).entries() == []
+
+
+def test_cmd_cache_gc(cachedir, capsys):
+    cmd_cache(["--cachedir", str(cachedir), "gc"])
+    assert capsys.readouterr().out == "Removed 0 files (0)\n"
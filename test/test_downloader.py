@@ -1,10 +1,28 @@
+import hashlib
+import json
+import os
 from pathlib import Path
 import pytest
+import socket
+import subprocess
+import sys
 
+from conftest import make_model_tar
+from conftest import make_model_zip
+
+from espnet_model_zoo import downloader
 from espnet_model_zoo.downloader import cmd_download
+from espnet_model_zoo.downloader import cmd_prefetch
 from espnet_model_zoo.downloader import cmd_query
+from espnet_model_zoo.downloader import cmd_verify
 from espnet_model_zoo.downloader import download
+from espnet_model_zoo.downloader import DownloadJournal
 from espnet_model_zoo.downloader import ModelDownloader
+from espnet_model_zoo.downloader import NotCachedError
+from espnet_model_zoo.downloader import str_to_hash
+from espnet_model_zoo.downloader import StreamHasher
+from espnet_model_zoo.model_table import ModelTable
+from espnet_model_zoo.session import create_session
 
 
 def test_download():
@@ -76,9 +94,635 @@ def test_download_and_clean_cache():
     assert not Path(p).exists()
 
 
+def test_clean_cache_not_existing(tmp_path, http_server):
+    ModelDownloader(tmp_path).clean_cache(http_server.url("model.zip"))
+
+
 def test_cmd_download():
     cmd_download(["test"])
 
 
-def test_query():
-    cmd_query([])
+@pytest.mark.parametrize(
+    "cmd", [[], ["task=asr", "lang=en,ja", "or", "fs>16000", "name^=kan-bayashi/"]]
+)
+def test_query(cmd):
+    cmd_query(cmd)
+
+
+def test_query_batch(tmp_path, capsys):
+    d = ModelDownloader()
+    asr, tts = d.query_batch([{"task": "asr"}, [{"task": "tts", "fs": ["22050"]}]])
+    assert asr == d.query(task="asr")
+    assert tts == d.query(task="tts", fs="22050")
+    with pytest.warns(UserWarning, match="Invalid key"):
+        assert d.query_batch([{"dummy": "a", "task": "asr"}]) == [asr]
+
+    batch = tmp_path / "queries.txt"
+    batch.write_text("# comment\ntask=asr\n\n'name~=^kan-bayashi/.* ljspeech'\n")
+    cmd_query(["--batch", str(batch), "--key", "task"])
+    out = capsys.readouterr().out
+    assert out.startswith("# task=asr\nasr\n")
+    assert "# 'name~=^kan-bayashi/.* ljspeech'\n" in out
+
+
+@pytest.mark.parametrize("accept_ranges", [True, False])
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_download_parallel(tmp_path, http_server, accept_ranges, num_workers):
+    http_server.accept_ranges = accept_ranges
+    data = os.urandom(100000)
+    url = http_server.add("model.zip", data)
+    download(
+        url,
+        tmp_path / "model.zip",
+        quiet=True,
+        num_workers=num_workers,
+        segment_size=7000,
+    )
+    assert (tmp_path / "model.zip").read_bytes() == data
+
+    n_ranged = sum(1 for _, _, h in http_server.requests if "Range" in h)
+    if accept_ranges and num_workers > 1:
+        assert n_ranged == 15
+    else:
+        assert n_ranged == 0
+
+
+def test_download_with_num_workers(tmp_path, http_server):
+    data = os.urandom(10000)
+    url = http_server.add("model.zip", data)
+    d = ModelDownloader(tmp_path, num_workers=3)
+    path = d.download(url, quiet=True)
+    assert Path(path).read_bytes() == data
+
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_download_resume_after_interruption(tmp_path, http_server, num_workers):
+    data = os.urandom(100000)
+    url = http_server.add("model.zip", data)
+    http_server.interrupt_after = [3000]
+    with pytest.warns(UserWarning, match="resumed"):
+        download(
+            url,
+            tmp_path / "model.zip",
+            quiet=True,
+            chunk_size=1000,
+            num_workers=num_workers,
+            segment_size=40000,
+        )
+    assert (tmp_path / "model.zip").read_bytes() == data
+    assert not (tmp_path / "model.zip.part").exists()
+    assert not (tmp_path / "model.zip.part.json").exists()
+
+    # Resumed from the middle of the interrupted range
+    starts = [
+        int(h["Range"][len("bytes=") :].split("-")[0])
+        for _, _, h in http_server.requests
+        if "Range" in h
+    ]
+    assert any(s % 40000 != 0 for s in starts)
+
+
+def test_download_resume_from_journal(tmp_path, http_server):
+    data = os.urandom(100000)
+    url = http_server.add("model.zip", data)
+    http_server.interrupt_after = [30000]
+    with pytest.raises(Exception):
+        download(url, tmp_path / "model.zip", retry=0, quiet=True, chunk_size=1000)
+    assert (tmp_path / "model.zip.part").exists()
+    assert (tmp_path / "model.zip.part.json").exists()
+
+    download(url, tmp_path / "model.zip", quiet=True)
+    assert (tmp_path / "model.zip").read_bytes() == data
+    assert http_server.requests[-1][2]["Range"] in ("bytes=29000-", "bytes=30000-")
+
+
+def _write_journal(output_path: Path, url: str, data: bytes, size: int = None):
+    journal = DownloadJournal(output_path)
+    journal.reset(url, {}, size)
+    journal.part.write_bytes(data)
+    journal.add_range(0, len(data))
+
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_download_complete_journal(tmp_path, http_server, num_workers):
+    # The process died before finalizing the downloaded data
+    data = os.urandom(10000)
+    url = http_server.add("model.zip", data)
+    _write_journal(tmp_path / "model.zip", url, data, len(data))
+    digests = download(url, tmp_path / "model.zip", quiet=True, num_workers=num_workers)
+    assert (tmp_path / "model.zip").read_bytes() == data
+    assert digests["md5"] == hashlib.md5(data).hexdigest()
+    assert http_server.requests == []
+
+
+def test_download_restart_if_range_not_satisfiable(tmp_path, http_server):
+    # The remote object was replaced by a smaller one
+    data = os.urandom(10000)
+    url = http_server.add("model.zip", data)
+    _write_journal(tmp_path / "model.zip", url, os.urandom(20000))
+    download(url, tmp_path / "model.zip", quiet=True)
+    assert (tmp_path / "model.zip").read_bytes() == data
+    assert [h.get("Range") for _, _, h in http_server.requests] == [
+        "bytes=20000-",
+        None,
+    ]
+
+
+def test_download_restart_if_modified(tmp_path, http_server):
+    url = http_server.add("model.zip", os.urandom(100000))
+    http_server.interrupt_after = [30000]
+    with pytest.raises(Exception):
+        download(url, tmp_path / "model.zip", retry=0, quiet=True, chunk_size=1000)
+
+    data = os.urandom(100000)
+    http_server.add("model.zip", data)
+    download(url, tmp_path / "model.zip", quiet=True)
+    assert (tmp_path / "model.zip").read_bytes() == data
+
+
+def test_download_warm_cache_without_network(tmp_path, http_server):
+    data = os.urandom(10000)
+    url = http_server.add("model.zip", data)
+    http_server.checksums["model.zip"] = hashlib.md5(data).hexdigest()
+    path = ModelDownloader(tmp_path).download(url, quiet=True)
+    assert [m for m, _, _ in http_server.requests] == ["HEAD", "GET"]
+
+    http_server.requests.clear()
+    assert ModelDownloader(tmp_path).download(url, quiet=True) == path
+    assert http_server.requests == []
+
+
+def test_download_metadata_within_ttl(tmp_path, http_server):
+    url = http_server.add("model.zip", os.urandom(10000))
+    http_server.checksums["model.zip"] = hashlib.md5(b"").hexdigest()
+    d = ModelDownloader(tmp_path)
+    with pytest.raises(RuntimeError, match="Failed to download file"):
+        d.download(url, quiet=True)
+
+    # Checksum error invalidates the metadata
+    http_server.checksums.pop("model.zip")
+    http_server.requests.clear()
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        d.download(url, quiet=True)
+    assert [m for m, _, _ in http_server.requests] == ["HEAD", "GET"]
+
+    # HEAD is skipped if the metadata is fresh
+    Path(d.download(url)).unlink()
+    http_server.requests.clear()
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        d.download(url, quiet=True)
+    assert [m for m, _, _ in http_server.requests] == ["GET"]
+
+
+HEAVY_MODULES = (
+    "espnet2",
+    "filelock",
+    "huggingface_hub",
+    "pandas",
+    "requests",
+    "torch",
+    "tqdm",
+    "yaml",
+)
+
+
+def _imported_modules(code: str) -> dict:
+    # Return {module name: cumulative import time in microseconds}
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    modules = {}
+    for line in p.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return modules
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import espnet_model_zoo.downloader",
+        "from espnet_model_zoo.downloader import cmd_query; cmd_query([])",
+        "from espnet_model_zoo.downloader import cmd_query; cmd_query(['task=asr'])",
+    ],
+)
+def test_import_time_of_cli(code):
+    modules = _imported_modules(code)
+    heavy = [m for m in modules if m.split(".")[0] in HEAVY_MODULES]
+    assert heavy == []
+    # Generous budget to detect regressions, e.g. importing torch transitively
+    assert modules["espnet_model_zoo.downloader"] < 1000000
+
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_download_returns_digests(tmp_path, http_server, num_workers):
+    data = os.urandom(100000)
+    url = http_server.add("model.zip", data)
+    http_server.interrupt_after = [3000]
+    with pytest.warns(UserWarning, match="resumed"):
+        digests = download(
+            url,
+            tmp_path / "model.zip",
+            quiet=True,
+            chunk_size=1000,
+            num_workers=num_workers,
+            segment_size=7000,
+        )
+    assert digests == {
+        "md5": hashlib.md5(data).hexdigest(),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+
+
+def test_stream_hasher_out_of_order(tmp_path):
+    data = os.urandom(1000)
+    (tmp_path / "a").write_bytes(data)
+    hasher = StreamHasher(["sha256"], max_pending=300)
+    for offset in [500, 100, 0, 200, 300, 900, 800, 700, 600, 400]:
+        hasher.update(offset, data[offset : offset + 100])
+    assert hasher.overflow
+    assert hasher.hexdigests(tmp_path / "a") == {
+        "sha256": hashlib.sha256(data).hexdigest()
+    }
+
+
+def test_verify(tmp_path, http_server):
+    data = os.urandom(10000)
+    url = http_server.add("model.zip", data)
+    manifest = tmp_path / "checksums.sha256"
+    manifest.write_text(f"{hashlib.sha256(data).hexdigest()}  model.zip\n")
+    d = ModelDownloader(tmp_path / "cache", checksum_manifest=manifest)
+    with pytest.raises(FileNotFoundError):
+        d.verify(url)
+
+    path = d.download(url, quiet=True)
+    assert d.verify(url)
+    cmd_verify([url, "--cachedir", str(tmp_path / "cache")])
+
+    Path(path).write_bytes(b"broken")
+    assert not d.verify(url)
+    with pytest.raises(SystemExit):
+        cmd_verify([url, "--cachedir", str(tmp_path / "cache")])
+
+
+def test_download_checksum_from_manifest(tmp_path, http_server):
+    url = http_server.add("model.zip", os.urandom(10000))
+    manifest = tmp_path / "checksums.sha256"
+    manifest.write_text(f"{hashlib.sha256(b'').hexdigest()}  {url}\n")
+    d = ModelDownloader(tmp_path / "cache", checksum_manifest=manifest)
+    with pytest.raises(RuntimeError, match="Failed to download file"):
+        d.download(url, quiet=True)
+
+
+def test_prefetch(tmp_path, http_server):
+    url1 = http_server.add("model1.zip", make_model_zip())
+    url2 = http_server.add("model2.zip", make_model_zip())
+    url3 = http_server.url("not_found.zip")
+    d = ModelDownloader(tmp_path)
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        reports = d.prefetch([url1, url2, url1, url3], max_workers=3)
+
+    assert [r["name"] for r in reports] == [url1, url2, url1, url3]
+    # The same URL is downloaded only once
+    assert sorted(p for m, p, _ in http_server.requests if m == "GET") == [
+        "/model1.zip",
+        "/model2.zip",
+        "/not_found.zip",
+    ]
+    for r in reports[:3]:
+        assert r["error"] is None
+        assert not r["cached"]
+        assert r["bytes"] == len(http_server.files[Path(r["path"]).name])
+        assert Path(r["info"]["asr_model_file"]).exists()
+    assert reports[0]["info"] == reports[2]["info"]
+    assert "404" in reports[3]["error"]
+
+    reports = d.prefetch([url1], unpack=False)
+    assert reports[0]["cached"]
+    assert "info" not in reports[0]
+
+
+def test_prefetch_all_versions(tmp_path, http_server):
+    url1 = http_server.add("model1.zip", make_model_zip())
+    url2 = http_server.add("model2.zip", make_model_zip())
+    d = ModelDownloader(tmp_path)
+    # Two versions of a model
+    d.table = ModelTable(["name", "url"], [["a", url1], ["a", url2]])
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        reports = d.prefetch([{"name": "a"}])
+    assert [r["url"] for r in reports] == [url1, url2]
+    for r in reports:
+        assert r["error"] is None
+        assert r["path"] == str(tmp_path / str_to_hash(r["url"]) / Path(r["url"]).name)
+
+
+def test_cmd_prefetch(tmp_path, http_server):
+    url1 = http_server.add("model1.zip", make_model_zip())
+    url2 = http_server.add("model2.zip", make_model_zip())
+    manifest = tmp_path / "models.txt"
+    manifest.write_text(f"# comment\n{url2}\n")
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        cmd_prefetch(
+            [url1, "--manifest", str(manifest), "--cachedir", str(tmp_path / "c")]
+        )
+    assert len([m for m, _, _ in http_server.requests if m == "GET"]) == 2
+
+    with pytest.raises(SystemExit):
+        cmd_prefetch(
+            [http_server.url("not_found.zip"), "--cachedir", str(tmp_path / "c")]
+        )
+
+
+def test_download_records_access(tmp_path, http_server):
+    url = http_server.add("model.zip", make_model_zip())
+    d = ModelDownloader(tmp_path)
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        d.download_and_unpack(url, quiet=True)
+    d.download_and_unpack(url, quiet=True)
+    d.download(url, quiet=True)
+    stats = d.cache_stats()
+    assert stats["num_entries"] == 1
+    assert stats["entries"][0]["hits"] == 3
+
+
+def test_download_with_max_cache_size(tmp_path, http_server):
+    urls = [http_server.add(f"model{i}.zip", make_model_zip(10000)) for i in range(3)]
+    d = ModelDownloader(tmp_path, max_cache_size="30K")
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        infos = [d.download_and_unpack(url, quiet=True) for url in urls]
+
+    # Each entry has the zip file and the unpacked files, i.e. > 20K
+    assert [e["url"] for e in d.cache_stats()["entries"]] == [urls[2]]
+    assert not Path(infos[0]["asr_model_file"]).exists()
+    assert Path(infos[2]["asr_model_file"]).exists()
+
+    # Evicted entries are downloaded again
+    http_server.requests.clear()
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        d.download_and_unpack(urls[0], quiet=True)
+    assert [m for m, _, _ in http_server.requests] == ["HEAD", "GET"]
+
+
+@pytest.mark.parametrize("interrupt_after", [[], [30000]])
+def test_download_and_unpack_tar_while_downloading(
+    tmp_path, http_server, monkeypatch, interrupt_after
+):
+    import espnet_model_zoo.unpack
+
+    def _unpack(*args, **kwargs):
+        raise AssertionError("Must be extracted while downloading")
+
+    url = http_server.add("model.tar.gz", make_model_tar(100000))
+    http_server.interrupt_after = interrupt_after
+    monkeypatch.setattr(espnet_model_zoo.unpack, "unpack", _unpack)
+    d = ModelDownloader(tmp_path)
+    with pytest.warns(UserWarning):
+        info = d.download_and_unpack(url, quiet=True)
+    assert Path(info["asr_model_file"]).stat().st_size == 100000
+    assert (Path(info["asr_model_file"]).parent.parent / "meta.yaml").exists()
+
+
+def test_download_and_unpack_warm_cache(tmp_path, http_server, monkeypatch):
+    import espnet_model_zoo.unpack
+
+    url = http_server.add("model.zip", make_model_zip())
+    d = ModelDownloader(tmp_path)
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        info = d.download_and_unpack(url, quiet=True)
+
+    # Not extracted again
+    monkeypatch.setattr(espnet_model_zoo.unpack, "unpack", None)
+    http_server.requests.clear()
+    assert d.download_and_unpack(url, quiet=True) == info
+    assert http_server.requests == []
+
+
+def test_download_with_dedupe(tmp_path, http_server):
+    data = make_model_zip(10000, extra_files={"exp/tokens.txt": b"a\nb\n"})
+    url1 = http_server.add("model1.zip", data)
+    url2 = http_server.add("model2.zip", data)
+    url3 = http_server.add(
+        "model3.zip", make_model_zip(extra_files={"exp/tokens.txt": b"a\nb\n"})
+    )
+    http_server.checksums["model1.zip"] = hashlib.md5(data).hexdigest()
+    http_server.checksums["model2.zip"] = hashlib.md5(data).hexdigest()
+    d = ModelDownloader(tmp_path, dedupe=True)
+    info1 = d.download_and_unpack(url1, quiet=True)
+
+    # The same file is linked without downloading
+    http_server.requests.clear()
+    info2 = d.download_and_unpack(url2, quiet=True)
+    assert [m for m, _, _ in http_server.requests] == ["HEAD"]
+    assert os.path.samefile(d.download(url1), d.download(url2))
+    assert os.path.samefile(info1["asr_model_file"], info2["asr_model_file"])
+    assert d.verify(url2)
+
+    # The identical files in the different archives are shared
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        info3 = d.download_and_unpack(url3, quiet=True)
+    tokens = [Path(i["asr_model_file"]).parent / "tokens.txt" for i in (info1, info3)]
+    assert os.path.samefile(*tokens)
+    assert not os.path.samefile(info1["asr_model_file"], info3["asr_model_file"])
+
+    # Unreferenced files are removed after all entries using them are removed
+    d.clean_cache(url1)
+    assert d.blob_store.gc()["removed"] == 0
+    d.clean_cache(url2)
+    assert d.blob_store.gc()["removed"] == 2
+    assert tokens[1].read_bytes() == b"a\nb\n"
+
+
+def test_unpack_cache_dir_for_huggingface(tmp_path, monkeypatch):
+    import yaml
+
+    meta = {
+        "files": {"asr_model_file": "exp/model.pth"},
+        "yaml_files": {"asr_train_config": "exp/config.yaml"},
+    }
+    config = {"model": "exp/model.pth", "stats": ["exp/stats/0.npy", "other"]}
+    (tmp_path / "exp" / "stats").mkdir(parents=True)
+    (tmp_path / "meta.yaml").write_text(yaml.safe_dump(meta))
+    (tmp_path / "exp" / "config.yaml").write_text(yaml.safe_dump(config))
+    (tmp_path / "exp" / "model.pth").write_bytes(b"")
+    (tmp_path / "exp" / "stats" / "0.npy").write_bytes(b"")
+
+    retval = ModelDownloader._unpack_cache_dir_for_huggingface(str(tmp_path))
+    assert retval == {
+        "asr_train_config": str(tmp_path / "exp" / "config.yaml"),
+        "asr_model_file": str(tmp_path / "exp" / "model.pth"),
+    }
+    config = yaml.safe_load((tmp_path / "exp" / "config.yaml").read_text())
+    assert config == {
+        "model": str(tmp_path / "exp" / "model.pth"),
+        "stats": [str(tmp_path / "exp" / "stats" / "0.npy"), "other"],
+    }
+    assert (tmp_path / ".done").exists()
+    assert json.loads((tmp_path / ".done.json").read_text()) == retval
+
+    # The warm call reads only the stored return value
+    (tmp_path / "meta.yaml").unlink()
+    assert ModelDownloader._unpack_cache_dir_for_huggingface(str(tmp_path)) == retval
+
+
+@pytest.fixture
+def cached_model(tmp_path, http_server):
+    data = make_model_zip()
+    url = http_server.add("model.zip", data)
+    http_server.checksums["model.zip"] = hashlib.md5(data).hexdigest()
+    # The metadata is always expired
+    info = ModelDownloader(tmp_path, metadata_ttl=0).download_and_unpack(url)
+    return url, info
+
+
+def test_offline(tmp_path, cached_model, no_socket):
+    url, info = cached_model
+    d = ModelDownloader(tmp_path, offline=True)
+    assert d.download_and_unpack(url) == info
+    assert Path(d.download(url)).exists()
+    assert d.verify(url)
+    d.prefetch([url])
+
+    # Unpacking from the cached file
+    Path(info["asr_model_file"]).unlink()
+    assert d.download_and_unpack(url) == info
+
+
+@pytest.mark.parametrize("value", ["1", "true"])
+def test_offline_by_env(tmp_path, cached_model, no_socket, monkeypatch, value):
+    url, info = cached_model
+    monkeypatch.setenv("ESPNET_MODEL_ZOO_OFFLINE", value)
+    d = ModelDownloader(tmp_path)
+    assert d.offline
+    assert d.download_and_unpack(url) == info
+    with pytest.raises(NotCachedError, match="ESPNET_MODEL_ZOO_OFFLINE"):
+        d.update_model_table()
+
+
+def test_offline_not_cached(tmp_path, http_server, no_socket):
+    url = http_server.url("model.zip")
+    d = ModelDownloader(tmp_path, offline=True)
+    with pytest.raises(NotCachedError, match="offline mode"):
+        d.download(url)
+    with pytest.raises(NotCachedError):
+        d.download_and_unpack(url)
+    report = d.prefetch([url])[0]
+    assert report["error"].startswith("NotCachedError")
+
+
+def test_offline_evicted_file(tmp_path, cached_model, no_socket):
+    url, info = cached_model
+    d = ModelDownloader(tmp_path, offline=True)
+    Path(d.download(url)).unlink()
+    Path(info["asr_model_file"]).unlink()
+    with pytest.raises(NotCachedError):
+        d.download_and_unpack(url)
+
+
+def test_offline_huggingface(tmp_path, monkeypatch, no_socket):
+    import huggingface_hub
+    from huggingface_hub.utils import LocalEntryNotFoundError
+
+    calls = []
+
+    def snapshot_download(repo_id, **kwargs):
+        calls.append(kwargs)
+        raise LocalEntryNotFoundError("Not found")
+
+    monkeypatch.setattr(huggingface_hub, "snapshot_download", snapshot_download)
+    d = ModelDownloader(tmp_path, offline=True)
+    with pytest.raises(NotCachedError, match="espnet/model"):
+        d.download("https://huggingface.co/espnet/model")
+    assert calls[0]["local_files_only"]
+
+
+def test_session_reuses_connection(tmp_path, http_server):
+    urls = [
+        http_server.add("a.zip", make_model_zip()),
+        http_server.add("b.tar.gz", make_model_tar()),
+    ]
+    d = ModelDownloader(tmp_path)
+    for url in urls:
+        d.download_and_unpack(url, quiet=True)
+    assert len(http_server.requests) == 4
+    assert http_server.connections == 1
+
+
+def test_download_retry_on_server_error(tmp_path, http_server):
+    data = os.urandom(1000)
+    url = http_server.add("model.zip", data)
+    http_server.fail_with = [503, 500]
+    session = create_session(retry=2, backoff_factor=0)
+    download(url, tmp_path / "model.zip", quiet=True, session=session)
+    assert (tmp_path / "model.zip").read_bytes() == data
+    assert len(http_server.requests) == 3
+
+
+def test_create_session_timeout():
+    import requests
+
+    # Accept the connection, but never respond
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        port = server.getsockname()[1]
+        session = create_session(retry=0, timeout=0.1)
+        with pytest.raises(requests.exceptions.ConnectionError, match="timed out"):
+            session.get(f"http://127.0.0.1:{port}/model.zip")
+
+
+@pytest.fixture
+def table_server(tmp_path, http_server, monkeypatch):
+    url = http_server.add("table.csv", b"name,url\na,http://a\n")
+    monkeypatch.setattr(downloader, "MODELS_URL", url)
+    d = ModelDownloader(tmp_path)
+    d.csv = tmp_path / "table.csv"
+    return d
+
+
+def test_update_model_table_conditional(table_server, http_server):
+    d = table_server
+    assert d.update_model_table()
+    assert d.query() == ["a"]
+    assert "If-None-Match" not in http_server.requests[-1][2]
+
+    # Not modified
+    mtime = d.csv.stat().st_mtime_ns
+    assert not d.update_model_table()
+    assert http_server.requests[-1][2]["If-None-Match"] is not None
+    assert d.csv.stat().st_mtime_ns == mtime
+
+    http_server.files["table.csv"] = b"name,url\na,http://a\nb,http://b\n"
+    assert d.update_model_table()
+    assert d.query() == ["a", "b"]
+    assert d.update_model_table(force=True)
+    assert "If-None-Match" not in http_server.requests[-1][2]
+
+
+def test_refresh_model_table_if_expired(table_server, http_server):
+    d = table_server
+    d.update_model_table()
+    d.table_ttl = 3600
+    d._refresh_model_table_if_expired()
+    assert len(http_server.requests) == 1
+
+    d.table_ttl = 0
+    d._refresh_model_table_if_expired()
+    assert len(http_server.requests) == 2
+
+    d.offline = True
+    d._refresh_model_table_if_expired()
+    assert len(http_server.requests) == 2
+
+
+def test_refresh_model_table_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "MODELS_URL", "http://127.0.0.1:1/table.csv")
+    d = ModelDownloader(tmp_path, session=create_session(retry=0))
+    d.csv = tmp_path / "table.csv"
+    d.csv.write_text("name,url\na,http://a\n")
+    d.table_ttl = 0
+    with pytest.warns(UserWarning, match="Failed to refresh"):
+        d._refresh_model_table_if_expired()
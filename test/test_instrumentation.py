@@ -0,0 +1,108 @@
+import json
+
+from conftest import make_model_zip
+import pytest
+
+from espnet_model_zoo.downloader import ModelDownloader
+from espnet_model_zoo.instrumentation import Instrumentation
+from espnet_model_zoo.instrumentation import JsonLinesRecorder
+from espnet_model_zoo.instrumentation import PrometheusExporter
+
+
+def _phase_ends(events):
+    return [e for e in events if e["event"] == "phase_end"]
+
+
+def test_download_and_unpack_events(tmp_path, http_server):
+    data = make_model_zip()
+    url = http_server.add("model.zip", data)
+    events = []
+    d = ModelDownloader(tmp_path, hooks=[events.append])
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        d.download_and_unpack(url, quiet=True)
+
+    assert [e["phase"] for e in _phase_ends(events)] == [
+        "get_url",
+        "remote_info",
+        "transfer",
+        "verify",
+        "evict",
+        "unpack",
+        "evict",
+    ]
+    cache = [(e["kind"], e["hit"]) for e in events if e["event"] == "cache"]
+    assert cache == [("unpacked", False), ("file", False)]
+    assert len([e for e in events if e["event"] == "lock_wait"]) == 2
+
+    (transfer,) = [e for e in _phase_ends(events) if e["phase"] == "transfer"]
+    assert transfer["url"] == url
+    assert transfer["bytes"] == len(data)
+    assert transfer["throughput"] > 0
+    assert transfer["duration"] >= 0
+
+    # Warm cache
+    events.clear()
+    d.download_and_unpack(url, quiet=True)
+    assert [e["phase"] for e in _phase_ends(events)] == ["get_url"]
+    cache = [(e["kind"], e["hit"]) for e in events if e["event"] == "cache"]
+    assert cache == [("unpacked", True)]
+
+
+def test_phase_error():
+    events = []
+    instrumentation = Instrumentation([events.append])
+    with pytest.raises(ValueError):
+        with instrumentation.phase("unpack", url="a"):
+            raise ValueError("broken")
+    assert [e["event"] for e in events] == ["phase_start", "phase_end"]
+    assert events[1]["error"] == "ValueError: broken"
+    assert events[1]["url"] == "a"
+
+
+def test_hook_failure_is_ignored():
+    def hook(event):
+        raise RuntimeError("hook")
+
+    events = []
+    instrumentation = Instrumentation([hook, events.append])
+    with pytest.warns(UserWarning, match="hook"):
+        instrumentation.emit("cache", kind="file", hit=True)
+    assert len(events) == 1
+
+
+def test_json_lines_recorder(tmp_path):
+    with JsonLinesRecorder(tmp_path / "events.jsonl") as recorder:
+        instrumentation = Instrumentation([recorder])
+        with instrumentation.phase("transfer", url="a") as phase:
+            phase["bytes"] = 10
+    with open(tmp_path / "events.jsonl") as f:
+        events = [json.loads(line) for line in f]
+    assert [e["event"] for e in events] == ["phase_start", "phase_end"]
+    assert events[1]["bytes"] == 10
+
+
+def test_prometheus_exporter():
+    import requests
+
+    exporter = PrometheusExporter()
+    instrumentation = Instrumentation([exporter])
+    for _ in range(2):
+        with instrumentation.phase("transfer", url="a") as phase:
+            phase["bytes"] = 10
+    instrumentation.emit("cache", kind="file", hit=False, url="a")
+    instrumentation.emit("lock_wait", path="a.lock", duration=0.5)
+
+    server = exporter.serve()
+    try:
+        r = requests.get(f"http://127.0.0.1:{server.server_address[1]}/metrics")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert r.status_code == 200
+    assert r.text == exporter.render()
+    lines = r.text.splitlines()
+    assert "# TYPE espnet_model_zoo_phase_total counter" in lines
+    assert 'espnet_model_zoo_phase_total{phase="transfer"} 2' in lines
+    assert 'espnet_model_zoo_bytes_total{phase="transfer"} 20' in lines
+    assert 'espnet_model_zoo_cache_requests_total{kind="file",result="miss"} 1' in lines
+    assert "espnet_model_zoo_lock_wait_seconds_total 0.5" in lines
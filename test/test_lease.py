@@ -0,0 +1,188 @@
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from conftest import make_model_zip
+import pytest
+
+from espnet_model_zoo.cache import CacheManager
+from espnet_model_zoo.cache import read_metadata
+from espnet_model_zoo.cache import write_metadata
+from espnet_model_zoo.downloader import ModelDownloader
+from espnet_model_zoo.downloader import str_to_hash
+from espnet_model_zoo.lease import acquire_or_wait
+from espnet_model_zoo.lease import Lease
+from espnet_model_zoo.lease import LeaseLost
+from espnet_model_zoo.lease import LeaseTimeout
+from espnet_model_zoo.lease import read_lease
+
+
+def _dead_pid() -> int:
+    p = subprocess.Popen([sys.executable, "-c", "pass"])
+    p.wait()
+    return p.pid
+
+
+def _write_lease(target, **kwargs):
+    lease = dict(
+        token="other",
+        pid=1,
+        host="other-host",
+        expires_at=time.time() + 60,
+        progress=None,
+    )
+    lease.update(kwargs)
+    with open(str(target) + ".lease", "w") as f:
+        json.dump(lease, f)
+
+
+def test_acquire_and_release(tmp_path):
+    target = tmp_path / "model.zip"
+    with Lease(target, progress=lambda: 10) as lease:
+        assert lease.try_acquire()
+        holder = read_lease(str(target) + ".lease")
+        assert holder["token"] == lease.token
+        assert holder["host"] == socket.gethostname()
+        assert holder["progress"] == 10
+        assert not Lease(target).try_acquire()
+    assert read_lease(str(target) + ".lease") is None
+    assert Lease(target).try_acquire()
+
+
+@pytest.mark.parametrize(
+    "holder",
+    [
+        # The process doesn't exist on this host
+        dict(pid=None, host=socket.gethostname()),
+        # Not renewed until the expiry
+        dict(expires_at=0),
+    ],
+)
+def test_take_over_stale_lease(tmp_path, holder):
+    target = tmp_path / "model.zip"
+    if holder.get("pid", 1) is None:
+        holder["pid"] = _dead_pid()
+    _write_lease(target, **holder)
+    lease = Lease(target)
+    assert lease.try_acquire()
+    lease.release()
+
+
+def test_renew(tmp_path):
+    target = tmp_path / "model.zip"
+    lease = Lease(target, ttl=0.3)
+    assert lease.try_acquire()
+    expires_at = read_lease(lease.path)["expires_at"]
+    time.sleep(0.5)
+    assert read_lease(lease.path)["expires_at"] > expires_at
+    assert not Lease(target).try_acquire()
+
+    # Taken over by another process
+    _write_lease(target, expires_at=time.time() + 60)
+    time.sleep(0.3)
+    with pytest.raises(LeaseLost):
+        lease.check()
+    lease.release()
+    assert read_lease(lease.path)["token"] == "other"
+
+
+def test_wait_for_holder(tmp_path):
+    target = tmp_path / "model.zip"
+    holder = Lease(target)
+    assert holder.try_acquire()
+
+    def _fetch():
+        time.sleep(0.2)
+        target.write_bytes(b"a")
+        holder.release()
+
+    thread = threading.Thread(target=_fetch)
+    thread.start()
+    lease, result = acquire_or_wait(
+        target, lambda: str(target) if target.exists() else None, timeout=10
+    )
+    thread.join()
+    assert lease is None
+    assert result == str(target)
+
+
+def test_wait_timeout(tmp_path):
+    target = tmp_path / "model.zip"
+    _write_lease(target, progress=dict(bytes=10, size=100))
+    with pytest.raises(LeaseTimeout) as e:
+        acquire_or_wait(target, lambda: None, timeout=0.1)
+    assert e.value.holder["progress"] == dict(bytes=10, size=100)
+
+
+def test_remove_leased_entry(tmp_path):
+    outdir = tmp_path / ("a" * 32)
+    outdir.mkdir()
+    (outdir / "model.zip").write_bytes(b"a")
+    _write_lease(outdir / "model.zip")
+    cache = CacheManager(tmp_path)
+    assert not cache.remove(outdir, timeout=0.2)
+    assert (outdir / "model.zip").exists()
+
+    _write_lease(outdir / "model.zip", expires_at=0)
+    assert cache.remove(outdir)
+    assert not outdir.exists()
+
+
+def test_unpack_local_file_waits_for_lease(tmp_path):
+    model = tmp_path / "model.zip"
+    model.write_bytes(make_model_zip())
+    d = ModelDownloader(tmp_path / "cache", lock_timeout=0.2)
+    outdir = d.cachedir / str_to_hash(model)
+    outdir.mkdir(parents=True)
+    _write_lease(outdir / "meta.yaml")
+    with pytest.warns(UserWarning, match="Expanding a local model"):
+        with pytest.raises(LeaseTimeout):
+            d.unpack_local_file(str(model))
+
+        _write_lease(outdir / "meta.yaml", expires_at=0)
+        info = d.unpack_local_file(str(model))
+        assert d.unpack_local_file(str(model)) == info
+    assert (outdir / "meta.yaml").exists()
+    assert not (outdir / "meta.yaml.lease").exists()
+
+
+def test_concurrent_download_and_unpack(tmp_path, http_server):
+    url = http_server.add("model.zip", make_model_zip(1 << 20))
+    downloaders = [ModelDownloader(tmp_path) for _ in range(4)]
+    results = [None] * len(downloaders)
+
+    def _run(i):
+        results[i] = downloaders[i].download_and_unpack(url, quiet=True)
+
+    threads = [threading.Thread(target=_run, args=(i,)) for i in range(4)]
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert all(r == results[0] for r in results)
+    assert [r[0] for r in http_server.requests].count("GET") == 1
+    assert list(tmp_path.glob("*/*.lease")) == []
+
+
+def test_wait_for_verification(tmp_path, http_server):
+    url = http_server.add("model.zip", make_model_zip())
+    d = ModelDownloader(tmp_path, lock_timeout=0.2)
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        path = d.download(url, quiet=True)
+    outdir = tmp_path / str_to_hash(url)
+    digests = read_metadata(outdir)["digests"]
+
+    # The holder has written the file but not verified it yet
+    write_metadata(outdir, digests=None)
+    _write_lease(outdir / "model.zip")
+    with pytest.raises(LeaseTimeout):
+        d.download(url, quiet=True)
+
+    write_metadata(outdir, digests=digests)
+    http_server.requests.clear()
+    assert d.download(url, quiet=True) == path
+    assert http_server.requests == []
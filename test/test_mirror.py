@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+
+from conftest import FileServer
+from conftest import make_model_zip
+import pytest
+
+from espnet_model_zoo.downloader import ModelDownloader
+from espnet_model_zoo.mirror import get_host
+from espnet_model_zoo.mirror import get_mirror_urls
+from espnet_model_zoo.mirror import HostStats
+from espnet_model_zoo.mirror import race
+from espnet_model_zoo.mirror import read_mirrors_config
+from espnet_model_zoo.session import create_session
+
+
+@pytest.fixture
+def mirror_server():
+    server = FileServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _prefix(server: FileServer) -> str:
+    return server.url("")
+
+
+def test_get_mirror_urls():
+    config = {"https://a/": ["https://b/x/", "https://c/"], "https://d/": ["x"]}
+    assert get_mirror_urls("https://a/m.zip", config, ["https://c/m.zip"]) == [
+        "https://a/m.zip",
+        "https://b/x/m.zip",
+        "https://c/m.zip",
+    ]
+    assert get_mirror_urls("https://e/m.zip", config) == ["https://e/m.zip"]
+
+
+def test_read_mirrors_config(tmp_path):
+    (tmp_path / "mirrors.yaml").write_text("https://a/: https://b/\n")
+    assert read_mirrors_config(tmp_path / "mirrors.yaml") == {
+        "https://a/": ["https://b/"]
+    }
+
+
+def test_host_stats_rank(tmp_path):
+    stats = HostStats(tmp_path)
+    urls = ["http://a/m", "http://b/m", "http://c/m", "http://d/m"]
+    stats.record_transfer("http://b/m", 100, 1.0)
+    stats.record_transfer("http://c/m", 1000, 1.0)
+    stats.record_failure("http://a/m")
+    assert stats.rank(urls) == ["http://c/m", "http://b/m", "http://d/m", "http://a/m"]
+
+    # Persisted in the cache directory
+    assert HostStats(tmp_path).get("c")["throughput"] == 1000
+    stats.record_transfer("http://c/m", 2000, 1.0)
+    assert 1000 < HostStats(tmp_path).get("c")["throughput"] < 2000
+
+
+def test_race(http_server, mirror_server):
+    http_server.delay = 0.5
+    slow = http_server.add("m.zip", b"a")
+    fast = mirror_server.add("m.zip", b"a")
+    not_found = mirror_server.url("not_found.zip")
+    t = time.perf_counter()
+    results = race(create_session(), [slow, not_found, fast], grace=0.1)
+    assert time.perf_counter() - t < 0.5
+    assert [u for u, _ in results] == [fast, slow]
+    assert results[0][1].status_code == 200
+    assert results[1][1] is None
+
+
+def test_download_from_fastest_mirror(tmp_path, http_server, mirror_server):
+    data = make_model_zip()
+    url = http_server.add("model.zip", data)
+    mirror_server.add("model.zip", data)
+    http_server.delay = 0.5
+
+    d = ModelDownloader(
+        tmp_path, mirrors={_prefix(http_server): [_prefix(mirror_server)]}
+    )
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        path = d.download(url, quiet=True)
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert [r[0] for r in http_server.requests] == ["HEAD"]
+    assert [r[0] for r in mirror_server.requests] == ["HEAD", "GET"]
+    host = get_host(mirror_server.url(""))
+    assert d.host_stats.get(host)["throughput"] > 0
+
+    # Fall back to the origin
+    os.remove(path)
+    http_server.delay = 0
+    mirror_server.fail_with = [404]
+    with pytest.warns(UserWarning, match="Failed to download"):
+        d.download(url, quiet=True)
+    assert [r[0] for r in http_server.requests] == ["HEAD", "GET"]
+    assert d.host_stats.get(host)["last_failure"] is not None
@@ -0,0 +1,173 @@
+import threading
+import time
+
+from conftest import make_model_zip
+import pytest
+
+from espnet_model_zoo.downloader import ModelDownloader
+from espnet_model_zoo.model_cache import estimate_memory
+from espnet_model_zoo.model_cache import ModelCache
+
+
+class FakeModel:
+    def __init__(self, asr_model_file, asr_train_config, device="cpu"):
+        self.asr_model_file = asr_model_file
+        self.asr_train_config = asr_train_config
+        self.device = device
+
+
+def test_lru_by_count():
+    cache = ModelCache(max_models=2)
+    for key in ["a", "b", "a", "c"]:
+        cache.get_or_load(key, lambda: object(), lambda _: 0)
+    assert "a" in cache and "c" in cache and "b" not in cache
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 3, 1)
+
+
+def test_lru_by_memory():
+    cache = ModelCache(max_memory="1K")
+    cache.get_or_load("a", lambda: "a", lambda _: 600)
+    cache.get_or_load("b", lambda: "b", lambda _: 300)
+    assert len(cache) == 2 and cache.memory == 900
+    cache.get_or_load("c", lambda: "c", lambda _: 300)
+    assert "a" not in cache and cache.memory == 600
+
+    # The latest one is kept alone
+    cache.get_or_load("d", lambda: "d", lambda _: 2000)
+    assert len(cache) == 1 and "d" in cache
+
+
+def test_pinned_not_evicted():
+    cache = ModelCache(max_models=1)
+    cache.get_or_load("a", lambda: "a", lambda _: 0, pin=True)
+    cache.get_or_load("b", lambda: "b", lambda _: 0)
+    cache.get_or_load("c", lambda: "c", lambda _: 0)
+    assert "a" in cache and "b" not in cache and "c" in cache
+    assert cache.stats()["num_pinned"] == 1
+
+    cache.unpin("a")
+    cache.get_or_load("d", lambda: "d", lambda _: 0)
+    assert list(cache._entries) == ["d"]
+
+
+def test_single_loading():
+    cache = ModelCache()
+    calls = []
+
+    def _load():
+        calls.append(1)
+        time.sleep(0.2)
+        return object()
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_load("a", _load)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_loading_failure_not_cached():
+    cache = ModelCache()
+
+    def _load():
+        raise RuntimeError("broken")
+
+    with pytest.raises(RuntimeError, match="broken"):
+        cache.get_or_load("a", _load)
+    assert "a" not in cache
+    assert cache.get_or_load("a", lambda: 1, lambda _: 0) == 1
+
+
+def test_estimate_memory():
+    torch = pytest.importorskip("torch")
+
+    class _Model:
+        def __init__(self):
+            self.asr_model = torch.nn.Linear(10, 10)
+            self.shared = self.asr_model
+            self.asr_model.register_buffer("b", torch.zeros(5))
+
+    assert estimate_memory(_Model()) == (100 + 10 + 5) * 4
+    assert estimate_memory(object()) == 0
+
+
+def test_load_model(tmp_path, http_server):
+    url = http_server.add("model.zip", make_model_zip(1000))
+    d = ModelDownloader(tmp_path)
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        model = d.load_model(url, model_class=FakeModel, quiet=True)
+    assert model.asr_model_file.endswith("model.pth")
+    assert d.load_model(url, model_class=FakeModel) is model
+    # The size of the weight files
+    assert d.model_cache.memory == 1000
+
+    other = d.load_model(url, model_class=FakeModel, model_kwargs=dict(device="cuda"))
+    assert other is not model and other.device == "cuda"
+    assert d.model_cache.stats()["misses"] == 2
+
+    # Shared by the downloaders
+    d2 = ModelDownloader(tmp_path, model_cache=d.model_cache)
+    assert d2.load_model(url, model_class=FakeModel) is model
+
+
+def test_load_model_hit_without_download(tmp_path, http_server, monkeypatch, request):
+    url = http_server.add("model.zip", make_model_zip())
+    d = ModelDownloader(tmp_path)
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        model = d.load_model(url, model_class=FakeModel, quiet=True)
+
+    def _download_and_unpack(*args, **kwargs):
+        raise AssertionError("Downloaded again")
+
+    monkeypatch.setattr(d, "download_and_unpack", _download_and_unpack)
+    request.getfixturevalue("no_socket")
+    assert d.load_model(url, model_class=FakeModel) is model
+
+
+def test_load_model_not_evicted_while_loading(tmp_path, http_server):
+    url = http_server.add("model.zip", make_model_zip())
+    d = ModelDownloader(tmp_path)
+
+    class _Model(FakeModel):
+        def __init__(self, asr_model_file, asr_train_config):
+            # Pruned by another process while loading
+            assert ModelDownloader(tmp_path).cache.prune(max_size=0) == []
+            with open(asr_model_file, "rb") as f:
+                f.read()
+            super().__init__(asr_model_file, asr_train_config)
+
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        d.load_model(url, model_class=_Model, quiet=True)
+    assert len(d.cache.prune(max_size=0)) == 1
+
+
+def test_load_model_unknown_task(tmp_path, http_server):
+    url = http_server.add("model.zip", make_model_zip())
+    d = ModelDownloader(tmp_path)
+    with pytest.raises(RuntimeError, match="task of the model is unknown"):
+        d.load_model(url)
+    with pytest.raises(ValueError, match="task must be one of"):
+        d.load_model(url, task="foo")
+
+
+def test_load_model_with_task(tmp_path, monkeypatch):
+    calls = []
+    files = dict(asr_model_file=str(tmp_path / "model.pth"), asr_train_config="c")
+
+    def _download_and_unpack(name=None, version=-1, quiet=False, **kwargs):
+        calls.append(kwargs)
+        return files
+
+    (tmp_path / "model.pth").write_bytes(b"0")
+    d = ModelDownloader(tmp_path)
+    monkeypatch.setattr(d, "download_and_unpack", _download_and_unpack)
+    # "jsut" has both asr and tts models
+    d.load_model(task="asr", corpus="jsut", model_class=FakeModel)
+    assert calls[-1] == dict(corpus="jsut", task="asr")
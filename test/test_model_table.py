@@ -0,0 +1,171 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from espnet_model_zoo import model_table
+from espnet_model_zoo.model_table import All
+from espnet_model_zoo.model_table import get_snapshot_path
+from espnet_model_zoo.model_table import In
+from espnet_model_zoo.model_table import load_model_table
+from espnet_model_zoo.model_table import ModelTable
+from espnet_model_zoo.model_table import parse_condition
+from espnet_model_zoo.model_table import parse_query
+from espnet_model_zoo.model_table import Prefix
+from espnet_model_zoo.model_table import Range
+from espnet_model_zoo.model_table import read_snapshot
+from espnet_model_zoo.model_table import Regex
+
+CSV = Path(__file__).parent.parent / "espnet_model_zoo" / "table.csv"
+
+
+@pytest.mark.parametrize(
+    "conditions",
+    [
+        {},
+        {"task": "asr"},
+        {"task": "asr", "lang": "en"},
+        {"task": "tts", "fs": "22050", "lang": "ja"},
+        {"task": "dummy"},
+        {"name": "test"},
+    ],
+)
+def test_select_same_as_pandas(conditions):
+    table = ModelTable.from_csv(CSV)
+    df = pd.read_csv(CSV, dtype=str)
+    for k, v in conditions.items():
+        df = df[df[k] == v]
+    assert table.column("name", table.select(**conditions)) == list(df["name"])
+
+
+def test_select_many_same_as_pandas():
+    table = ModelTable.from_csv(CSV)
+    df = pd.read_csv(CSV, dtype=str)
+    fs = pd.to_numeric(df["fs"])
+    expected = [
+        df[df["task"].isin(["asr", "asr_stream"]) & (fs <= 16000)],
+        df[(fs > 16000) & (fs < 44100)],
+        df[df["name"].str.startswith("kan-bayashi/ljspeech")],
+        df[df["name"].str.contains("conformer") & (df["lang"] == "en")],
+        df[(df["task"] == "enh") | (df["lang"] == "ja")],
+        df[df["gender"].isna()],
+        df,
+        df[[False] * len(df)],
+    ]
+    results = table.select_many(
+        [
+            {"task": ["asr", "asr_stream"], "fs": Range(high=16000)},
+            {"fs": Range(16000, 44100, low_inclusive=False, high_inclusive=False)},
+            {"name": Prefix("kan-bayashi/ljspeech")},
+            {"name": Regex("conformer"), "lang": "en"},
+            [{"task": "enh"}, {"lang": "ja"}],
+            {"gender": None},
+            {},
+            [],
+        ]
+    )
+    assert [table.column("name", rows) for rows in results] == [
+        list(e["name"]) for e in expected
+    ]
+
+
+def test_select_many_numbers():
+    table = ModelTable(["fs"], [["8000"], ["16k"], [None], ["16000.0"], ["16000"]])
+    assert table.select_many([{"fs": Range(low=10000)}, {"fs": 16000}]) == [
+        [3, 4],
+        [4],
+    ]
+    assert table.select_many([{"fs": All((Range(low=8000), Range(high=8000)))}]) == [
+        [0]
+    ]
+
+
+@pytest.mark.parametrize(
+    "condition, expected",
+    [
+        ("fs=16000", ("fs", In(("16000",)))),
+        ("lang=en,ja", ("lang", In(("en", "ja")))),
+        ("gender=", ("gender", In((None,)))),
+        ("url=http://a?b=c", ("url", In(("http://a?b=c",)))),
+        ("fs>=16000", ("fs", Range(low=16000))),
+        ("fs>16000", ("fs", Range(low=16000, low_inclusive=False))),
+        ("fs<=16000", ("fs", Range(high=16000))),
+        ("fs<16000", ("fs", Range(high=16000, high_inclusive=False))),
+        ("name^=kan-bayashi/", ("name", Prefix("kan-bayashi/"))),
+        ("name~=a=b", ("name", Regex("a=b"))),
+    ],
+)
+def test_parse_condition(condition, expected):
+    assert parse_condition(condition) == expected
+
+
+@pytest.mark.parametrize("condition", ["fs", "=16000", "fs>=abc", "name~=conformer("])
+def test_parse_invalid_condition(condition):
+    with pytest.raises(ValueError, match="Invalid condition"):
+        parse_condition(condition)
+
+
+def test_parse_query():
+    assert parse_query(["fs>=8000", "fs<=16000", "or", "lang=en", "or"]) == [
+        {"fs": All((Range(low=8000), Range(high=16000)))},
+        {"lang": In(("en",))},
+    ]
+    assert parse_query([]) == [{}]
+
+
+def test_select_invalid_key():
+    table = ModelTable.from_csv(CSV)
+    with pytest.raises(KeyError):
+        table.select(dummy="a")
+    with pytest.raises(KeyError):
+        table.select_many([{"dummy": Range(low=1)}])
+
+
+def test_empty_field_is_none():
+    table = ModelTable(["a", "b"], [["x", None], ["y", "z"]])
+    assert table.records(["a", "b"]) == [("x", None), ("y", "z")]
+    assert table.select(b=None) == [0]
+
+
+def test_load_model_table_shared(tmp_path):
+    csv = tmp_path / "table.csv"
+    csv.write_text("name,url\na,http://a\n")
+    table = load_model_table(csv)
+    assert load_model_table(csv) is table
+
+    csv.write_text("name,url\na,http://a\nb,http://b\n")
+    os.utime(csv, ns=(0, 0))
+    table2 = load_model_table(csv)
+    assert table2 is not table
+    assert table2.column("name") == ["a", "b"]
+
+
+def test_load_model_table_from_snapshot(tmp_path, monkeypatch):
+    csv = tmp_path / "table.csv"
+    csv.write_text("name,url\na,http://a\n")
+    table = load_model_table(csv)
+    assert get_snapshot_path(csv).exists()
+
+    # Another process loads the snapshot without parsing the csv file
+    monkeypatch.setattr(model_table, "_table_cache", {})
+    with monkeypatch.context() as m:
+        m.setattr(ModelTable, "from_csv", None)
+        table2 = load_model_table(csv)
+    assert table2 is not table
+    assert table2.records(["name", "url"]) == table.records(["name", "url"])
+
+    # The snapshot of the old file isn't used
+    monkeypatch.setattr(model_table, "_table_cache", {})
+    csv.write_text("name,url\nb,http://b\n")
+    os.utime(csv, ns=(0, 0))
+    assert load_model_table(csv).column("name") == ["b"]
+    assert read_snapshot(csv).column("name") == ["b"]
+
+
+def test_read_broken_snapshot(tmp_path):
+    csv = tmp_path / "table.csv"
+    csv.write_text("name,url\na,http://a\n")
+    assert read_snapshot(csv) is None
+    get_snapshot_path(csv).write_bytes(b"broken")
+    assert read_snapshot(csv) is None
@@ -0,0 +1,176 @@
+import hashlib
+from pathlib import Path
+
+from conftest import make_model_zip
+import pytest
+import requests
+
+from espnet_model_zoo.downloader import ModelDownloader
+from espnet_model_zoo.downloader import str_to_hash
+from espnet_model_zoo.peer import parse_peers
+from espnet_model_zoo.peer import serve_cache
+
+
+@pytest.fixture
+def peer(tmp_path, http_server):
+    """A host having the model in its cache"""
+    http_server.add("model.zip", make_model_zip())
+    d = ModelDownloader(tmp_path / "peer")
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        d.download(http_server.url("model.zip"), quiet=True)
+    http_server.requests.clear()
+
+    server = serve_cache(d.cachedir)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_from_peer(tmp_path, http_server, peer):
+    url = http_server.url("model.zip")
+    d = ModelDownloader(
+        tmp_path / "cache",
+        peers=["http://127.0.0.1:1", peer],
+        trust_peer_digests=True,
+    )
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        path = d.download(url, quiet=True)
+    assert Path(path).read_bytes() == http_server.files["model.zip"]
+    # The file isn't downloaded from the origin
+    assert [r[0] for r in http_server.requests] == ["HEAD"]
+    http_server.requests.clear()
+    assert d.verify(url)
+
+    info = d.download_and_unpack(url, quiet=True)
+    assert Path(info["asr_model_file"]).exists()
+    assert http_server.requests == []
+
+
+def _write_manifest(path: Path, data: bytes, name: str = "model.zip") -> Path:
+    path.write_text(f"{hashlib.sha256(data).hexdigest()}  {name}\n")
+    return path
+
+
+def test_download_from_peer_with_manifest(tmp_path, http_server, peer):
+    url = http_server.url("model.zip")
+    manifest = _write_manifest(tmp_path / "SHA256SUMS", http_server.files["model.zip"])
+    d = ModelDownloader(tmp_path / "cache", peers=[peer], checksum_manifest=manifest)
+    path = d.download(url, quiet=True)
+    assert Path(path).read_bytes() == http_server.files["model.zip"]
+    assert [r[0] for r in http_server.requests] == ["HEAD"]
+
+
+def test_download_from_peer_with_content_md5(tmp_path, http_server, peer):
+    url = http_server.url("model.zip")
+    data = http_server.files["model.zip"]
+    http_server.checksums["model.zip"] = hashlib.md5(data).hexdigest()
+    d = ModelDownloader(tmp_path / "cache", peers=[peer])
+    path = d.download(url, quiet=True)
+    assert Path(path).read_bytes() == data
+    assert [r[0] for r in http_server.requests] == ["HEAD"]
+
+
+def test_download_from_peer_with_wrong_content_md5(tmp_path, http_server, peer):
+    # The file of the peer must not be accepted without the checksum of the origin
+    url = http_server.url("model.zip")
+    http_server.checksums["model.zip"] = hashlib.md5(b"").hexdigest()
+    d = ModelDownloader(tmp_path / "cache", peers=[peer], trust_peer_digests=True)
+    with pytest.warns(UserWarning, match="Checksum mismatch"):
+        with pytest.raises(RuntimeError, match="Failed to download file"):
+            d.download(url, quiet=True)
+    assert [r[0] for r in http_server.requests] == ["HEAD", "GET"]
+
+
+def test_download_from_peer_origin_unreachable(tmp_path, http_server, peer):
+    url = http_server.url("model.zip")
+    data = http_server.files["model.zip"]
+    d = ModelDownloader(tmp_path / "cache", peers=[peer], trust_peer_digests=True)
+    d.session.mount("http://", requests.adapters.HTTPAdapter(max_retries=0))
+    http_server.shutdown()
+    http_server.server_close()
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        path = d.download(url, quiet=True)
+    assert Path(path).read_bytes() == data
+
+
+def test_peer_digests_not_trusted(tmp_path, http_server, peer):
+    url = http_server.url("model.zip")
+    d = ModelDownloader(tmp_path / "cache", peers=[peer])
+    with pytest.warns(UserWarning, match="without the digests in the catalog"):
+        path = d.download(url, quiet=True)
+    # Downloaded from the origin
+    assert Path(path).read_bytes() == http_server.files["model.zip"]
+    assert [r[0] for r in http_server.requests] == ["HEAD", "GET"]
+
+
+@pytest.mark.parametrize("trust_peer_digests", [True, False])
+def test_download_from_corrupted_peer(tmp_path, http_server, peer, trust_peer_digests):
+    url = http_server.url("model.zip")
+    cached = tmp_path / "peer" / str_to_hash(url) / "model.zip"
+    cached.write_bytes(b"x" * cached.stat().st_size)
+    if trust_peer_digests:
+        manifest = None
+    else:
+        data = http_server.files["model.zip"]
+        manifest = _write_manifest(tmp_path / "SHA256SUMS", data)
+
+    d = ModelDownloader(
+        tmp_path / "cache",
+        peers=[peer],
+        checksum_manifest=manifest,
+        trust_peer_digests=trust_peer_digests,
+    )
+    with pytest.warns(UserWarning, match="Checksum mismatch"):
+        path = d.download(url, quiet=True)
+    # Fall back to the origin
+    assert Path(path).read_bytes() == http_server.files["model.zip"]
+    assert [r[0] for r in http_server.requests] == ["HEAD", "GET"]
+
+
+def test_download_peer_not_having_model(tmp_path, http_server, peer):
+    url = http_server.add("model2.zip", make_model_zip())
+    d = ModelDownloader(tmp_path / "cache", peers=[peer], trust_peer_digests=True)
+    with pytest.warns(UserWarning, match="Not validating checksum"):
+        path = d.download(url, quiet=True)
+    assert Path(path).read_bytes() == http_server.files["model2.zip"]
+
+
+def test_peers_by_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("ESPNET_MODEL_ZOO_PEERS", "http://a:8000, http://b:8000")
+    assert ModelDownloader(tmp_path).peers == ["http://a:8000", "http://b:8000"]
+    assert parse_peers("") == []
+
+
+def test_serve_cache_private_files(tmp_path, http_server, peer):
+    key = str_to_hash(http_server.url("model.zip"))
+    (tmp_path / "peer" / key / "model.zip.part").write_bytes(b"a")
+    assert requests.get(f"{peer}/{key}/metadata.json").status_code == 200
+    for path in [
+        "",
+        key,
+        f"{key}/",
+        f"{key}/model.zip.lock",
+        f"{key}/model.zip.part",
+        f"{key}/%2E%2E/{key}/model.zip",
+        f"{key}/not_existing",
+    ]:
+        assert requests.get(f"{peer}/{path}").status_code == 404, path
+
+
+def test_serve_cache_symlinks(tmp_path):
+    secret = tmp_path / "secret.zip"
+    secret.write_bytes(b"a")
+    key = str_to_hash("a")
+    (tmp_path / "cache" / key).mkdir(parents=True)
+    (tmp_path / "cache" / key / "secret.zip").symlink_to(secret)
+    (tmp_path / "cache" / str_to_hash("b")).symlink_to(tmp_path)
+
+    server = serve_cache(tmp_path / "cache")
+    peer = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        assert requests.get(f"{peer}/{key}/secret.zip").status_code == 404
+        path = f"{str_to_hash('b')}/secret.zip"
+        assert requests.get(f"{peer}/{path}").status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
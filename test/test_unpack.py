@@ -0,0 +1,151 @@
+import io
+import os
+from pathlib import Path
+import tarfile
+
+from conftest import make_model_tar
+from conftest import make_model_zip
+import pytest
+import yaml
+
+from espnet_model_zoo.unpack import get_path_index
+from espnet_model_zoo.unpack import get_unpacked_files
+from espnet_model_zoo.unpack import rewrite_paths
+from espnet_model_zoo.unpack import TarStreamExtractor
+from espnet_model_zoo.unpack import unpack
+
+
+def _check_unpacked(info: dict, outdir: Path):
+    assert info == {
+        "asr_train_config": str(outdir / "exp" / "config.yaml"),
+        "asr_model_file": str(outdir / "exp" / "model.pth"),
+    }
+    with open(info["asr_train_config"], encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    # The paths in the yaml files are changed to the extracted ones
+    assert config["model"] == str(outdir / "exp" / "model.pth")
+    assert config["token_list"] == ["a", "b"]
+    # No temporary files are left
+    assert sorted(p.name for p in outdir.glob("**/*")) == [
+        "config.yaml",
+        "exp",
+        "meta.yaml",
+        "model.pth",
+    ]
+
+
+@pytest.mark.parametrize(
+    "filename", ["model.zip", "model.tar", "model.tar.gz", "model.tgz"]
+)
+def test_unpack(tmp_path, filename):
+    if filename.endswith(".zip"):
+        data = make_model_zip()
+    else:
+        data = make_model_tar(mode="w" if filename.endswith(".tar") else "w:gz")
+    (tmp_path / filename).write_bytes(data)
+    info = unpack(tmp_path / filename, tmp_path / "out")
+    _check_unpacked(info, tmp_path / "out")
+    assert get_unpacked_files(tmp_path / "out") == info
+
+
+def test_unpack_zip_in_parallel(tmp_path):
+    extra_files = {f"exp/data{i}.bin": os.urandom(1000) for i in range(20)}
+    (tmp_path / "model.zip").write_bytes(make_model_zip(extra_files=extra_files))
+    unpack(tmp_path / "model.zip", tmp_path / "out", max_workers=4)
+    for name, data in extra_files.items():
+        assert (tmp_path / "out" / name).read_bytes() == data
+
+
+def test_unpack_without_meta_yaml(tmp_path):
+    f = io.BytesIO()
+    with tarfile.open(fileobj=f, mode="w") as t:
+        info = tarfile.TarInfo("a.txt")
+        info.size = 1
+        t.addfile(info, io.BytesIO(b"a"))
+    (tmp_path / "model.tar").write_bytes(f.getvalue())
+    with pytest.raises(RuntimeError, match="not found meta.yaml"):
+        unpack(tmp_path / "model.tar", tmp_path / "out")
+
+
+def test_unpack_invalid_path(tmp_path):
+    data = make_model_zip(extra_files={"../evil.txt": b"a"})
+    (tmp_path / "model.zip").write_bytes(data)
+    with pytest.raises(RuntimeError, match="Invalid path"):
+        unpack(tmp_path / "model.zip", tmp_path / "out")
+    assert not (tmp_path / "evil.txt").exists()
+    # meta.yaml isn't published if failed
+    assert get_unpacked_files(tmp_path / "out") is None
+
+
+def test_unpack_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        unpack(tmp_path / "model.rar", tmp_path / "out")
+
+
+def test_get_unpacked_files_missing_file(tmp_path):
+    (tmp_path / "model.zip").write_bytes(make_model_zip())
+    info = unpack(tmp_path / "model.zip", tmp_path / "out")
+    assert get_unpacked_files(tmp_path / "not_existing") is None
+    Path(info["asr_model_file"]).unlink()
+    assert get_unpacked_files(tmp_path / "out") is None
+
+
+def test_tar_stream_extractor(tmp_path):
+    data = make_model_tar(model_size=100000)
+    extractor = TarStreamExtractor(tmp_path, max_chunks=2)
+    for i in range(0, len(data), 1000):
+        extractor.feed(i, data[i : i + 1000])
+    _check_unpacked(extractor.close(len(data)), tmp_path)
+
+
+def test_tar_stream_extractor_not_contiguous(tmp_path):
+    data = make_model_tar(model_size=100000)
+    extractor = TarStreamExtractor(tmp_path)
+    extractor.feed(0, data[:1000])
+    # e.g. The download is restarted
+    extractor.feed(0, data)
+    assert extractor.close(len(data)) is None
+    assert not (tmp_path / "meta.yaml").exists()
+
+
+def test_tar_stream_extractor_incomplete(tmp_path):
+    data = make_model_tar(model_size=100000)
+    extractor = TarStreamExtractor(tmp_path)
+    extractor.feed(0, data[:1000])
+    assert extractor.close(len(data)) is None
+    assert not (tmp_path / "meta.yaml").exists()
+
+
+def test_tar_stream_extractor_invalid_data(tmp_path):
+    extractor = TarStreamExtractor(tmp_path, max_chunks=1)
+    for i in range(10):
+        extractor.feed(i * 1000, os.urandom(1000))
+    assert extractor.close() is None
+
+
+def test_rewrite_paths(tmp_path):
+    from espnet2.main_funcs.pack_funcs import find_path_and_change_it_recursive
+
+    for name in ["exp/a.pth", "exp/b/c.txt", "d.yaml"]:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text("")
+    value = {
+        "a": "exp/a.pth",
+        "b": ["./exp/b/c.txt", "exp/b", "not_existing", 1, None],
+        "c": {"d": ("d.yaml", "/exp/a.pth")},
+    }
+    index = get_path_index(tmp_path)
+    assert sorted(index) == ["d.yaml", "exp", "exp/a.pth", "exp/b", "exp/b/c.txt"]
+
+    expected = value
+    for name in tmp_path.glob("**/*"):
+        name = name.relative_to(tmp_path)
+        expected = find_path_and_change_it_recursive(
+            expected, name, str(tmp_path / name)
+        )
+    assert rewrite_paths(value, index) == expected
+    assert expected["b"][:3] == [
+        str(tmp_path / "exp/b/c.txt"),
+        str(tmp_path / "exp/b"),
+        "not_existing",
+    ]
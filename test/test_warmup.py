@@ -0,0 +1,102 @@
+from conftest import make_model_zip
+import pytest
+
+from espnet_model_zoo.downloader import ModelDownloader
+from espnet_model_zoo.downloader import str_to_hash
+from espnet_model_zoo.model_cache import ModelCache
+from espnet_model_zoo.model_cache import TASK_CLASSES
+from espnet_model_zoo.warmup import dummy_inference
+from espnet_model_zoo.warmup import WarmupPool
+
+
+class FakeModel:
+    def __init__(self, asr_model_file, asr_train_config):
+        self.asr_model_file = asr_model_file
+        self.calls = 0
+
+    def __call__(self, speech):
+        self.calls += 1
+
+
+def _warmup(obj, name):
+    obj(None)
+
+
+def test_warmup(tmp_path, http_server):
+    url = http_server.add("model.zip", make_model_zip())
+    http_server.delay = 0.2
+    d = ModelDownloader(tmp_path)
+    with WarmupPool(d, model_class=FakeModel, warmup=_warmup) as pool:
+        with pytest.warns(UserWarning, match="Not validating checksum"):
+            pool.submit([url])
+            assert not pool.is_ready(url)
+            with pytest.raises(RuntimeError, match="isn't ready"):
+                pool.get(url)
+            assert pool.wait(timeout=30)
+
+        status = pool.status(url)
+        assert status["state"] == "ready"
+        assert status["ready_at"] >= status["loading_at"] >= status["unpacking_at"]
+        model = pool.get(url)
+        assert model.calls == 1
+        assert d.load_model(url, model_class=FakeModel) is model
+
+        # Returned without the downloader
+        d.load_model = None
+        assert pool.get(url) is model
+
+
+def test_warmup_not_submitted(tmp_path):
+    with WarmupPool(ModelDownloader(tmp_path)) as pool:
+        with pytest.raises(ValueError, match="isn't submitted"):
+            pool.wait(["foo"], timeout=1)
+        with pytest.raises(ValueError, match="isn't submitted"):
+            pool.status("foo")
+        with pytest.raises(RuntimeError, match="isn't ready"):
+            pool.get("foo")
+
+
+def test_warmup_more_than_cache(tmp_path, http_server, monkeypatch):
+    # The task is found by the class for the URLs not in table.csv
+    monkeypatch.setitem(TASK_CLASSES, "asr", f"{__name__}:FakeModel")
+    urls = [http_server.add(f"model{i}.zip", make_model_zip()) for i in range(3)]
+    d = ModelDownloader(tmp_path, model_cache=ModelCache(max_models=1))
+    with WarmupPool(d, model_class=FakeModel, warmup=True) as pool:
+        with pytest.warns(UserWarning, match="Not validating checksum"):
+            pool.submit(urls)
+            assert pool.wait(timeout=30), pool.status()
+        assert len(d.model_cache) == 3
+        assert all(pool.get(url).calls == 1 for url in urls)
+    assert d.model_cache.stats()["misses"] == 3
+
+
+def test_warmup_failure(tmp_path, http_server):
+    url = http_server.url("not_found.zip")
+    with WarmupPool(ModelDownloader(tmp_path), model_class=FakeModel) as pool:
+        pool.submit([url])
+        assert not pool.wait(timeout=30)
+        status = pool.status()[url]
+        assert status["state"] == "failed"
+        assert "404" in status["error"]
+
+        # Retried if submitted again
+        http_server.add("not_found.zip", make_model_zip())
+        with pytest.warns(UserWarning, match="Not validating checksum"):
+            pool.submit([url])
+            assert pool.wait([url], timeout=30)
+
+
+def test_warmup_in_processes(tmp_path, http_server):
+    url = http_server.add("model.zip", make_model_zip())
+    d = ModelDownloader(tmp_path, dedupe=True)
+    with WarmupPool(d, max_workers=2, use_processes=True, load=False) as pool:
+        pool.submit([url])
+        assert pool.wait(timeout=60), pool.status(url)
+    assert (tmp_path / str_to_hash(url) / "meta.yaml").exists()
+    # The settings are given to the processes
+    assert len(list((tmp_path / "blobs").rglob("*"))) > 0
+
+
+def test_dummy_inference_unknown_task():
+    with pytest.raises(ValueError, match="No dummy inputs"):
+        dummy_inference(object(), "foo")
@@ -0,0 +1,205 @@
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import hashlib
+import json
+import os
+import threading
+
+import pytest
+
+from espnet_model_zoo import zenodo_upload
+from espnet_model_zoo.session import create_session
+from espnet_model_zoo.zenodo_upload import UploadError
+from espnet_model_zoo.zenodo_upload import Zenodo
+
+
+class ZenodoServer(ThreadingHTTPServer):
+    """Mock of the deposition API of Zenodo"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.files = {}
+        self.metadata = None
+        self.published = False
+        self.requests = []
+        # Respond to the uploads with the given status codes
+        self.fail_with = []
+        # Reply the wrong checksum to the given number of uploads
+        self.corrupt = 0
+        self._lock = threading.Lock()
+
+    def deposition(self) -> dict:
+        return {
+            "id": 1,
+            "links": {
+                "bucket": f"{self.url}/api/files/bucket",
+                "html": f"{self.url}/deposit/1",
+                "latest_html": f"{self.url}/record/1",
+            },
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _dispatch(self):
+        server = self.server
+        path, _, query = self.path.partition("?")
+        body = self._read_body()
+        with server._lock:
+            server.requests.append((self.command, path))
+        if "access_token=token" not in query:
+            return self._reply(403, {"message": "Invalid token"})
+
+        if self.command == "POST" and path == "/api/deposit/depositions":
+            return self._reply(201, server.deposition())
+        elif path == "/api/deposit/depositions/1":
+            if self.command == "PUT":
+                server.metadata = json.loads(body)
+            return self._reply(200, server.deposition())
+        elif path.startswith("/api/files/bucket/"):
+            with server._lock:
+                status = server.fail_with.pop(0) if server.fail_with else None
+                corrupt = server.corrupt > 0
+                server.corrupt -= 1
+            if status is not None:
+                return self._reply(status, {"message": f"Error {status}"})
+            name = path[len("/api/files/bucket/") :]
+            server.files[name] = body
+            md5 = hashlib.md5(body if not corrupt else b"").hexdigest()
+            return self._reply(200, {"key": name, "checksum": f"md5:{md5}"})
+        elif path == "/api/deposit/depositions/1/actions/publish":
+            server.published = True
+            return self._reply(202, server.deposition())
+        return self._reply(404, {"message": "Not found"})
+
+    do_GET = do_POST = do_PUT = _dispatch
+
+
+@pytest.fixture
+def zenodo_server():
+    server = ZenodoServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def zenodo(zenodo_server):
+    zenodo = Zenodo(
+        "token",
+        session=create_session(backoff_factor=0),
+        upload_session=create_session(retry=0, backoff_factor=0),
+    )
+    zenodo.zenodo_url = zenodo_server.url
+    return zenodo
+
+
+def _make_files(tmp_path, sizes):
+    files = []
+    for i, size in enumerate(sizes):
+        p = tmp_path / f"file{i}.zip"
+        p.write_bytes(os.urandom(size))
+        files.append(p)
+    return files
+
+
+def test_upload_files(tmp_path, zenodo, zenodo_server):
+    files = _make_files(tmp_path, [100000, 0, 3000])
+    stats = zenodo.upload_files(1, files, max_workers=3)
+    assert [s["file"] for s in stats] == [str(p) for p in files]
+    assert [s["bytes"] for s in stats] == [100000, 0, 3000]
+    for p in files:
+        assert zenodo_server.files[p.name] == p.read_bytes()
+
+
+def test_upload_file_retry_on_server_error(tmp_path, zenodo, zenodo_server):
+    (p,) = _make_files(tmp_path, [10000])
+    zenodo_server.fail_with = [503]
+    with pytest.warns(UserWarning, match="Error 503"):
+        zenodo.upload_file(1, p)
+    assert zenodo_server.files[p.name] == p.read_bytes()
+    assert zenodo_server.requests.count(("PUT", f"/api/files/bucket/{p.name}")) == 2
+
+
+def test_upload_file_retry_on_checksum_mismatch(tmp_path, zenodo, zenodo_server):
+    (p,) = _make_files(tmp_path, [10000])
+    zenodo_server.corrupt = 1
+    with pytest.warns(UserWarning, match="Checksum mismatch"):
+        zenodo.upload_file(1, p, quiet=False)
+
+    zenodo_server.corrupt = 2
+    with pytest.raises(UploadError, match="Checksum mismatch"), pytest.warns(
+        UserWarning
+    ):
+        zenodo.upload_file(1, p, retry=1)
+
+
+def test_upload_session_not_retried(tmp_path, zenodo_server, monkeypatch):
+    monkeypatch.setattr(zenodo_upload.time, "sleep", lambda _: None)
+    zenodo = Zenodo("token")
+    zenodo.zenodo_url = zenodo_server.url
+    adapter = zenodo.upload_session.get_adapter(zenodo_server.url)
+    assert adapter.max_retries.total == 0
+    assert adapter.timeout == (10.0, None)
+
+    (p,) = _make_files(tmp_path, [10000])
+    zenodo_server.fail_with = [503] * 3
+    with pytest.raises(UploadError, match="Error 503"), pytest.warns(UserWarning):
+        zenodo.upload_file(1, p, retry=2)
+    # Sent once for each trial
+    assert zenodo_server.requests.count(("PUT", f"/api/files/bucket/{p.name}")) == 3
+
+
+def test_upload_file_progress_reset_on_retry(tmp_path, zenodo, zenodo_server, capsys):
+    (p,) = _make_files(tmp_path, [10000])
+    zenodo_server.fail_with = [503]
+    with pytest.warns(UserWarning, match="retried"):
+        zenodo.upload_file(1, p, quiet=False)
+    err = capsys.readouterr().err
+    assert "9.77k/9.77k" in err
+    assert "19.5k" not in err
+
+
+def test_upload_file_client_error_not_retried(tmp_path, zenodo, zenodo_server):
+    (p,) = _make_files(tmp_path, [10000])
+    zenodo_server.fail_with = [400]
+    with pytest.raises(UploadError, match="Error 400"):
+        zenodo.upload_file(1, p)
+    assert len(zenodo_server.requests) == 2
+
+
+def test_upload(tmp_path, zenodo_server, monkeypatch, capsys):
+    class _Zenodo(Zenodo):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.zenodo_url = zenodo_server.url
+
+    monkeypatch.setattr(zenodo_upload, "Zenodo", _Zenodo)
+    files = _make_files(tmp_path, [1000, 2000])
+    zenodo_upload.upload(
+        "token", "title", "creator", files=files, publish=True, max_workers=2
+    )
+    assert sorted(zenodo_server.files) == ["file0.zip", "file1.zip"]
+    assert zenodo_server.metadata["metadata"]["title"] == "title"
+    assert zenodo_server.published
+    assert "Successfully published" in capsys.readouterr().out